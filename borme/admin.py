@@ -1,5 +1,7 @@
 from django.contrib import admin
-from borme.models import Anuncio, BormeLog, Borme, Config, Company, Person
+from borme.models import (Anuncio, BormeLog, Borme, BormeStatsDay,
+                          BormeStatsProvinceYear, Cargo, Config, Company,
+                          CompanyHistory, Person, PersonHistory)
 
 
 class AnuncioAdmin(admin.ModelAdmin):
@@ -20,20 +22,55 @@ class BormeLogAdmin(admin.ModelAdmin):
     search_fields = ['borme__cve']
 
 
+class BormeStatsDayAdmin(admin.ModelAdmin):
+    list_display = ('date', 'bormes', 'anuncios', 'new_companies', 'extinctions')
+
+
+class BormeStatsProvinceYearAdmin(admin.ModelAdmin):
+    list_display = ('province', 'year', 'bormes', 'anuncios', 'new_companies', 'extinctions')
+    list_filter = ('year',)
+
+
+class CargoAdmin(admin.ModelAdmin):
+    list_display = ('company', 'title', 'holder_person', 'holder_company', 'date_from', 'date_to')
+    list_select_related = ('company', 'holder_person', 'holder_company')
+    raw_id_fields = ('company', 'holder_person', 'holder_company', 'anuncio')
+    search_fields = ['company__name']
+
+
+class CompanyHistoryInline(admin.StackedInline):
+    model = CompanyHistory
+
+
 class CompanyAdmin(admin.ModelAdmin):
-    list_display = ('name', 'type', 'date_updated', 'in_bormes', 'anuncios', 'total_bormes', 'total_anuncios')
+    list_display = ('name', 'type', 'date_updated', 'is_active', 'total_bormes', 'total_anuncios')
     list_filter = ('type',)
     search_fields = ['name']
+    inlines = [CompanyHistoryInline]
+
+    def get_queryset(self, request):
+        return super(CompanyAdmin, self).get_queryset(request).summary()
+
+
+class PersonHistoryInline(admin.StackedInline):
+    model = PersonHistory
 
 
 class PersonAdmin(admin.ModelAdmin):
-    list_display = ('name', 'date_updated', 'in_companies', 'in_bormes', 'total_companies', 'total_bormes')
+    list_display = ('name', 'date_updated', 'total_companies', 'total_bormes')
     search_fields = ['name']
+    inlines = [PersonHistoryInline]
+
+    def get_queryset(self, request):
+        return super(PersonAdmin, self).get_queryset(request).summary()
 
 
 admin.site.register(Anuncio, AnuncioAdmin)
 admin.site.register(Borme, BormeAdmin)
 admin.site.register(BormeLog, BormeLogAdmin)
+admin.site.register(BormeStatsDay, BormeStatsDayAdmin)
+admin.site.register(BormeStatsProvinceYear, BormeStatsProvinceYearAdmin)
+admin.site.register(Cargo, CargoAdmin)
 admin.site.register(Company, CompanyAdmin)
 admin.site.register(Person, PersonAdmin)
 admin.site.register(Config)
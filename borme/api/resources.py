@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.conf.urls import url
 from django.core.paginator import Paginator
+from tastypie import fields
 from tastypie.resources import ModelResource
 from tastypie.throttle import CacheThrottle
 from tastypie.utils import trailing_slash
@@ -10,19 +11,62 @@ from borme.models import Company, Person
 from .serializers import LibreBormeJSONSerializer
 
 
+def _cargos_by_type(cargos, type):
+    """ Cargos de un tipo con el formato de los campos JSON cargos_* """
+    result = []
+    for cargo in cargos:
+        if cargo['type'] == type:
+            cargo = cargo.copy()
+            del cargo['type']
+            result.append(cargo)
+    return result
+
+
 # FIXME: fullname
 class CompanyResource(ModelResource):
+    # Los cargos se leen de borme.models.Cargo, no de los campos JSON
+    cargos_actuales_p = fields.ListField(readonly=True, null=True)
+    cargos_actuales_c = fields.ListField(readonly=True, null=True)
+    cargos_historial_p = fields.ListField(readonly=True, null=True)
+    cargos_historial_c = fields.ListField(readonly=True, null=True)
+    # Historial (borme.models.CompanyHistory)
+    in_bormes = fields.ListField(attribute='in_bormes', readonly=True)
+    anuncios = fields.ListField(attribute='anuncios', readonly=True)
+
     class Meta:
-        excludes = ['document', 'nif']
+        excludes = ['document', 'nif', 'total_bormes', 'total_anuncios']
         detail_allowed_methods = ['get']
         list_allowed_methods = []
         max_limit = 100
-        queryset = Company.objects.all()
+        queryset = Company.objects.select_related('history') \
+                                  .defer('cargos_actuales_p',
+                                         'cargos_actuales_c',
+                                         'history__cargos_historial_p',
+                                         'history__cargos_historial_c')
         resource_name = 'empresa'
         serializer = LibreBormeJSONSerializer(formats=['json'])
         # 60 requests per hour ~= 1 request per minute
         throttle = CacheThrottle(throttle_at=60, timeframe=3600)
 
+    def full_dehydrate(self, bundle, for_list=False):
+        # Una consulta para los cargos actuales y otra para los pasados, que
+        # se reparten por tipo en los campos cargos_*
+        bundle.cargos_actuales = bundle.obj.get_cargos_actuales(limit=0)[0]
+        bundle.cargos_historial = bundle.obj.get_cargos_historial(limit=0)[0]
+        return super(CompanyResource, self).full_dehydrate(bundle, for_list)
+
+    def dehydrate_cargos_actuales_p(self, bundle):
+        return _cargos_by_type(bundle.cargos_actuales, 'person')
+
+    def dehydrate_cargos_actuales_c(self, bundle):
+        return _cargos_by_type(bundle.cargos_actuales, 'company')
+
+    def dehydrate_cargos_historial_p(self, bundle):
+        return _cargos_by_type(bundle.cargos_historial, 'person')
+
+    def dehydrate_cargos_historial_c(self, bundle):
+        return _cargos_by_type(bundle.cargos_historial, 'company')
+
     def prepend_urls(self):
         return [
             url(r"^(?P<resource_name>%s)/search%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('get_search'), name="api_get_search_company"),
@@ -51,7 +95,8 @@ class CompanyResource(ModelResource):
                 page = paginator.page(int(request.GET.get('page', 1)))
 
                 slugs = list(map(lambda x: x['_source']['slug'], page))
-                object_list = Company.objects.filter(slug__in=slugs)
+                object_list = Company.objects.summary() \
+                                             .filter(slug__in=slugs)
                 for result in object_list:
                     bundle = self.build_bundle(obj=result, request=request)
                     bundle = self.search_dehydrate(bundle)
@@ -98,12 +143,20 @@ class CompanyResource(ModelResource):
 
 
 class PersonResource(ModelResource):
+    cargos_actuales = fields.ListField(readonly=True, null=True)
+    cargos_historial = fields.ListField(readonly=True, null=True)
+    # Historial (borme.models.PersonHistory)
+    in_companies = fields.ListField(attribute='in_companies', readonly=True)
+    in_bormes = fields.ListField(attribute='in_bormes', readonly=True)
+
     class Meta:
-        excludes = ['document']
+        excludes = ['document', 'total_bormes', 'total_companies']
         detail_allowed_methods = ['get']
         list_allowed_methods = []
         max_limit = 100
-        queryset = Person.objects.all()
+        queryset = Person.objects.select_related('history') \
+                                 .defer('cargos_actuales',
+                                        'history__cargos_historial')
         resource_name = 'persona'
         serializer = LibreBormeJSONSerializer(formats=['json'])
         throttle = CacheThrottle(throttle_at=60, timeframe=3600)
@@ -111,6 +164,14 @@ class PersonResource(ModelResource):
     def dehydrate_name(self, bundle):
         return bundle.data['name'].title()
 
+    def dehydrate_cargos_actuales(self, bundle):
+        cargos = bundle.obj.get_cargos_actuales(limit=0)[0]
+        return _cargos_by_type(cargos, 'company')
+
+    def dehydrate_cargos_historial(self, bundle):
+        cargos = bundle.obj.get_cargos_historial(limit=0)[0]
+        return _cargos_by_type(cargos, 'company')
+
     def prepend_urls(self):
         return [
             url(r"^(?P<resource_name>%s)/search%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('get_search'), name="api_get_search_person"),
@@ -139,7 +200,8 @@ class PersonResource(ModelResource):
                 page = paginator.page(int(request.GET.get('page', 1)))
 
                 slugs = list(map(lambda x: x['_source']['slug'], page))
-                object_list = Person.objects.filter(slug__in=slugs)
+                object_list = Person.objects.summary() \
+                                            .filter(slug__in=slugs)
                 for result in object_list:
                     bundle = self.build_bundle(obj=result, request=request)
                     bundle = self.search_dehydrate(bundle)
@@ -2,6 +2,10 @@ import json
 from django.core.serializers.json import DjangoJSONEncoder
 from tastypie.serializers import Serializer
 
+JSON_FIELDS = ('in_companies', 'in_bormes', 'cargos_actuales_p',
+               'cargos_actuales_c', 'cargos_historial_p', 'cargos_historial_c',
+               'cargos_actuales', 'cargos_historial', 'anuncios')
+
 
 class LibreBormeJSONSerializer(Serializer):
     def to_json(self, data, options=None):
@@ -9,23 +13,10 @@ class LibreBormeJSONSerializer(Serializer):
 
         data = self.to_simple(data, options)
 
-        if 'in_companies' in data:
-            data['in_companies'] = eval(data['in_companies'])
-        if 'in_bormes' in data:
-            data['in_bormes'] = eval(data['in_bormes'])
-        if 'cargos_actuales_p' in data:
-            data['cargos_actuales_p'] = eval(data['cargos_actuales_p'])
-        if 'cargos_actuales_c' in data:
-            data['cargos_actuales_c'] = eval(data['cargos_actuales_c'])
-        if 'cargos_historial_p' in data:
-            data['cargos_historial_p'] = eval(data['cargos_historial_p'])
-        if 'cargos_historial_c' in data:
-            data['cargos_historial_c'] = eval(data['cargos_historial_c'])
-        if 'cargos_actuales' in data:
-            data['cargos_actuales'] = eval(data['cargos_actuales'])
-        if 'cargos_historial' in data:
-            data['cargos_historial'] = eval(data['cargos_historial'])
-        if 'anuncios' in data:
-            data['anuncios'] = eval(data['anuncios'])
+        # Los campos JSON del modelo llegan como str. Los cargos se leen de
+        # borme.models.Cargo y llegan ya como listas.
+        for field in JSON_FIELDS:
+            if isinstance(data.get(field), str):
+                data[field] = eval(data[field])
 
         return json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
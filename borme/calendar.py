@@ -1,9 +1,120 @@
+from django.conf import settings
+from django.db.models import F
 from django.urls import reverse
-from .models import Borme
-from calendar import Calendar, January, monthrange, month_name, day_abbr
+from .models import Borme, Config
+from calendar import Calendar, January, month_name, day_abbr
 
 import datetime
+import re
 import sys
+import threading
+import time
+
+CVE_RE = re.compile(r'^BORME-(\w+)-(\d{4})-(\d+)-(\w+)$')
+
+
+class BormeCalendarIndex(object):
+    """ Días en los que se publicó BORME, en memoria
+
+    Los días de cada año y de cada (provincia, año) se guardan en un entero
+    cuyo bit n-1 indica si hubo BORME el día n del año. Para enlazar a cada
+    BORME no hace falta guardar su cve: casi todos siguen el formato
+    BORME-A-<año>-<número del día>-<código de provincia>, así que basta con
+    el número del BORME de cada día y el formato de cada (provincia, año).
+    Los que no lo siguen se guardan aparte.
+    """
+
+    def __init__(self, version, rows):
+        """
+        :param version: Config.bormes_version con la que se han leído los datos
+        :param rows: iterable de (cve, date, province) de los BORMEs
+        """
+        self.version = version
+        self.years = {}         # {year: bitset}
+        self.provinces = {}     # {(province, year): bitset}
+        self.numbers = {}       # {date: número del BORME del día}
+        self.cve_formats = {}   # {(province, year): 'BORME-A-2018-{}-29'}
+        self.cves = {}          # {(province, date): cve}
+
+        for cve, date, province in rows:
+            key = (province, date.year)
+            bit = 1 << (date.timetuple().tm_yday - 1)
+            self.years[date.year] = self.years.get(date.year, 0) | bit
+            self.provinces[key] = self.provinces.get(key, 0) | bit
+
+            match = CVE_RE.match(cve)
+            if match and int(match.group(2)) == date.year:
+                section, _, number, code = match.groups()
+                cve_format = 'BORME-%s-%d-{}-%s' % (section, date.year, code)
+                if (self.numbers.setdefault(date, number) == number and
+                        self.cve_formats.setdefault(key, cve_format) == cve_format):
+                    continue
+            self.cves[(province, date)] = cve
+
+    @classmethod
+    def load(cls):
+        """ Lee de la BD los días de todos los BORMEs """
+        version = Config.objects.values_list('bormes_version', flat=True) \
+                                .first()
+        rows = Borme.objects.values_list('cve', 'date', 'province').iterator()
+        return cls(version, rows)
+
+    def _has_day(self, bitset, date):
+        return bool(bitset >> (date.timetuple().tm_yday - 1) & 1)
+
+    def has_borme(self, date):
+        """ Si se publicó algún BORME el día date """
+        return self._has_day(self.years.get(date.year, 0), date)
+
+    def get_cve(self, province, date):
+        """ cve del BORME de la provincia del día date, o None si no hay """
+        if not self._has_day(self.provinces.get((province, date.year), 0),
+                             date):
+            return None
+        if (province, date) in self.cves:
+            return self.cves[(province, date)]
+        return self.cve_formats[(province, date.year)].format(
+                                                        self.numbers[date])
+
+
+_index = None
+_index_checked = 0
+_index_lock = threading.Lock()
+
+
+def get_calendar_index():
+    """ Devuelve el índice de días con BORME del proceso
+
+    Se carga la primera vez que se usa. Después se comprueba
+    Config.bormes_version como mucho cada settings.CALENDAR_CHECK_INTERVAL
+    segundos y se vuelve a cargar si la importación lo ha cambiado.
+
+    :rtype: BormeCalendarIndex
+    """
+    global _index, _index_checked
+    with _index_lock:
+        now = time.time()
+        if _index is None:
+            _index = BormeCalendarIndex.load()
+            _index_checked = now
+        elif now - _index_checked >= settings.CALENDAR_CHECK_INTERVAL:
+            _index_checked = now
+            version = Config.objects.values_list('bormes_version', flat=True) \
+                                    .first()
+            if version != _index.version:
+                _index = BormeCalendarIndex.load()
+        return _index
+
+
+def invalidate_calendar_index():
+    """ Avisa a los procesos de que hay BORMEs nuevos (Config.bormes_version).
+
+    Lo llama la importación cuando se confirma la transacción en la que crea
+    el BORME (transaction.on_commit), en su propia transacción: así no se
+    bloquea la fila de Config mientras se importa el BORME y los procesos de
+    --import-workers no se esperan unos a otros.
+    """
+    Config.objects.update(bormes_version=F('bormes_version') + 1)
 
 
 # from calendar import HTMLCalendar
@@ -139,13 +250,13 @@ class LibreBormeCalendar(HTMLCalendar):
         elif weekday in (5, 6):
             return '<td class="day %s %s">%d</td>' % (self.cssclasses[weekday], css_selected, day)
         elif self.today == datetime.date(self.year, self.month, day):
-            if (self.month, day) in self.days_bormes:
+            if self.index.has_borme(datetime.date(self.year, self.month, day)):
                 url = reverse('borme-fecha', args=['-'.join([str(self.year), str(self.month), str(day)])])
                 return '<td class="day bormeday today %s"><a href="%s">%d</a></td>' % (css_selected, url, day)
             else:
                 return '<td class="day nobormeday today %s">%d</td>' % (css_selected, day)
         else:
-            if (self.month, day) in self.days_bormes:
+            if self.index.has_borme(datetime.date(self.year, self.month, day)):
                 url = reverse('borme-fecha', args=['-'.join([str(self.year), str(self.month), str(day)])])
                 return '<td class="day bormeday %s"><a href="%s">%d</a></td>' % (css_selected, url, day)
             else:
@@ -156,15 +267,7 @@ class LibreBormeCalendar(HTMLCalendar):
         self.month = date.month
         self.day = date.day
         self.today = datetime.date.today()
-
-        _, lastday = monthrange(self.year, self.month)
-        bormes = Borme.objects.filter(
-                    date__gte=datetime.date(self.year, self.month, 1),
-                    date__lte=datetime.date(self.year, self.month, lastday)
-                 ).distinct('date').order_by('date')
-        self.days_bormes = {}
-        for borme in bormes:
-            self.days_bormes[(borme.date.month, borme.date.day)] = borme
+        self.index = get_calendar_index()
 
         return super(LibreBormeCalendar, self).formatmonth(self.year,
                                                            self.month)
@@ -186,14 +289,16 @@ class LibreBormeAvailableCalendar(HTMLCalendar):
         elif weekday in (5, 6):
             return '<td class="day %s">%d</td>' % (self.cssclasses[weekday], day)
         elif self.today == datetime.date(self.year, self.month, day):
-            if (self.month, day) in self.days_bormes:
-                url = self.days_bormes[(self.month, day)].get_absolute_url()
+            cve = self.index.get_cve(self.province, datetime.date(self.year, self.month, day))
+            if cve:
+                url = reverse('borme-borme', args=[cve])
                 return '<td class="day bormeday today"><a href="%s">%d</a></td>' % (url, day)
             else:
                 return '<td class="day nobormeday today">%d</td>' % day
         else:
-            if (self.month, day) in self.days_bormes:
-                url = self.days_bormes[(self.month, day)].get_absolute_url()
+            cve = self.index.get_cve(self.province, datetime.date(self.year, self.month, day))
+            if cve:
+                url = reverse('borme-borme', args=[cve])
                 return '<td class="day bormeday"><a href="%s">%d</a></td>' % (url, day)
             else:
                 return '<td class="day nobormeday">%d</td>' % day
@@ -205,13 +310,11 @@ class LibreBormeAvailableCalendar(HTMLCalendar):
                                                             month,
                                                             withyear=withyear)
 
-    def formatyear(self, theyear, bormes, width=3):
+    def formatyear(self, theyear, province, width=3):
         self.year = theyear
+        self.province = province
         self.today = datetime.date.today()
-
-        self.days_bormes = {}
-        for borme in bormes:
-            self.days_bormes[(borme.date.month, borme.date.day)] = borme
+        self.index = get_calendar_index()
 
         return super(LibreBormeAvailableCalendar, self).formatyear(
                                                             theyear,
@@ -0,0 +1,71 @@
+from django.core.cache import cache
+
+from .calendar import LibreBormeCalendar
+from .models import Company, Config, Person, fullname
+from .utils.postgres import estimate_count_fast
+
+import datetime
+
+DASHBOARD_CACHE_KEY = 'borme:dashboard'
+
+# Número de sociedades y personas de ejemplo
+DASHBOARD_EXAMPLES = 10
+
+
+def build_dashboard():
+    """ Calcula los datos de la página de inicio
+
+    Las sociedades y personas de ejemplo se leen sin sus campos JSON, solo
+    con lo que hace falta para enlazarlas. El calendario se guarda ya
+    generado.
+
+    :rtype: dict
+    """
+    companies = Company.objects.order_by('-date_updated') \
+                               .values_list('slug', 'name', 'type')
+    persons = Person.objects.order_by('-date_updated') \
+                            .values_list('slug', 'name')
+    config = Config.objects.first()
+    today = datetime.date.today()
+
+    return {
+        "total_companies": estimate_count_fast('borme_company'),
+        "total_persons": estimate_count_fast('borme_person'),
+        "total_anuncios": estimate_count_fast('borme_anuncio'),
+        "random_companies": [
+            {'slug': slug, 'fullname': fullname(name, type)}
+            for slug, name, type in companies[:DASHBOARD_EXAMPLES]],
+        "random_persons": [
+            {'slug': slug, 'name': name}
+            for slug, name in persons[:DASHBOARD_EXAMPLES]],
+        "last_modified": config.last_modified.date() if config else None,
+        "calendar": LibreBormeCalendar().formatmonth(today),
+        "date": today,
+    }
+
+
+def refresh_dashboard():
+    """ Vuelve a calcular los datos de la página de inicio y los guarda en
+    la caché. Se llama al terminar la importación.
+
+    :rtype: dict
+    """
+    dashboard = build_dashboard()
+    cache.set(DASHBOARD_CACHE_KEY, dashboard, None)
+    return dashboard
+
+
+def get_dashboard():
+    """ Datos de la página de inicio, con una sola lectura de la caché
+
+    Solo se calculan si no están en la caché o son de otro día (el
+    calendario marca el día actual). Para que los servidores web vean los
+    datos que calcula la importación la caché tiene que ser compartida
+    (Redis en settings_ref).
+
+    :rtype: dict
+    """
+    dashboard = cache.get(DASHBOARD_CACHE_KEY)
+    if dashboard is None or dashboard['date'] != datetime.date.today():
+        dashboard = refresh_dashboard()
+    return dashboard
@@ -3,8 +3,18 @@ from django.core.paginator import Paginator
 from django_elasticsearch_dsl import DocType, fields, Index
 from elasticsearch_dsl import analyzer, token_filter
 from .models import Company, Person
+from .utils.postgres import search_fts
 
 import elasticsearch
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Modelo de cada documento, para buscar en PostgreSQL si ES no responde
+SEARCH_MODELS = {
+    'company_document': Company,
+    'person_document': Person,
+}
 
 
 def configure_index(idx):
@@ -56,27 +66,117 @@ class PersonDocument(DocType):
         fields = ['name', 'slug']
 
 
+def autosync_enabled():
+    """Whether django_elasticsearch_dsl keeps the index in sync"""
+    return ('django_elasticsearch_dsl' in settings.INSTALLED_APPS and
+            getattr(settings, 'ELASTICSEARCH_DSL_AUTOSYNC', True))
+
+
+class IndexBuffer(object):
+    """Companies and persons to index in bulk
+
+    Used as a context manager, the autosync signals of CompanyDocument and
+    PersonDocument are ignored inside the block, so saving an instance does
+    not send a request to ES. The slugs added with add() are de-duplicated
+    and flush() indexes them through the _bulk API, in chunks of
+    ELASTICSEARCH_BULK_CHUNK_SIZE documents.
+
+    Usage:
+    index = IndexBuffer()
+    with index:
+        company.save()
+    index.add(Company, [company.slug])
+    transaction.on_commit(index.flush)
+    """
+    DOCUMENTS = {
+        Company: CompanyDocument,
+        Person: PersonDocument,
+    }
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.ELASTICSEARCH_BULK_CHUNK_SIZE
+        self.slugs = {model: set() for model in self.DOCUMENTS}
+        self._ignored = {}
+
+    def __enter__(self):
+        for document in self.DOCUMENTS.values():
+            self._ignored[document] = document._doc_type.ignore_signals
+            document._doc_type.ignore_signals = True
+        return self
+
+    def __exit__(self, *exc_info):
+        for document, ignore in self._ignored.items():
+            document._doc_type.ignore_signals = ignore
+
+    def add(self, model, slugs):
+        self.slugs[model].update(slugs)
+
+    def flush(self):
+        """Index the buffered companies and persons and empty the buffer.
+
+        ES errors are logged, not raised: the data is already committed and
+        the documents can be indexed again with search_index --populate.
+
+        :rtype: int number of indexed documents
+        """
+        total = 0
+        for model, document in self.DOCUMENTS.items():
+            slugs = sorted(self.slugs[model])
+            self.slugs[model].clear()
+            if not autosync_enabled():
+                continue
+            for start in range(0, len(slugs), self.chunk_size):
+                chunk = slugs[start:start + self.chunk_size]
+                objs = model.objects.summary().filter(slug__in=chunk)
+                try:
+                    indexed, _ = document().update(objs,
+                                                   chunk_size=self.chunk_size)
+                except elasticsearch.ElasticsearchException as e:
+                    logger.error("Elasticsearch bulk indexing failed: %s", e)
+                    return total
+                total += indexed
+        return total
+
+
 class ElasticSearchPaginatorListException(Exception):
     pass
 
 
 # Originally from http://epoz.org/blog/django-paginator-elasticsearch.html
 # Modified count() method to work with elasticsearch 5.x
+#
+# If ES fails and a fallback is given (see PostgresSearchList), the fallback
+# answers this and the following requests.
 class ElasticSearchPaginatorList(object):
-    def __init__(self, client, *args, **kwargs):
+    def __init__(self, client, *args, fallback=None, **kwargs):
         self.client = client
         self.args = args
         self.kwargs = kwargs
+        self.fallback = fallback
         self._count = None
 
+    def _use_fallback(self, error):
+        if self.fallback is None:
+            raise error
+        logger.warning("Elasticsearch error, searching in PostgreSQL: %s",
+                       error)
+        self.client = None
+
     def count(self):
         """Warning: result is cached using initial kwargs"""
         if self._count is None:
-            # self.client.search(*self.args, **self.kwargs)['hits']['total']
-            result = self.client.count(index=self.kwargs['index'],
-                                       doc_type=self.kwargs['doc_type'],
-                                       body=self.kwargs['body'])
-            self._count = result['count']
+            if self.client is not None:
+                # self.client.search(*self.args, **self.kwargs)['hits']['total']
+                try:
+                    result = self.client.count(
+                                    index=self.kwargs['index'],
+                                    doc_type=self.kwargs['doc_type'],
+                                    body=self.kwargs['body'])
+                    self._count = result['count']
+                    return self._count
+                except elasticsearch.TransportError as e:
+                    self._use_fallback(e)
+            self._count = self.fallback.count()
         return self._count
 
     def __len__(self):
@@ -86,9 +186,35 @@ class ElasticSearchPaginatorList(object):
         if not isinstance(key, slice):
             raise ElasticSearchPaginatorListException(
                     'key parameter in __getitem__ is not a slice instance')
-        self.kwargs['from_'] = key.start
-        self.kwargs['size'] = key.stop - key.start
-        return self.client.search(*self.args, **self.kwargs)['hits']['hits']
+        if self.client is not None:
+            self.kwargs['from_'] = key.start
+            self.kwargs['size'] = key.stop - key.start
+            try:
+                return self.client.search(*self.args,
+                                          **self.kwargs)['hits']['hits']
+            except elasticsearch.TransportError as e:
+                self._use_fallback(e)
+        return self.fallback[key]
+
+
+class PostgresSearchList(object):
+    """Same results as ElasticSearchPaginatorList, using PostgreSQL full
+    text search (borme.utils.postgres.search_fts)
+    """
+    def __init__(self, model, text):
+        self.queryset = search_fts(text, model)
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        # Same name as the ES documents: fullname for companies
+        return [{'_source': {'slug': obj.slug,
+                             'name': getattr(obj, 'fullname', obj.name)}}
+                for obj in self.queryset[key]]
 
 
 def es_search_paginator(doc_type, text):
@@ -137,6 +263,7 @@ def es_search_paginator(doc_type, text):
     es = elasticsearch.Elasticsearch(settings.ELASTICSEARCH_URI)
     results = ElasticSearchPaginatorList(
             es, body=es_query,
-            index='libreborme', doc_type=doc_type)
+            index='libreborme', doc_type=doc_type,
+            fallback=PostgresSearchList(SEARCH_MODELS[doc_type], text))
 
     return results
@@ -0,0 +1,252 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils.cache import get_cache_key
+
+from .dashboard import refresh_dashboard
+from .models import Cargo, Person, PersonHistory
+from .utils.strings import convertir_iniciales, slug2
+
+import hashlib
+import hmac
+import json
+
+# Sociedades que se reescriben en cada transacción
+BATCH_SIZE = 1000
+
+# Cambia el nombre de los cargos de una lista JSON que estén en el
+# diccionario %(names)s, que tiene para cada nombre el nuevo nombre y slug
+REWRITE_SQL = """COALESCE((
+    SELECT jsonb_agg(CASE WHEN %(names)s::jsonb ? (e->>'name')
+                          THEN e || (%(names)s::jsonb -> (e->>'name'))
+                          ELSE e END ORDER BY i)
+    FROM jsonb_array_elements({column}) WITH ORDINALITY AS t(e, i)),
+    '[]'::jsonb)"""
+
+# Las listas que contienen alguno de los nombres (%(match)s)
+MATCH_SQL = "{column} @> ANY(%(match)s::jsonb[])"
+
+COMPANY_SQL = """
+    UPDATE borme_company SET cargos_actuales_p = {rewrite}
+    WHERE slug = ANY(%(slugs)s) AND {match}
+    RETURNING slug""".format(
+        rewrite=REWRITE_SQL.format(column='cargos_actuales_p'),
+        match=MATCH_SQL.format(column='cargos_actuales_p'))
+
+COMPANY_HISTORY_SQL = """
+    UPDATE borme_company_history SET cargos_historial_p = {rewrite}
+    WHERE company_id = ANY(%(slugs)s) AND {match}
+    RETURNING company_id""".format(
+        rewrite=REWRITE_SQL.format(column='cargos_historial_p'),
+        match=MATCH_SQL.format(column='cargos_historial_p'))
+
+# Los actos de cargos son listas; el resto de actos no se modifica
+ANUNCIO_SQL = """
+    UPDATE borme_anuncio SET actos = (
+        SELECT jsonb_object_agg(k, CASE WHEN jsonb_typeof(v) = 'array'
+                                        THEN {rewrite} ELSE v END)
+        FROM jsonb_each(actos) AS a(k, v))
+    WHERE company_id = ANY(%(slugs)s) AND EXISTS (
+        SELECT 1 FROM jsonb_each(actos) AS a(k, v)
+        WHERE jsonb_typeof(v) = 'array' AND {match})
+    RETURNING year, id_anuncio""".format(
+        rewrite=REWRITE_SQL.format(column='v'),
+        match=MATCH_SQL.format(column='v'))
+
+# Mueve las personas a su nuevo slug, que es la clave primaria. La nueva
+# fila se crea antes de cambiar las claves ajenas y de borrar la anterior
+PERSON_SQL = """
+    INSERT INTO borme_person ({columns})
+    SELECT {values}
+    FROM borme_person AS p
+    JOIN unnest(%(old)s::text[], %(new)s::text[], %(new_names)s::text[])
+         AS h(old_slug, new_slug, new_name) ON p.slug = h.old_slug"""
+
+MOVE_SQL = """
+    UPDATE {table} SET {column} = h.new_slug
+    FROM unnest(%(old)s::text[], %(new)s::text[]) AS h(old_slug, new_slug)
+    WHERE {column} = h.old_slug"""
+
+
+def new_slug(iniciales, old_slug):
+    """Slug de la persona oculta: sus iniciales y un número que se deriva
+    de su slug anterior con un HMAC con SECRET_KEY, así que es el mismo en
+    cada ejecución pero no se puede calcular a partir del nombre"""
+    digest = hmac.new(settings.SECRET_KEY.encode('utf-8'),
+                      old_slug.encode('utf-8'), hashlib.sha256).hexdigest()
+    number = int(digest[:8], 16)
+    slug = '{}-{}'.format(iniciales.replace(' ', '').replace('.', '-'), number)
+    return slug
+
+
+def _person_sql():
+    columns = []
+    values = []
+    for field in Person._meta.concrete_fields:
+        columns.append(field.column)
+        if field.name == 'slug':
+            values.append('h.new_slug')
+        elif field.name == 'name':
+            values.append('h.new_name')
+        elif field.name == 'document':
+            # Lo calcula el trigger de la BD
+            values.append('NULL')
+        else:
+            values.append('p.' + field.column)
+    return PERSON_SQL.format(columns=', '.join(columns),
+                             values=', '.join(values))
+
+
+def _rewrite_companies(cursor, slugs, params):
+    """Reescribe los cargos y anuncios de un lote de sociedades.
+
+    :rtype: (set company slugs, set (year, id_anuncio))
+    """
+    params = dict(params, slugs=slugs)
+    companies = set()
+    cursor.execute(COMPANY_SQL, params)
+    companies.update(row[0] for row in cursor.fetchall())
+    cursor.execute(COMPANY_HISTORY_SQL, params)
+    companies.update(row[0] for row in cursor.fetchall())
+    cursor.execute(ANUNCIO_SQL, params)
+    anuncios = set(cursor.fetchall())
+    return companies, anuncios
+
+
+def _cached_pages(persons, companies, anuncios):
+    """URLs de las páginas que pueden tener en caché los nombres"""
+    for slug in persons:
+        yield reverse('borme-persona', args=[slug])
+        yield reverse('borme-persona-csv-actual', args=[slug])
+        yield reverse('borme-persona-csv-historial', args=[slug])
+    for slug in companies:
+        yield reverse('borme-empresa', args=[slug])
+        yield reverse('borme-empresa-csv-actual', args=[slug])
+        yield reverse('borme-empresa-csv-historial', args=[slug])
+        ajax_url = reverse('borme-ajax-empresa', args=[slug])
+        yield ajax_url + '?t=actuales'
+        yield ajax_url + '?t=historial'
+    for year, id_anuncio in anuncios:
+        yield reverse('borme-anuncio', args=[year, id_anuncio])
+
+
+def clear_cached_pages(paths, hosts=None):
+    """Borra de la caché las páginas guardadas por cache_page.
+
+    La clave de cache_page depende de la URL completa, así que se busca para
+    cada host (por defecto los de ALLOWED_HOSTS) con http y https.
+
+    :rtype: int número de páginas borradas
+    """
+    if hosts is None:
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS
+                 if host != '*']
+    factory = RequestFactory()
+    keys = set()
+    for path in paths:
+        for host in hosts:
+            for secure in (False, True):
+                request = factory.get(path, HTTP_HOST=host, secure=secure)
+                key = get_cache_key(request)
+                if key:
+                    keys.add(key)
+    cache.delete_many(keys)
+    return len(keys)
+
+
+def _update_search_index(old_persons, new_persons):
+    """Sustituye las personas en Elasticsearch, como hacía la señal de
+    django_elasticsearch_dsl al borrarlas y crearlas con el ORM
+    """
+    if 'django_elasticsearch_dsl' not in settings.INSTALLED_APPS:
+        return
+    from django_elasticsearch_dsl.registries import registry
+    for person in old_persons:
+        registry.delete(person, raise_on_error=False)
+    for person in new_persons:
+        registry.update(person)
+
+
+def hide_persons(slugs, batch_size=BATCH_SIZE, hosts=None):
+    """Oculta el nombre de las personas indicadas.
+
+    Cada persona pasa a llamarse con sus iniciales y cambia de slug. El
+    nombre se sustituye en los cargos de las sociedades y en los actos de
+    sus anuncios con UPDATE en la BD, por lotes de batch_size sociedades:
+    solo se reescriben las filas que contienen alguno de los nombres
+    (contención JSONB) y cada lote se confirma por separado. Al final se
+    mueve cada persona a su nuevo slug en una sola transacción.
+
+    El nuevo slug se deriva del anterior y de SECRET_KEY (ver new_slug()),
+    así que si se interrumpe se puede volver a ejecutar con los mismos
+    slugs: los lotes ya confirmados apuntan al mismo slug que se asigna al
+    terminar.
+
+    Después se borran de la caché las páginas afectadas y se recalcula la
+    página de inicio.
+
+    :param slugs: slugs de las personas
+    :type slugs: list
+    :rtype: dict {old slug: nuevo slug}, sin las personas que no existen
+    """
+    persons = list(Person.objects.summary().filter(slug__in=set(slugs))
+                   .order_by('slug'))
+    if not persons:
+        return {}
+
+    hidden = {}
+    names = {}
+    move = {'old': [], 'new': [], 'new_names': []}
+    for person in persons:
+        iniciales = convertir_iniciales(person.name)
+        slug = new_slug(iniciales, person.slug)
+        base, number = slug, 1
+        while slug in move['new']:
+            number += 1
+            slug = '{}-{}'.format(base, number)
+        hidden[person.slug] = slug
+        names[person.name] = {'name': iniciales, 'slug': slug}
+        move['old'].append(person.slug)
+        move['new'].append(slug)
+        move['new_names'].append(iniciales)
+
+    # Sociedades en las que ha tenido cargos
+    company_slugs = set(Cargo.objects.filter(holder_person_id__in=hidden)
+                        .values_list('company_id', flat=True))
+    for in_companies in PersonHistory.objects \
+            .filter(person_id__in=hidden) \
+            .values_list('in_companies', flat=True):
+        company_slugs.update(slug2(name) for name in in_companies)
+    company_slugs = sorted(company_slugs)
+
+    params = {
+        'names': json.dumps(names),
+        'match': [json.dumps([{'name': name}]) for name in names],
+    }
+    companies = set()
+    anuncios = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(company_slugs), batch_size):
+            batch = company_slugs[start:start + batch_size]
+            with transaction.atomic():
+                batch_companies, batch_anuncios = _rewrite_companies(
+                                                    cursor, batch, params)
+            companies.update(batch_companies)
+            anuncios.update(batch_anuncios)
+
+        with transaction.atomic():
+            cursor.execute(_person_sql(), move)
+            for table, column in (('borme_person_history', 'person_id'),
+                                  ('borme_cargo', 'holder_person_id')):
+                cursor.execute(MOVE_SQL.format(table=table, column=column),
+                               move)
+            cursor.execute('DELETE FROM borme_person WHERE slug = ANY(%s)',
+                           [move['old']])
+
+    _update_search_index(persons,
+                         Person.objects.summary().filter(slug__in=move['new']))
+    clear_cached_pages(_cached_pages(hidden, companies, anuncios), hosts)
+    refresh_dashboard()
+    return hidden
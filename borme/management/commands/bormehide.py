@@ -1,84 +1,30 @@
 from django.core.management.base import BaseCommand
-from django.db import connection
-from borme.models import Anuncio, Company, Person
-from borme.utils.strings import convertir_iniciales
-from borme.templatetags.utils import slug2
-from bormeparser.regex import is_acto_cargo
+from django.urls import reverse
 
-from datetime import datetime
-
-
-def new_slug(old_slug):
-    number = datetime.now().strftime('%s')
-    slug = '{}-{}'.format(old_slug.replace(' ', '').replace('.', '-'), number)
-    return slug
+from borme.hide import BATCH_SIZE, hide_persons
 
 
 class Command(BaseCommand):
-    help = 'Hide some person'
+    help = 'Hide the name of some persons'
 
     def add_arguments(self, parser):
-        parser.add_argument("slug", type=str, help="person or company slug")
+        parser.add_argument("slug", type=str, nargs='+', help="person slug")
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='companies rewritten per transaction (default: {})'
+                 .format(BATCH_SIZE))
+        parser.add_argument(
+            '--host', action='append', dest='hosts',
+            help='host whose cached pages are cleared (default: '
+                 'ALLOWED_HOSTS). Can be given several times')
 
     def handle(self, *args, **options):
-
-        try:
-            entity = Person.objects.get(slug=options["slug"])
-        except Person.DoesNotExist:
-            print('Not found')
-            return
-
-        companies = []
-        iniciales = convertir_iniciales(entity.name)
-        nuevo_slug = new_slug(iniciales)
-
-        # Remove name from company positions
-        for company_name in entity.in_companies:
-            c = Company.objects.get(slug=slug2(company_name))
-            cargos = c.cargos_actuales_p.copy()
-            for p in cargos:
-                if p['name'] == entity.name:
-                    p['name'] = iniciales
-                    p['slug'] = nuevo_slug
-                    companies.append(c.slug)
-            c.cargos_actuales_p = cargos
-            cargos = c.cargos_historial_p.copy()
-            for p in cargos:
-                if p['name'] == entity.name:
-                    p['name'] = iniciales
-                    p['slug'] = nuevo_slug
-                    companies.append(c.slug)
-            c.cargos_historial_p = cargos
-            c.save()
-
-        # Remove name from anuncios in companies
-        for c_slug in companies:
-            for anuncio in Anuncio.objects.filter(company=c_slug):
-                actos = anuncio.actos.copy()
-                for k, cargos in actos.items():
-                    if is_acto_cargo(k):
-                        for cargo in cargos:
-                            if cargo['name'] == entity.name:
-                                cargo['name'] = iniciales
-                                cargo['slug'] = nuevo_slug
-                anuncio.actos = actos
-                anuncio.save()
-
-        # Change slug which is primary key
-        new_entity = Person()
-        new_entity.name = iniciales
-        new_entity.slug = nuevo_slug
-        new_entity.in_companies = entity.in_companies
-        new_entity.in_bormes = entity.in_bormes
-        new_entity.date_updated = entity.date_updated
-        new_entity.save()
-        entity.delete()
-        print('Done')
-        print(new_entity.get_absolute_url())
-        print()
-
-        for query in connection.queries:
-            print(query['sql'])
-            print()
-
-        # TODO: clear cache
+        hidden = hide_persons(options['slug'],
+                              batch_size=options['batch_size'],
+                              hosts=options['hosts'])
+        for slug in options['slug']:
+            if slug in hidden:
+                print('{} -> {}'.format(
+                    slug, reverse('borme-persona', args=[hidden[slug]])))
+            else:
+                print('{}: Not found'.format(slug))
@@ -11,9 +11,10 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         keyword = options["keyword"]
 
-        results = Company.objects.filter(name__icontains=keyword)
+        companies = Company.objects.summary('history__in_bormes')
+        results = companies.filter(name__icontains=keyword)
         if not results:
-            results = Company.objects.filter(slug__contains=keyword)
+            results = companies.filter(slug__contains=keyword)
 
         for company in results:
             bormes = list(map(lambda c: c['cve'], company.in_bormes))
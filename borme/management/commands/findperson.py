@@ -11,9 +11,11 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         keyword = options["keyword"]
 
-        results = Person.objects.filter(name__icontains=keyword)
+        persons = Person.objects.summary('history__in_companies',
+                                         'history__in_bormes')
+        results = persons.filter(name__icontains=keyword)
         if not results:
-            results = Person.objects.filter(slug__icontains=keyword)
+            results = persons.filter(slug__icontains=keyword)
 
         for person in results:
             bormes = list(map(lambda c: c['cve'], person.in_bormes))
@@ -1,12 +1,19 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
 
+from concurrent.futures import ProcessPoolExecutor
+
 import logging
 import time
 
+from borme.dashboard import refresh_dashboard
 from borme.models import Config
-from borme.parser.importer import import_borme_download
+from borme.parser.bulk import import_borme_bulk
+from borme.parser.downloader import DOWNLOAD_WORKERS
+from borme.parser.importer import import_borme_download, parse_date_range
 # from borme.parser.postgres import psql_update_documents
+import borme.parser.bulk
 import borme.parser.importer
 
 from libreborme.utils import get_git_revision_short_hash
@@ -35,16 +42,51 @@ class Command(BaseCommand):
                 action='store_true',
                 default=False,
                 help='Abort if local file is not found')
+        parser.add_argument(
+                '--parse-workers',
+                type=int,
+                default=1,
+                help='Number of processes used to parse BORME files')
+        parser.add_argument(
+                '--download-workers',
+                type=int,
+                default=DOWNLOAD_WORKERS,
+                help='Number of simultaneous downloads')
+        parser.add_argument(
+                '--force',
+                action='store_true',
+                default=False,
+                help='Parse again BORMEs already imported')
+        parser.add_argument(
+                '--import-workers',
+                type=int,
+                default=1,
+                help='Number of processes used to import the BORMEs of a day '
+                     'into the database')
+        parser.add_argument(
+                '--bulk',
+                action='store_true',
+                default=False,
+                help='Load local BORME-JSON files into an empty database '
+                     'with COPY')
         # json only, pdf only...
 
     def handle(self, *args, **options):
         self.set_verbosity(int(options['verbosity']))
         start_time = time.time()
 
-        import_borme_download(options['from'][0],
-                              options['to'][0],
-                              local_only=options['local_only'],
-                              no_missing=options['no_missing'])
+        if options['bulk']:
+            self.import_bulk(options['from'][0], options['to'][0],
+                             options['parse_workers'])
+        else:
+            import_borme_download(options['from'][0],
+                                  options['to'][0],
+                                  local_only=options['local_only'],
+                                  no_missing=options['no_missing'],
+                                  parse_workers=options['parse_workers'],
+                                  download_workers=options['download_workers'],
+                                  force=options['force'],
+                                  import_workers=options['import_workers'])
 
         config = Config.objects.first()
         if config:
@@ -53,6 +95,7 @@ class Command(BaseCommand):
             config = Config(last_modified=timezone.now())
         config.version = get_git_revision_short_hash()
         config.save()
+        refresh_dashboard()
 
         # Update Full Text Search
         # psql_update_documents()
@@ -61,9 +104,30 @@ class Command(BaseCommand):
         elapsed_time = time.time() - start_time
         print('\nElapsed time: %.2f seconds' % elapsed_time)
 
+    def import_bulk(self, date_from, date_to, parse_workers):
+        try:
+            date_from, date_to = parse_date_range(date_from, date_to)
+        except ValueError as e:
+            raise CommandError(e)
+
+        parse_executor = None
+        if parse_workers > 1:
+            connections.close_all()
+            parse_executor = ProcessPoolExecutor(max_workers=parse_workers)
+
+        try:
+            import_borme_bulk(date_from, date_to,
+                              parse_executor=parse_executor)
+        except ValueError as e:
+            raise CommandError(e)
+        finally:
+            if parse_executor:
+                parse_executor.shutdown()
+
     def set_verbosity(self, verbosity):
         if verbosity == 0:
             borme.parser.importer.logger.setLevel(logging.ERROR)
+            borme.parser.bulk.logger.setLevel(logging.ERROR)
         elif verbosity == 1:  # default
             borme.parser.importer.logger.setLevel(logging.INFO)
         elif verbosity == 2:
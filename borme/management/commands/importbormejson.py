@@ -4,6 +4,7 @@ from django.utils import timezone
 import logging
 import time
 
+from borme.dashboard import refresh_dashboard
 from borme.models import Config
 # from borme.parser.postgres import psql_update_documents
 import borme.parser.importer
@@ -32,6 +33,7 @@ class Command(BaseCommand):
             config = Config(last_modified=timezone.now())
         config.version = get_git_revision_short_hash()
         config.save()
+        refresh_dashboard()
 
         # Update Full Text Search
         # psql_update_documents()
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 # from borme.parser.postgres import psql_update_documents
+from borme.dashboard import refresh_dashboard
 from borme.models import Config
 
 import time
@@ -32,6 +33,7 @@ class Command(BaseCommand):
             config = Config(last_modified=timezone.now())
         config.version = get_git_revision_short_hash()
         config.save()
+        refresh_dashboard()
 
         # Update Full Text Search
         # psql_update_documents()
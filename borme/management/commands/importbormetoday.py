@@ -5,7 +5,9 @@ import datetime
 import logging
 import time
 
+from borme.dashboard import refresh_dashboard
 from borme.models import Config
+from borme.parser.downloader import DOWNLOAD_WORKERS
 from borme.parser.importer import import_borme_download
 from borme.parser.path import update_previous_xml
 # from borme.parser.postgres import psql_update_documents
@@ -20,6 +22,23 @@ class Command(BaseCommand):
                             action='store_true',
                             default=False,
                             help='Do not download any file')
+        parser.add_argument('--parse-workers',
+                            type=int,
+                            default=1,
+                            help='Number of processes used to parse BORME files')
+        parser.add_argument('--download-workers',
+                            type=int,
+                            default=DOWNLOAD_WORKERS,
+                            help='Number of simultaneous downloads')
+        parser.add_argument('--force',
+                            action='store_true',
+                            default=False,
+                            help='Parse again BORMEs already imported')
+        parser.add_argument('--import-workers',
+                            type=int,
+                            default=1,
+                            help='Number of processes used to import the '
+                                 'BORMEs of a day into the database')
 
     def handle(self, *args, **options):
         self.set_verbosity(int(options['verbosity']))
@@ -29,7 +48,11 @@ class Command(BaseCommand):
         datestr = date.strftime('%Y-%m-%d')
         success = import_borme_download(datestr,
                                         datestr,
-                                        local_only=options['local_only'])
+                                        local_only=options['local_only'],
+                                        parse_workers=options['parse_workers'],
+                                        download_workers=options['download_workers'],
+                                        force=options['force'],
+                                        import_workers=options['import_workers'])
 
         if success:
             update_previous_xml(date)
@@ -40,6 +63,7 @@ class Command(BaseCommand):
             else:
                 config = Config(last_modified=timezone.now())
             config.save()
+            refresh_dashboard()
 
         # Update Full Text Search
         # psql_update_documents()
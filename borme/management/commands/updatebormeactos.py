@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from borme.parser.stats import rebuild_borme_actos
+
+
+class Command(BaseCommand):
+    help = 'Count the actos of each BORME from its anuncios (Borme.actos)'
+
+    def handle(self, *args, **options):
+        total = rebuild_borme_actos()
+        print("{} BORMEs were updated".format(total))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from borme.parser.cargos import rebuild_cargos
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Cargo table from the actos of the anuncios'
+
+    def handle(self, *args, **options):
+        total, errors = rebuild_cargos()
+        print("{} cargos were created".format(total))
+        if errors:
+            print("{} errors, the Cargo table is incomplete".format(errors))
@@ -1,11 +1,22 @@
 from django.core.management.base import BaseCommand
 
-from borme.parser.postgres import psql_update_documents
+from borme.parser.postgres import BATCH_SIZE, psql_update_documents
 
 
 class Command(BaseCommand):
     help = 'Update FTS PostgreSQL document fields'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='records updated per statement (default: {})'
+                 .format(BATCH_SIZE))
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='seconds to wait between batches (default: 0)')
+
     def handle(self, *args, **options):
-        affected_rows = psql_update_documents()
+        affected_rows = psql_update_documents(
+                            batch_size=options['batch_size'],
+                            sleep=options['sleep'])
         print("{} records were updated".format(affected_rows))
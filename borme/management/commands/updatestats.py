@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from borme.parser.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and province/year statistics tables'
+
+    def handle(self, *args, **options):
+        for table, total in rebuild_stats().items():
+            print("{}: {} rows".format(table, total))
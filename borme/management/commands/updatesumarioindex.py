@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from borme.parser.sumario import SumarioIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the index of BORME-XML sumarios from BORME_XML_ROOT'
+
+    def handle(self, *args, **options):
+        total = SumarioIndex().build()
+        print("{} sumarios were indexed".format(total))
@@ -0,0 +1,51 @@
+# Generated by Django 2.0.3 on 2018-06-02 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0004_index_borme_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cargo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('date_from', models.DateField(null=True)),
+                ('date_to', models.DateField(null=True)),
+                ('anuncio', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='borme.Anuncio')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cargo',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='cargos', to='borme.Company'),
+        ),
+        migrations.AddField(
+            model_name='cargo',
+            name='holder_company',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='cargos_holder', to='borme.Company'),
+        ),
+        migrations.AddField(
+            model_name='cargo',
+            name='holder_person',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='cargos', to='borme.Person'),
+        ),
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['company', 'date_to', 'date_from'], name='borme_cargo_company_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['holder_person', 'date_to', 'date_from'], name='borme_cargo_person_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cargo',
+            index=models.Index(fields=['holder_company', 'date_to', 'date_from'], name='borme_cargo_holder_idx'),
+        ),
+    ]
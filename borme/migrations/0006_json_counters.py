@@ -0,0 +1,43 @@
+# Generated by Django 2.0.3 on 2018-06-12 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0005_cargo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='total_anuncios',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='total_bormes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='total_bormes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='total_companies',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            "UPDATE borme_company "
+            "SET total_bormes = jsonb_array_length(in_bormes), "
+            "total_anuncios = jsonb_array_length(anuncios)",
+            migrations.RunSQL.noop),
+        migrations.RunSQL(
+            "UPDATE borme_person "
+            "SET total_bormes = jsonb_array_length(in_bormes), "
+            "total_companies = jsonb_array_length(in_companies)",
+            migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.0.3 on 2018-06-14 18:40
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0006_json_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borme',
+            name='actos',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.0.3 on 2018-06-16 12:05
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0007_borme_actos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BormeStatsDay',
+            fields=[
+                ('bormes', models.IntegerField(default=0)),
+                ('anuncios', models.IntegerField(default=0)),
+                ('new_companies', models.IntegerField(default=0)),
+                ('extinctions', models.IntegerField(default=0)),
+                ('actos', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('date', models.DateField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'db_table': 'borme_stats_day',
+            },
+        ),
+        migrations.CreateModel(
+            name='BormeStatsProvinceYear',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bormes', models.IntegerField(default=0)),
+                ('anuncios', models.IntegerField(default=0)),
+                ('new_companies', models.IntegerField(default=0)),
+                ('extinctions', models.IntegerField(default=0)),
+                ('actos', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('province', models.CharField(max_length=100)),
+                ('year', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'borme_stats_province_year',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='bormestatsprovinceyear',
+            unique_together={('province', 'year')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.3 on 2018-06-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0008_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='bormes_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
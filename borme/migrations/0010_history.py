@@ -0,0 +1,43 @@
+# Generated by Django 2.0.3 on 2018-06-25 10:08
+
+import borme.models
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0009_config_bormes_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyHistory',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='history', serialize=False, to='borme.Company')),
+                ('in_bormes', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('anuncios', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('cargos_historial_p', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('cargos_historial_c', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+            ],
+            options={
+                'db_table': 'borme_company_history',
+            },
+            bases=(borme.models.JsonAppendMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='PersonHistory',
+            fields=[
+                ('person', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='history', serialize=False, to='borme.Person')),
+                ('in_companies', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('in_bormes', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+                ('cargos_historial', django.contrib.postgres.fields.jsonb.JSONField(default=list)),
+            ],
+            options={
+                'db_table': 'borme_person_history',
+            },
+            bases=(borme.models.JsonAppendMixin, models.Model),
+        ),
+    ]
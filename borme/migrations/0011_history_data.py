@@ -0,0 +1,79 @@
+# Generated by Django 2.0.3 on 2018-06-25 10:12
+
+from django.db import migrations
+
+# Copia el historial de las sociedades y personas a sus nuevas tablas por
+# lotes. La migración no es atómica: cada lote es una única sentencia que se
+# confirma por separado, así que no se mantiene abierta una transacción
+# sobre toda la tabla y, si se interrumpe, al repetirla se sigue a partir del
+# último slug copiado.
+BATCH_SIZE = 5000
+
+HISTORY = [
+    ('borme_company', 'borme_company_history', 'company_id',
+     ['in_bormes', 'anuncios', 'cargos_historial_p', 'cargos_historial_c']),
+    ('borme_person', 'borme_person_history', 'person_id',
+     ['in_companies', 'in_bormes', 'cargos_historial']),
+]
+
+COPY_SQL = """
+    WITH batch AS (
+        SELECT slug, {columns} FROM {table}
+        WHERE slug > %s ORDER BY slug LIMIT %s),
+    copied AS (
+        INSERT INTO {history} ({fk}, {columns})
+        SELECT * FROM batch ON CONFLICT DO NOTHING)
+    SELECT max(slug) FROM batch"""
+
+RESTORE_SQL = """
+    WITH batch AS (
+        SELECT {fk}, {columns} FROM {history}
+        WHERE {fk} > %s ORDER BY {fk} LIMIT %s),
+    restored AS (
+        UPDATE {table} AS t SET {assignments}
+        FROM batch WHERE t.slug = batch.{fk})
+    SELECT max({fk}) FROM batch"""
+
+
+def _run_batches(cursor, sql, start):
+    last = start
+    while True:
+        cursor.execute(sql, [last, BATCH_SIZE])
+        last = cursor.fetchone()[0]
+        if last is None:
+            break
+
+
+def copy_history(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table, history, fk, columns in HISTORY:
+            cursor.execute('SELECT max({fk}) FROM {history}'.format(
+                           fk=fk, history=history))
+            start = cursor.fetchone()[0] or ''
+            sql = COPY_SQL.format(table=table, history=history, fk=fk,
+                                  columns=', '.join(columns))
+            _run_batches(cursor, sql, start)
+
+
+def restore_history(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table, history, fk, columns in HISTORY:
+            assignments = ', '.join('{col} = batch.{col}'.format(col=col)
+                                    for col in columns)
+            sql = RESTORE_SQL.format(table=table, history=history, fk=fk,
+                                     columns=', '.join(columns),
+                                     assignments=assignments)
+            _run_batches(cursor, sql, '')
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('borme', '0010_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_history, restore_history),
+    ]
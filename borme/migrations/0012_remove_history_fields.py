@@ -0,0 +1,41 @@
+# Generated by Django 2.0.3 on 2018-06-25 10:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0011_history_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='company',
+            name='anuncios',
+        ),
+        migrations.RemoveField(
+            model_name='company',
+            name='cargos_historial_c',
+        ),
+        migrations.RemoveField(
+            model_name='company',
+            name='cargos_historial_p',
+        ),
+        migrations.RemoveField(
+            model_name='company',
+            name='in_bormes',
+        ),
+        migrations.RemoveField(
+            model_name='person',
+            name='cargos_historial',
+        ),
+        migrations.RemoveField(
+            model_name='person',
+            name='in_bormes',
+        ),
+        migrations.RemoveField(
+            model_name='person',
+            name='in_companies',
+        ),
+    ]
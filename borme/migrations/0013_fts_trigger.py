@@ -0,0 +1,75 @@
+# Generated by Django 2.0.3 on 2018-06-27 09:41
+
+import django.contrib.postgres.search
+from django.db import DatabaseError, migrations, transaction
+
+# Configuración de búsqueda de texto completo de document: la española sin
+# acentos si se puede instalar la extensión unaccent y la española si no.
+# Las consultas usan siempre el nombre libreborme
+# (borme.utils.postgres.FTS_CONFIG)
+
+UNACCENT_SQL = """
+    ALTER TEXT SEARCH CONFIGURATION libreborme
+    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem"""
+
+# document se calcula al insertar una fila o al cambiar su nombre
+TRIGGER_SQL = """
+    CREATE FUNCTION borme_document_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.document := to_tsvector('libreborme', COALESCE(NEW.name, ''));
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER borme_company_document
+    BEFORE INSERT OR UPDATE OF name ON borme_company
+    FOR EACH ROW EXECUTE PROCEDURE borme_document_update();
+
+    CREATE TRIGGER borme_person_document
+    BEFORE INSERT OR UPDATE OF name ON borme_person
+    FOR EACH ROW EXECUTE PROCEDURE borme_document_update();"""
+
+DROP_TRIGGER_SQL = """
+    DROP TRIGGER borme_person_document ON borme_person;
+    DROP TRIGGER borme_company_document ON borme_company;
+    DROP FUNCTION borme_document_update();"""
+
+
+def create_config(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE TEXT SEARCH CONFIGURATION libreborme '
+                       '(COPY = spanish)')
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+                cursor.execute(UNACCENT_SQL)
+        except DatabaseError:
+            # Sin permisos o sin el paquete contrib de PostgreSQL
+            pass
+
+
+def drop_config(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TEXT SEARCH CONFIGURATION libreborme')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0012_remove_history_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_config, drop_config),
+        migrations.RunSQL(TRIGGER_SQL, DROP_TRIGGER_SQL),
+        migrations.AlterField(
+            model_name='company',
+            name='document',
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='document',
+            field=django.contrib.postgres.search.SearchVectorField(null=True),
+        ),
+    ]
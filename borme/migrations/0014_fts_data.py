@@ -0,0 +1,43 @@
+# Generated by Django 2.0.3 on 2018-06-27 09:43
+
+from django.db import migrations
+
+# Vuelve a calcular document con la nueva configuración por lotes, como
+# 0011_history_data: cada lote es una única sentencia que se confirma por
+# separado
+BATCH_SIZE = 5000
+
+UPDATE_SQL = """
+    WITH batch AS (
+        SELECT slug FROM {table}
+        WHERE slug > %s ORDER BY slug LIMIT %s),
+    updated AS (
+        UPDATE {table} AS t
+        SET document = to_tsvector('libreborme', COALESCE(t.name, ''))
+        FROM batch WHERE t.slug = batch.slug)
+    SELECT max(slug) FROM batch"""
+
+
+def update_documents(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table in ('borme_company', 'borme_person'):
+            sql = UPDATE_SQL.format(table=table)
+            last = ''
+            while True:
+                cursor.execute(sql, [last, BATCH_SIZE])
+                last = cursor.fetchone()[0]
+                if last is None:
+                    break
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('borme', '0013_fts_trigger'),
+    ]
+
+    operations = [
+        migrations.RunPython(update_documents, migrations.RunPython.noop),
+    ]
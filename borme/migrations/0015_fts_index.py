@@ -0,0 +1,22 @@
+# Generated by Django 2.0.3 on 2018-06-27 09:45
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0014_fts_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['document'], name='borme_company_document_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['document'], name='borme_person_document_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.0.3 on 2018-07-02 10:12
+
+from django.db import migrations
+
+# La importación actualiza las filas con todos sus campos, también name:
+# document solo se recalcula si el nombre cambia de verdad o si se guarda
+# vacío (save() de una instancia que no lo ha leído de la BD)
+TRIGGER_SQL = """
+    DROP TRIGGER borme_company_document ON borme_company;
+    DROP TRIGGER borme_person_document ON borme_person;
+
+    CREATE TRIGGER borme_company_document
+    BEFORE INSERT ON borme_company
+    FOR EACH ROW EXECUTE PROCEDURE borme_document_update();
+
+    CREATE TRIGGER borme_company_document_name
+    BEFORE UPDATE OF name ON borme_company
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name OR NEW.document IS NULL)
+    EXECUTE PROCEDURE borme_document_update();
+
+    CREATE TRIGGER borme_person_document
+    BEFORE INSERT ON borme_person
+    FOR EACH ROW EXECUTE PROCEDURE borme_document_update();
+
+    CREATE TRIGGER borme_person_document_name
+    BEFORE UPDATE OF name ON borme_person
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name OR NEW.document IS NULL)
+    EXECUTE PROCEDURE borme_document_update();"""
+
+REVERSE_TRIGGER_SQL = """
+    DROP TRIGGER borme_person_document_name ON borme_person;
+    DROP TRIGGER borme_person_document ON borme_person;
+    DROP TRIGGER borme_company_document_name ON borme_company;
+    DROP TRIGGER borme_company_document ON borme_company;
+
+    CREATE TRIGGER borme_company_document
+    BEFORE INSERT OR UPDATE OF name ON borme_company
+    FOR EACH ROW EXECUTE PROCEDURE borme_document_update();
+
+    CREATE TRIGGER borme_person_document
+    BEFORE INSERT OR UPDATE OF name ON borme_person
+    FOR EACH ROW EXECUTE PROCEDURE borme_document_update();"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borme', '0015_fts_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(TRIGGER_SQL, REVERSE_TRIGGER_SQL),
+    ]
@@ -4,12 +4,18 @@ from django.utils.text import slugify
 from django.urls import reverse
 # from django.core.exceptions import FieldError
 from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.conf import settings
 
 from django.db import models as m
+from django.db import transaction
 from bormeparser.sociedad import SOCIEDADES as SOCIEDADES_DICT
 
+from collections import deque
+
+from .utils.postgres import bulk_upsert
+
 SOCIEDADES = sorted(SOCIEDADES_DICT.items())
 
 """
@@ -21,6 +27,348 @@ PROVINCES = (
 )
 """
 
+def fullname(name, type):
+    """ Nombre completo de una sociedad (ver Company.fullname) """
+    return '%s %s' % (name.title(), type)
+
+
+def _json_key(item):
+    """ Clave hashable de un elemento de una lista JSON """
+    if isinstance(item, dict):
+        return tuple(sorted((k, _json_key(v)) for k, v in item.items()))
+    if isinstance(item, list):
+        return tuple(_json_key(v) for v in item)
+    return item
+
+
+def get_cargos_page(queryset, actuales, offset, limit):
+    """ Ordena y pagina en la BD un QuerySet de Cargo
+
+    Los cargos actuales se ordenan por fecha de nombramiento y los pasados
+    por fecha de cese. Si limit es 0 se devuelven todos.
+
+    :rtype: (list [borme.models.Cargo], bool show_more)
+    """
+    if actuales:
+        queryset = queryset.filter(date_to__isnull=True) \
+                           .order_by('date_from', 'id')
+    else:
+        queryset = queryset.filter(date_to__isnull=False) \
+                           .order_by('date_to', 'id')
+    queryset = queryset.select_related('company', 'holder_person',
+                                       'holder_company') \
+                       .only('title', 'date_from', 'date_to',
+                             'company', 'company__name', 'company__type',
+                             'holder_person', 'holder_person__name',
+                             'holder_company', 'holder_company__name',
+                             'holder_company__type')
+
+    if limit == 0:
+        return list(queryset), False
+
+    cargos = list(queryset[offset:offset+limit+1])
+    return cargos[:limit], len(cargos) > limit
+
+
+class JsonAppendMixin(object):
+    """ Añadir elementos a los campos JSON sin leerlos de la BD.
+
+    Si un campo JSON se ha diferido al cargar la instancia (QuerySet.defer()),
+    los elementos que se añaden quedan pendientes en json_appends y la
+    importación los escribe en la BD con un upsert que los concatena al
+    documento existente (borme.utils.postgres.bulk_upsert). Solo se lee el
+    documento si hace falta buscar en él, por ejemplo al cesar un cargo.
+
+    Las listas sin elementos repetidos (unique=True) se acompañan de un
+    conjunto con sus elementos, así que cada inserción es O(1) aunque la
+    lista tenga miles. Los contadores de JSON_COUNTERS se guardan en la BD
+    con la longitud de su lista (ver update_counters()).
+    """
+
+    # {contador: campo JSON}
+    JSON_COUNTERS = {}
+
+    @property
+    def json_appends(self):
+        """ {field: [item]} """
+        return self.__dict__.setdefault('_json_appends', {})
+
+    def _append_json(self, field, item, unique=False):
+        if field in self.get_deferred_fields():
+            items = self.json_appends.setdefault(field, [])
+        else:
+            items = getattr(self, field)
+        if not unique:
+            items.append(item)
+            return
+        keys = self._json_keys(field, items)
+        key = _json_key(item)
+        if key not in keys:
+            keys.add(key)
+            items.append(item)
+
+    def _json_keys(self, field, items):
+        """ Conjunto de los elementos de la lista items del campo field
+
+        Se construye la primera vez y se reutiliza mientras el campo siga
+        siendo la misma lista.
+        """
+        sets = self.__dict__.setdefault('_json_sets', {})
+        if field not in sets or sets[field][0] is not items:
+            sets[field] = (items, set(_json_key(item) for item in items))
+        return sets[field][1]
+
+    def _replace_json(self, field, value):
+        """ Sustituye el campo JSON por otra lista con los mismos elementos,
+        sin volver a construir su conjunto """
+        sets = self.__dict__.get('_json_sets', {})
+        if field in sets:
+            sets[field] = (value, sets[field][1])
+        setattr(self, field, value)
+
+    def _get_json(self, field):
+        """ Devuelve el campo JSON, leyéndolo de la BD si estaba diferido """
+        value = getattr(self, field)
+        value.extend(self.json_appends.pop(field, []))
+        return value
+
+    def update_counters(self):
+        """ Actualiza los contadores de los campos JSON cargados. Los de
+        campos diferidos los calcula la BD al guardar (bulk_upsert). """
+        deferred = self.get_deferred_fields()
+        for counter, field in self.JSON_COUNTERS.items():
+            if field not in deferred:
+                setattr(self, counter, len(getattr(self, field)))
+
+    def prepare_save(self):
+        """ Hay que llamarlo antes de guardar la instancia """
+        self.update_counters()
+
+
+class CargosIndexMixin(JsonAppendMixin):
+    """ Índice (name, title) → posiciones de los cargos vigentes.
+
+    Durante una importación (ver index_cargos()) cada cese encuentra el
+    cargo que cierra en tiempo constante: el índice se construye una vez por
+    campo y el cargo cesado deja un hueco (None) en la lista en vez de
+    desplazar los siguientes. compact_cargos() quita los huecos antes de
+    guardar, así que la lista guardada es la misma que sin índice.
+
+    Fuera de una importación se recorre la lista como siempre.
+    """
+
+    def index_cargos(self):
+        """ Activa el índice de cargos vigentes """
+        self.__dict__.setdefault('_cargos_indexes', {})
+
+    def _cargos_index(self, field):
+        indexes = self.__dict__.get('_cargos_indexes')
+        if indexes is None or field in self.get_deferred_fields():
+            return None
+        if field not in indexes:
+            index = {}
+            for n, cargo in enumerate(getattr(self, field)):
+                if cargo is not None:
+                    key = (cargo['name'], cargo['title'])
+                    index.setdefault(key, deque()).append(n)
+            indexes[field] = index
+        return indexes[field]
+
+    def _add_cargo_actual(self, field, cargo):
+        index = self._cargos_index(field)
+        if index is None:
+            self._append_json(field, cargo)
+            return
+        cargos = getattr(self, field)
+        index.setdefault((cargo['name'], cargo['title']),
+                         deque()).append(len(cargos))
+        cargos.append(cargo)
+
+    def _pop_cargo_actual(self, field, name, title):
+        """ Quita de los cargos vigentes el primero con ese nombre y título
+
+        :rtype: dict o None si no hay ninguno
+        """
+        index = self._cargos_index(field)
+        if index is None:
+            cargos = self._get_json(field)
+            for cargo in cargos:
+                if cargo['name'] == name and cargo['title'] == title:
+                    cargos.remove(cargo)
+                    return cargo
+            return None
+
+        positions = index.get((name, title))
+        if not positions:
+            return None
+        cargos = getattr(self, field)
+        n = positions.popleft()
+        cargo = cargos[n]
+        cargos[n] = None
+        return cargo
+
+    def _get_json(self, field):
+        """ Devuelve el campo JSON sin huecos """
+        self._compact_cargos(field)
+        return super(CargosIndexMixin, self)._get_json(field)
+
+    def _compact_cargos(self, field):
+        indexes = self.__dict__.get('_cargos_indexes')
+        if indexes and indexes.pop(field, None) is not None:
+            setattr(self, field, [cargo for cargo in getattr(self, field)
+                                  if cargo is not None])
+
+    def compact_cargos(self):
+        """ Quita los huecos que dejan los ceses """
+        for field in list(self.__dict__.get('_cargos_indexes', ())):
+            self._compact_cargos(field)
+
+    def prepare_save(self):
+        self.compact_cargos()
+        super(CargosIndexMixin, self).prepare_save()
+
+
+def history_field(name):
+    """ Campo JSON del historial de la entidad (ver HistoryMixin) """
+    def fget(self):
+        return getattr(self._history(), name)
+
+    def fset(self, value):
+        setattr(self._history(), name, value)
+
+    return property(fget, fset)
+
+
+class HistoryMixin(object):
+    """ Historial de la entidad en una tabla aparte.
+
+    Las listas JSON que solo crecen (HISTORY_FIELDS: BORMEs, anuncios,
+    cargos pasados...) se guardan en una tabla relacionada uno a uno
+    (CompanyHistory, PersonHistory). La fila de la entidad queda con los
+    campos escalares, los contadores y los cargos vigentes, así que leerla o
+    actualizarla no arrastra las listas.
+
+    Las listas se siguen usando como atributos de la entidad
+    (company.in_bormes), pero se leen de la BD la primera vez que se accede
+    a una de ellas, salvo que se haya usado select_related('history').
+    La importación no las lee (defer_history()): los elementos añadidos se
+    concatenan en la BD con save_history(), que también actualiza los
+    contadores de JSON_COUNTERS.
+    """
+
+    HISTORY_FIELDS = ()
+
+    def _cached_history(self):
+        """ Historial cargado o None """
+        return self._meta.get_field('history').get_cached_value(self, None)
+
+    def _history(self):
+        """ Devuelve el historial. Si no está cargado se lee de la BD, salvo
+        en una entidad nueva, que lo crea vacío. """
+        history = self._cached_history()
+        if history is None:
+            if self._state.adding:
+                history = self._meta.get_field('history').related_model()
+                self.history = history
+            else:
+                history = self.history
+        return history
+
+    def defer_history(self):
+        """ Asocia a la entidad su historial sin leerlo de la BD. Lo que se
+        añade a sus listas queda pendiente hasta save_history(). """
+        model = self._meta.get_field('history').related_model
+        self.history = model.from_db(self._state.db, [model._meta.pk.attname],
+                                     [self.pk])
+
+    def _append_json(self, field, item, unique=False):
+        if field in self.HISTORY_FIELDS:
+            self._history()._append_json(field, item, unique)
+        else:
+            super(HistoryMixin, self)._append_json(field, item, unique)
+
+    def _get_json(self, field):
+        if field in self.HISTORY_FIELDS:
+            return self._history()._get_json(field)
+        return super(HistoryMixin, self)._get_json(field)
+
+    def update_counters(self):
+        """ Actualiza los contadores de las listas del historial cargadas """
+        history = self._cached_history()
+        if history is None:
+            return
+        deferred = history.get_deferred_fields()
+        for counter, field in self.JSON_COUNTERS.items():
+            if field not in deferred:
+                setattr(self, counter, len(getattr(history, field)))
+
+    def prepare_save(self):
+        super(HistoryMixin, self).prepare_save()
+        history = self._cached_history()
+        if history is not None:
+            history.pk = self.pk
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            save_history([self])
+            super(HistoryMixin, self).save(*args, **kwargs)
+
+
+def save_history(objs, batch_size=500):
+    """ Guarda el historial de varias entidades de un mismo modelo
+
+    Se escribe con bulk_upsert el de las entidades nuevas y el que se ha
+    cargado o tiene elementos pendientes de añadir a sus listas. Los
+    contadores de las entidades (JSON_COUNTERS) pasan a ser la longitud de
+    las listas guardadas, así que hay que guardarlas después.
+
+    :type objs: list [borme.models.Company] o list [borme.models.Person]
+    """
+    pending = []
+    for obj in objs:
+        if obj._state.adding:
+            history = obj._history()
+        else:
+            history = obj._cached_history()
+        if history is None:
+            continue
+        history.pk = obj.pk
+        if history._state.adding or history.json_appends or \
+                len(history.get_deferred_fields()) < len(obj.HISTORY_FIELDS):
+            pending.append((obj, history))
+    if not pending:
+        return
+
+    obj, history = pending[0]
+    lengths = bulk_upsert([history for _, history in pending],
+                          obj.HISTORY_FIELDS,
+                          unique_fields=history.UNIQUE_FIELDS,
+                          lengths=set(obj.JSON_COUNTERS.values()),
+                          batch_size=batch_size)
+    for obj, history in pending:
+        for counter, field in obj.JSON_COUNTERS.items():
+            setattr(obj, counter, lengths[obj.pk][field])
+        history.json_appends.clear()
+        history._state.adding = False
+
+
+class SummaryQuerySet(m.QuerySet):
+    """ QuerySet de Person y Company con una proyección ligera """
+
+    def summary(self, *fields):
+        """ Carga solo los campos de SUMMARY_FIELDS del modelo (nombre,
+        slug, contadores...), sin los campos JSON. Es lo que necesitan las
+        páginas que solo muestran el nombre y el enlace.
+
+        Se pueden pedir más campos, por ejemplo summary('nif'), también del
+        historial: summary('history__in_bormes'). Los demás se leen de la BD
+        al acceder a ellos, con una consulta por instancia.
+        """
+        queryset = self
+        if any(field.startswith('history__') for field in fields):
+            queryset = queryset.select_related('history')
+        return queryset.only(*(self.model.SUMMARY_FIELDS + fields))
+
 
 class Borme(m.Model):
     """ Edicion de BORME """
@@ -34,6 +382,7 @@ class Borme(m.Model):
     section = m.CharField(max_length=20)
     # pages = IntegerField()
     anuncios = JSONField(default=list)
+    actos = JSONField(default=dict)  # {acto: número de anuncios}
 
     @property
     def total_anuncios(self):
@@ -46,44 +395,63 @@ class Borme(m.Model):
         return self.cve
 
 
-class Person(m.Model):
+class Person(HistoryMixin, CargosIndexMixin, m.Model):
     """ Persona """
     name = m.CharField(max_length=200, db_index=True)
     slug = m.SlugField(max_length=200, primary_key=True)
-    in_companies = JSONField(default=list)
-    in_bormes = JSONField(default=list)
+    total_companies = m.IntegerField(default=0)
+    total_bormes = m.IntegerField(default=0)
 
     date_updated = m.DateField(db_index=True)
     cargos_actuales = JSONField(default=list)
-    cargos_historial = JSONField(default=list)
 
-    document = SearchVectorField(null=True, db_index=True)
+    # Lo calcula un trigger de la BD a partir de name (migración 0013)
+    document = SearchVectorField(null=True)
+
+    # Campos de PersonHistory
+    in_companies = history_field('in_companies')
+    in_bormes = history_field('in_bormes')
+    cargos_historial = history_field('cargos_historial')
+
+    HISTORY_FIELDS = ('in_companies', 'in_bormes', 'cargos_historial')
+
+    JSON_COUNTERS = {'total_companies': 'in_companies',
+                     'total_bormes': 'in_bormes'}
+
+    # Campos de Person.objects.summary()
+    SUMMARY_FIELDS = ('slug', 'name', 'date_updated', 'total_companies',
+                      'total_bormes')
+
+    objects = SummaryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['document'], name='borme_person_document_idx'),
+        ]
 
     # last access
     # number of visits
 
     def add_in_companies(self, company):
-        if company not in self.in_companies:
-            self.in_companies.append(company)
+        self._append_json('in_companies', company, unique=True)
 
     def add_in_bormes(self, borme):
-        if borme not in self.in_bormes:
-            self.in_bormes.append(borme)
+        self._append_json('in_bormes', borme, unique=True)
 
     def update_cargos_entrantes(self, cargos):
         """ cargos = [dict] """
-        self.cargos_actuales.extend(cargos)
+        for cargo in cargos:
+            self._add_cargo_actual('cargos_actuales', cargo)
 
     def update_cargos_salientes(self, cargos):
         """ cargos = [dict] """
 
         for cargo in cargos:
-            for cargo_a in self.cargos_actuales:
-                if all(cargo[k] == cargo_a[k] for k in ('name', 'title')):
-                    self.cargos_actuales.remove(cargo_a)
-                    cargo['date_from'] = cargo_a['date_from']
-                    break
-            self.cargos_historial.append(cargo)
+            cargo_a = self._pop_cargo_actual('cargos_actuales',
+                                             cargo['name'], cargo['title'])
+            if cargo_a is not None:
+                cargo['date_from'] = cargo_a['date_from']
+            self._append_json('cargos_historial', cargo)
 
     def _cesar_cargo(self, company, date):
         """ Se llama a este método cuando una sociedad se extingue.
@@ -92,58 +460,43 @@ class Person(m.Model):
         company: str
         date: str iso format
         """
-        for cargo in self.cargos_actuales:
-            if cargo['name'] == company:
-                self.cargos_actuales.remove(cargo)
-                cargo['date_to'] = date
-                self.cargos_historial.append(cargo)
+        cargos_actuales = self._get_json('cargos_actuales')
+        cesados = [cargo for cargo in cargos_actuales
+                   if cargo['name'] == company]
+        if not cesados:
+            return
+        cargos_actuales[:] = [cargo for cargo in cargos_actuales
+                              if cargo['name'] != company]
+        for cargo in cesados:
+            cargo['date_to'] = date
+            self._append_json('cargos_historial', cargo)
 
     def get_cargos_actuales(self, offset=0, limit=settings.CARGOS_LIMIT):
-        """ Devuelve el listado de cargos actuales de una sociedad y si hace
+        """ Devuelve el listado de cargos actuales de una persona y si hace
         falta mostrar más (paginación)
 
         :rtype: (list, bool)
         """
-        cargos = self.cargos_actuales.copy()
-        cargos = [dict(item, **{'type': 'company'}) for item in cargos]
-        cargos = sorted(cargos, key=lambda k: k['date_from'])
-
-        if limit == 0:
-            limit = len(cargos)
-        show_more = offset+limit < len(cargos)
-
-        return cargos[offset:offset+limit], show_more
+        return self._get_cargos(True, offset, limit)
 
     def get_cargos_historial(self, offset=0, limit=settings.CARGOS_LIMIT):
-        """ Devuelve el listado de cargos pasados de una sociedad y si hace
+        """ Devuelve el listado de cargos pasados de una persona y si hace
         falta mostrar más (paginación)
 
         :rtype: (list, bool)
         """
-        cargos = self.cargos_historial.copy()
-        cargos = [dict(item, **{'type': 'company'}) for item in cargos]
-        cargos = sorted(cargos, key=lambda k: k['date_to'])
-
-        if limit == 0:
-            limit = len(cargos)
-        show_more = offset+limit < len(cargos)
+        return self._get_cargos(False, offset, limit)
 
-        return cargos[offset:offset+limit], show_more
-
-    @property
-    def total_companies(self):
-        return len(self.in_companies)
-
-    @property
-    def total_bormes(self):
-        return len(self.in_bormes)
-
-    @property
-    def todos_cargos(self):
-        return self.cargos_actuales + self.cargos_historial
+    def _get_cargos(self, actuales, offset, limit):
+        queryset = Cargo.objects.filter(holder_person=self)
+        cargos, show_more = get_cargos_page(queryset, actuales, offset, limit)
+        cargos = [dict(cargo.as_dict(cargo.company.fullname), type='company')
+                  for cargo in cargos]
+        return cargos, show_more
 
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
+        self.prepare_save()
         super(Person, self).save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -153,7 +506,7 @@ class Person(m.Model):
         return self.name
 
 
-class Company(m.Model):
+class Company(HistoryMixin, CargosIndexMixin, m.Model):
     """ Sociedad """
     name = m.CharField(max_length=260, db_index=True)
     nif = m.CharField(max_length=10)
@@ -164,65 +517,106 @@ class Company(m.Model):
     type = m.CharField(max_length=50, choices=SOCIEDADES)
 
     date_updated = m.DateField(db_index=True)
-    in_bormes = JSONField(default=list)
-    anuncios = JSONField(default=list)
+    total_bormes = m.IntegerField(default=0)
+    total_anuncios = m.IntegerField(default=0)
 
     cargos_actuales_p = JSONField(default=list)
     cargos_actuales_c = JSONField(default=list)
-    cargos_historial_p = JSONField(default=list)
-    cargos_historial_c = JSONField(default=list)
 
-    document = SearchVectorField(null=True, db_index=True)
+    # Lo calcula un trigger de la BD a partir de name (migración 0013)
+    document = SearchVectorField(null=True)
 
-    def add_in_bormes(self, borme):
-        if borme not in self.in_bormes:
-            self.in_bormes.append(borme)
+    # Campos de CompanyHistory
+    in_bormes = history_field('in_bormes')
+    anuncios = history_field('anuncios')
+    cargos_historial_p = history_field('cargos_historial_p')
+    cargos_historial_c = history_field('cargos_historial_c')
 
-    @property
-    def total_anuncios(self):
-        return len(self.anuncios)
+    HISTORY_FIELDS = ('in_bormes', 'anuncios', 'cargos_historial_p',
+                      'cargos_historial_c')
 
-    @property
-    def total_bormes(self):
-        return len(self.in_bormes)
+    JSON_COUNTERS = {'total_bormes': 'in_bormes',
+                     'total_anuncios': 'anuncios'}
+
+    # Campos de Company.objects.summary()
+    SUMMARY_FIELDS = ('slug', 'name', 'type', 'is_active', 'date_updated',
+                      'total_bormes', 'total_anuncios')
+
+    objects = SummaryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['document'], name='borme_company_document_idx'),
+        ]
+
+    def add_in_bormes(self, borme):
+        self._append_json('in_bormes', borme, unique=True)
+
+    def add_anuncio(self, anuncio):
+        """ anuncio = {"year": int, "id": int} """
+        self._append_json('anuncios', anuncio)
 
     @property
     def fullname(self):
-        return '%s %s' % (self.name.title(), self.type)
+        return fullname(self.name, self.type)
 
     def get_cargos_actuales(self, offset=0, limit=settings.CARGOS_LIMIT):
-        cargos_p = self.cargos_actuales_p.copy()
-        cargos_c = self.cargos_actuales_c.copy()
-        cargos_p = [dict(item, **{'type': 'person'}) for item in cargos_p]
-        cargos_c = [dict(item, **{'type': 'company'}) for item in cargos_c]
-        cargos = sorted(cargos_p + cargos_c, key=lambda k: k['date_from'])
+        """ Devuelve el listado de cargos actuales de una sociedad y si hace
+        falta mostrar más (paginación)
 
-        if limit == 0:
-            limit = len(cargos)
-        show_more = offset+limit < len(cargos)
+        Incluye los cargos que ocupan otras personas y sociedades en esta
+        sociedad y los que ocupa esta sociedad en otras.
 
-        return cargos[offset:offset+limit], show_more
+        :rtype: (list, bool)
+        """
+        return self._get_cargos(True, offset, limit)
 
     def get_cargos_historial(self, offset=0, limit=settings.CARGOS_LIMIT):
-        cargos_p = self.cargos_historial_p.copy()
-        cargos_c = self.cargos_historial_c.copy()
-        cargos_p = [dict(item, **{'type': 'person'}) for item in cargos_p]
-        cargos_c = [dict(item, **{'type': 'company'}) for item in cargos_c]
-        cargos = sorted(cargos_p + cargos_c, key=lambda k: k['date_to'])
+        """ Devuelve el listado de cargos pasados de una sociedad y si hace
+        falta mostrar más (paginación)
 
-        if limit == 0:
-            limit = len(cargos)
-        show_more = offset+limit < len(cargos)
+        :rtype: (list, bool)
+        """
+        return self._get_cargos(False, offset, limit)
 
-        return cargos[offset:offset+limit], show_more
+    def _get_cargos(self, actuales, offset, limit):
+        queryset = Cargo.objects.filter(m.Q(company=self) |
+                                        m.Q(holder_company=self))
+        cargos, show_more = get_cargos_page(queryset, actuales, offset, limit)
 
-    @property
-    def todos_cargos_c(self):
-        return self.cargos_actuales_c + self.cargos_historial_c
+        result = []
+        for cargo in cargos:
+            if cargo.company_id != self.slug:
+                result.append(dict(cargo.as_dict(cargo.company.fullname),
+                                   type='company'))
+            elif cargo.holder_person_id:
+                result.append(dict(cargo.as_dict(cargo.holder_person.name),
+                                   type='person'))
+            else:
+                result.append(dict(
+                    cargo.as_dict(cargo.holder_company.fullname),
+                    type='company'))
+        return result, show_more
 
-    @property
-    def todos_cargos_p(self):
-        return self.cargos_actuales_p + self.cargos_historial_p
+    def get_cargo_names(self):
+        """ Nombres de las personas y sociedades con las que ha tenido algún
+        cargo, sin repetir
+
+        :rtype: (list persons, list companies)
+        """
+        persons = Cargo.objects.filter(company=self,
+                                       holder_person__isnull=False) \
+                               .values_list('holder_person__name', flat=True) \
+                               .distinct()
+        holders = Cargo.objects.filter(company=self,
+                                       holder_company__isnull=False) \
+                               .values_list('holder_company__name',
+                                            'holder_company__type')
+        companies = Cargo.objects.filter(holder_company=self) \
+                                 .values_list('company__name', 'company__type')
+        companies = holders.union(companies)
+        return (sorted(persons),
+                sorted(fullname(name, type) for name, type in companies))
 
     # last access
     # number of visits
@@ -234,6 +628,7 @@ class Company(m.Model):
         # if self.name.endswith('SOCIEDAD LIMITADA'): ...
 
         self.slug = slugify(self.name)
+        self.prepare_save()
         super(Company, self).save(*args, **kwargs)
 
     def update_cargos_entrantes(self, cargos):
@@ -243,10 +638,10 @@ class Company(m.Model):
             cargo_embed = cargo.copy()
             if cargo_embed['type'] == 'company':
                 del cargo_embed['type']
-                self.cargos_actuales_c.append(cargo_embed)
+                self._add_cargo_actual('cargos_actuales_c', cargo_embed)
             elif cargo_embed['type'] == 'person':
                 del cargo_embed['type']
-                self.cargos_actuales_p.append(cargo_embed)
+                self._add_cargo_actual('cargos_actuales_p', cargo_embed)
 
     def update_cargos_salientes(self, cargos):
         """ cargos = [dict] """
@@ -254,34 +649,34 @@ class Company(m.Model):
         for cargo in cargos:
             cargo_embed = cargo.copy()
             if cargo_embed['type'] == 'company':
-                del cargo_embed['type']
-                for cargo_a in self.cargos_actuales_c:
-                    if all(cargo[k] == cargo_a[k] for k in ('name', 'title')):
-                        self.cargos_actuales_c.remove(cargo_a)
-                        cargo_embed['date_from'] = cargo_a['date_from']
-                        break
-                self.cargos_historial_c.append(cargo_embed)
+                suffix = 'c'
             elif cargo_embed['type'] == 'person':
-                del cargo_embed['type']
-                for cargo_a in self.cargos_actuales_p:
-                    if all(cargo[k] == cargo_a[k] for k in ('name', 'title')):
-                        self.cargos_actuales_p.remove(cargo_a)
-                        cargo_embed['date_from'] = cargo_a['date_from']
-                        break
-                self.cargos_historial_p.append(cargo_embed)
+                suffix = 'p'
             else:
                 raise ValueError('type: invalid value')
 
+            del cargo_embed['type']
+            cargo_a = self._pop_cargo_actual('cargos_actuales_' + suffix,
+                                             cargo['name'], cargo['title'])
+            if cargo_a is not None:
+                cargo_embed['date_from'] = cargo_a['date_from']
+            self._append_json('cargos_historial_' + suffix, cargo_embed)
+
     def _cesar_cargo(self, company, date):
         """
             company: str
             date: str iso format
         """
-        for cargo in self.cargos_actuales_c:
-            if cargo['name'] == company:
-                self.cargos_actuales_c.remove(cargo)
-                cargo['date_to'] = date
-                self.cargos_historial_c.append(cargo)
+        cargos_actuales_c = self._get_json('cargos_actuales_c')
+        cesados = [cargo for cargo in cargos_actuales_c
+                   if cargo['name'] == company]
+        if not cesados:
+            return
+        cargos_actuales_c[:] = [cargo for cargo in cargos_actuales_c
+                                if cargo['name'] != company]
+        for cargo in cesados:
+            cargo['date_to'] = date
+            self._append_json('cargos_historial_c', cargo)
 
     def get_absolute_url(self):
         return reverse('borme-empresa', args=[str(self.slug)])
@@ -290,6 +685,37 @@ class Company(m.Model):
         return self.fullname
 
 
+class CompanyHistory(JsonAppendMixin, m.Model):
+    """ Historial de una sociedad (ver HistoryMixin) """
+    company = m.OneToOneField('Company', on_delete=m.CASCADE,
+                              primary_key=True, related_name='history')
+    in_bormes = JSONField(default=list)
+    anuncios = JSONField(default=list)
+    cargos_historial_p = JSONField(default=list)
+    cargos_historial_c = JSONField(default=list)
+
+    # Listas en las que no se repiten elementos
+    UNIQUE_FIELDS = ('in_bormes',)
+
+    class Meta:
+        db_table = 'borme_company_history'
+
+
+class PersonHistory(JsonAppendMixin, m.Model):
+    """ Historial de una persona (ver HistoryMixin) """
+    person = m.OneToOneField('Person', on_delete=m.CASCADE,
+                             primary_key=True, related_name='history')
+    in_companies = JSONField(default=list)
+    in_bormes = JSONField(default=list)
+    cargos_historial = JSONField(default=list)
+
+    # Listas en las que no se repiten elementos
+    UNIQUE_FIELDS = ('in_companies', 'in_bormes')
+
+    class Meta:
+        db_table = 'borme_person_history'
+
+
 class Anuncio(m.Model):
     id_anuncio = m.IntegerField()
     year = m.IntegerField()
@@ -315,9 +741,109 @@ class Anuncio(m.Model):
                     self.id_anuncio, self.year, len(self.actos.keys()))
 
 
+class Cargo(m.Model):
+    """ Cargo de una persona o sociedad en una sociedad
+
+    Cada fila es un periodo en el cargo: date_to es None mientras está
+    vigente. Si el BORME publica el cese de un cargo cuyo nombramiento no
+    consta, date_from es None. anuncio es el anuncio que crea la fila.
+
+    Los campos JSON cargos_* de Company y Person se siguen manteniendo como
+    caché de compatibilidad, pero las vistas leen de esta tabla.
+    """
+    company = m.ForeignKey('Company', on_delete=m.PROTECT, db_index=False,
+                           related_name='cargos')
+    holder_person = m.ForeignKey('Person', on_delete=m.PROTECT, null=True,
+                                 db_index=False, related_name='cargos')
+    holder_company = m.ForeignKey('Company', on_delete=m.PROTECT, null=True,
+                                  db_index=False,
+                                  related_name='cargos_holder')
+    title = m.CharField(max_length=100)
+    date_from = m.DateField(null=True)
+    date_to = m.DateField(null=True)
+    anuncio = m.ForeignKey('Anuncio', on_delete=m.PROTECT, null=True)
+
+    class Meta:
+        indexes = [
+            m.Index(fields=['company', 'date_to', 'date_from'],
+                    name='borme_cargo_company_idx'),
+            m.Index(fields=['holder_person', 'date_to', 'date_from'],
+                    name='borme_cargo_person_idx'),
+            m.Index(fields=['holder_company', 'date_to', 'date_from'],
+                    name='borme_cargo_holder_idx'),
+        ]
+
+    @property
+    def holder(self):
+        return self.holder_person or self.holder_company
+
+    @property
+    def holder_id(self):
+        return self.holder_person_id or self.holder_company_id
+
+    def as_dict(self, name):
+        """ Formato de los cargos en los campos JSON, con el nombre de la
+        otra parte del cargo
+
+        :rtype: dict
+        """
+        cargo = {'title': self.title, 'name': name}
+        if self.date_from:
+            cargo['date_from'] = self.date_from.isoformat()
+        if self.date_to:
+            cargo['date_to'] = self.date_to.isoformat()
+        return cargo
+
+    def __str__(self):
+        return '%s: %s (%s)' % (self.company_id, self.title, self.holder_id)
+
+
+class BormeStats(m.Model):
+    """ Resumen de los BORMEs publicados en un periodo
+
+    Lo actualiza la importación (ver borme.parser.stats) y se puede
+    regenerar con updatestats.
+    """
+    bormes = m.IntegerField(default=0)
+    anuncios = m.IntegerField(default=0)
+    new_companies = m.IntegerField(default=0)
+    extinctions = m.IntegerField(default=0)
+    actos = JSONField(default=dict)  # {acto: número de anuncios}
+
+    class Meta:
+        abstract = True
+
+
+class BormeStatsDay(BormeStats):
+    """ Resumen de los BORMEs de un día """
+    date = m.DateField(primary_key=True)
+
+    class Meta:
+        db_table = 'borme_stats_day'
+
+    def __str__(self):
+        return '%s: %d anuncios' % (self.date, self.anuncios)
+
+
+class BormeStatsProvinceYear(BormeStats):
+    """ Resumen de los BORMEs de una provincia en un año """
+    province = m.CharField(max_length=100)
+    year = m.IntegerField()
+
+    class Meta:
+        db_table = 'borme_stats_province_year'
+        unique_together = ['province', 'year']
+
+    def __str__(self):
+        return '%s %d: %d anuncios' % (self.province, self.year,
+                                       self.anuncios)
+
+
 class Config(m.Model):
     last_modified = m.DateTimeField()
     version = m.CharField(max_length=50)
+    # Cambia cada vez que se importa un BORME nuevo (ver borme.calendar)
+    bormes_version = m.IntegerField(default=0)
 
 
 class BormeLog(m.Model):
@@ -386,6 +912,20 @@ def person_get_or_create(nombre):
     return person, created
 
 
+def build_borme(_borme):
+    """Crea una instancia de Borme sin guardarla en la BD.
+
+    :param _borme: Instancia BORME
+    :type _borme: bormeparser.Borme
+    :rtype: borme.models.Borme
+    """
+    return Borme(cve=_borme.cve, date=_borme.date, url=_borme.url,
+                 from_reg=_borme.anuncios_rango[0],
+                 until_reg=_borme.anuncios_rango[1],
+                 province=_borme.provincia.name,
+                 section=_borme.seccion)
+
+
 def borme_get_or_create(_borme):
     """Devuelve una instancia de Borme.
 
@@ -400,11 +940,7 @@ def borme_get_or_create(_borme):
         borme = Borme.objects.get(cve=_borme.cve)
         created = False
     except Borme.DoesNotExist:
-        borme = Borme(cve=_borme.cve, date=_borme.date, url=_borme.url,
-                      from_reg=_borme.anuncios_rango[0],
-                      until_reg=_borme.anuncios_rango[1],
-                      province=_borme.provincia.name,
-                      section=_borme.seccion)
+        borme = build_borme(_borme)
         borme.save()
         # year, type, from_page, until_page, pages, num?, filename?
         created = True
@@ -412,6 +948,20 @@ def borme_get_or_create(_borme):
     return borme, created
 
 
+def get_imported_cves(date_from, date_to):
+    """Devuelve los CVEs de los BORMEs ya importados en un rango de fechas.
+
+    :param date_from: Fecha desde
+    :param date_to: Fecha hasta
+    :type date_from: datetime.date
+    :type date_to: datetime.date
+    :rtype: set
+    """
+    return set(BormeLog.objects.filter(parsed=True,
+                                       borme__date__range=(date_from, date_to))
+                               .values_list('borme__cve', flat=True))
+
+
 def bormelog_get_or_create(_borme, filename):
     """Devuelve una instancia de BormeLog.
 
@@ -434,10 +984,11 @@ def bormelog_get_or_create(_borme, filename):
 
 def get_borme_urls_from_slug(slug):
     try:
-        entity = Person.objects.get(slug=slug)
+        entity = Person.objects.summary('history__in_bormes').get(slug=slug)
     except Person.DoesNotExist:
         try:
-            entity = Company.objects.get(slug=slug)
+            entity = Company.objects.summary('history__in_bormes') \
+                                    .get(slug=slug)
         except Company.DoesNotExist:
             return []
 
@@ -1,36 +1,58 @@
-from borme.models import Company, Person
 from borme.utils.strings import slug2
 
+from .unitofwork import UnitOfWork
 
-def extinguir_sociedad(company, date):
+
+def extinguir_sociedad(company, date, uow=None):
     """Marca en la BD una sociedad como extinguida.
 
     Se llama a esta función cuando una sociedad se extingue.
     Todos los cargos vigentes pasan a la lista de cargos cesados (historial).
-    Modifica los modelos Company y Person.
+    Modifica los modelos Company, Person y Cargo.
     company: Company object
 
+    Los cargos se cierran en memoria y se guardan con el resto del BORME en
+    el flush() de la unidad de trabajo. Las sociedades y personas que los
+    ocupan se cargan de una vez al empezar el BORME
+    (IdentityMap.load_officers()), así que no se consulta la BD por cada una.
+
     :param date: Fecha de la extinción
+    :param uow: Unidad de trabajo del BORME que se está importando. Si no se
+                indica, los cambios se guardan inmediatamente.
     :type date: datetime.date
+    :type uow: borme.parser.unitofwork.UnitOfWork
     """
+    standalone = uow is None
+    if standalone:
+        uow = UnitOfWork(date.year)
+        uow.companies.setdefault(company.slug, company)
+        uow.load_officers([company.slug])
+
     company.is_active = False
     company.date_extinction = date
     company.date_updated = date
+    date_to = date.isoformat()
 
-    for cargo in company.cargos_actuales_c:
-        cargo['date_to'] = date.isoformat()
-        company.cargos_historial_c.append(cargo)
-        c_cesada = Company.objects.get(slug=slug2(cargo['name']))
-        c_cesada._cesar_cargo(company.fullname, date.isoformat())
-        c_cesada.save()
+    for cargo in company._get_json('cargos_actuales_c'):
+        cargo['date_to'] = date_to
+        company._append_json('cargos_historial_c', cargo)
+        c_cesada = uow.get_company(slug2(cargo['name']))
+        if c_cesada is company:
+            continue
+        c_cesada._cesar_cargo(company.fullname, date_to)
+        uow.register_dirty(c_cesada)
 
-    for cargo in company.cargos_actuales_p:
-        cargo['date_to'] = date.isoformat()
-        company.cargos_historial_p.append(cargo)
-        p_cesada = Person.objects.get(slug=slug2(cargo['name']))
-        p_cesada._cesar_cargo(company.fullname, date.isoformat())
-        p_cesada.save()
+    for cargo in company._get_json('cargos_actuales_p'):
+        cargo['date_to'] = date_to
+        company._append_json('cargos_historial_p', cargo)
+        p_cesada = uow.get_person(slug2(cargo['name']))
+        p_cesada._cesar_cargo(company.fullname, date_to)
+        uow.register_dirty(p_cesada)
 
     company.cargos_actuales_c = []
     company.cargos_actuales_p = []
-    company.save()
+    uow.register_dirty(company)
+    uow.extinguir_cargos(company, date)
+
+    if standalone:
+        uow.flush()
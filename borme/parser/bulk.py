@@ -0,0 +1,428 @@
+from django.contrib.postgres.fields import JSONField
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from collections import OrderedDict
+
+import datetime
+import json
+import logging
+import os
+import time
+
+import bormeparser
+
+from borme.calendar import invalidate_calendar_index
+from borme.models import (
+        Anuncio,
+        Borme,
+        BormeLog,
+        Cargo,
+        Company,
+        CompanyHistory,
+        JsonAppendMixin,
+        Person,
+        PersonHistory,
+        build_borme,
+)
+from borme.utils.postgres import (
+        copy_objects,
+        create_indexes,
+        drop_indexes,
+        reset_sequence,
+)
+
+from .importer import _from_anuncios, _parse_files, _parse_func_name
+from .path import get_borme_json_path
+from .stats import rebuild_stats
+from .sumario import SumarioIndex
+from .unitofwork import UnitOfWork
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ch = logging.StreamHandler()
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+# Orden de escritura, respetando las claves ajenas
+MODELS = (Borme, Company, CompanyHistory, Person, PersonHistory, Anuncio,
+          Cargo, BormeLog)
+
+
+def _is_valid(obj):
+    """Comprueba que los campos de texto caben en sus columnas"""
+    for field in obj._meta.concrete_fields:
+        if not isinstance(field, models.CharField) or not field.max_length:
+            continue
+        value = getattr(obj, field.attname)
+        if value is not None and len(value) > field.max_length:
+            return False
+    return True
+
+
+def _reload_json(obj):
+    """Copia los campos JSON de una entidad como si se leyeran de la BD.
+
+    Durante la importación varias entidades pueden compartir los mismos
+    diccionarios de cargos. En la importación incremental cada BORME vuelve a
+    leer las entidades de la BD y deja de compartirlos; aquí se consigue lo
+    mismo serializando cada campo.
+    """
+    for field in obj._meta.concrete_fields:
+        if isinstance(field, JSONField):
+            value = getattr(obj, field.attname)
+            value = json.loads(json.dumps(value, cls=field.encoder))
+            if isinstance(obj, JsonAppendMixin):
+                obj._replace_json(field.attname, value)
+            else:
+                setattr(obj, field.attname, value)
+
+
+class BulkSession(UnitOfWork):
+    """Importación en memoria de un rango de BORMEs.
+
+    Sustituye a la unidad de trabajo de cada BORME en la carga inicial de una
+    BD vacía: todas las entidades se quedan en memoria entre un BORME y el
+    siguiente y flush() no escribe en la BD, solo reproduce lo que haría la
+    importación incremental (descartar las entidades que no se pueden
+    guardar, numerar los anuncios). Al final write() lo guarda todo con COPY.
+    """
+
+    def __init__(self):
+        super(BulkSession, self).__init__(None)
+        self.bormes = []
+        self.borme_logs = []
+        self.cves = set()
+        self.cargo_rows = []
+        self.next_anuncio_id = 1
+        self.next_cargo_id = 1
+
+    def load(self, company_slugs, person_slugs, anuncio_ids):
+        """La BD está vacía: todas las entidades están ya en memoria."""
+
+    def anuncio_get_or_create(self, anuncio, year, borme):
+        """Devuelve una instancia de Anuncio.
+
+        Los anuncios de todos los años comparten el mapa, así que la clave
+        incluye el año.
+
+        :rtype: (borme.models.Anuncio, bool anuncio created)
+        """
+        try:
+            nuevo_anuncio = self.anuncios[(year, anuncio.id)]
+        except KeyError:
+            nuevo_anuncio = Anuncio(
+                            id_anuncio=anuncio.id,
+                            year=year,
+                            borme=borme,
+                            datos_registrales=anuncio.datos_registrales)
+            self.anuncios[(year, anuncio.id)] = nuevo_anuncio
+            self._added(self.anuncios, (year, anuncio.id))
+            return nuevo_anuncio, True
+        self._touch(nuevo_anuncio)
+        return nuevo_anuncio, False
+
+    def get_company(self, slug):
+        """Devuelve la sociedad con el slug indicado.
+
+        Lanza Company.DoesNotExist si no existe.
+        """
+        try:
+            company = self.companies[slug]
+        except KeyError:
+            raise Company.DoesNotExist(slug)
+        self._touch(company)
+        return company
+
+    def get_person(self, slug):
+        """Devuelve la persona con el slug indicado.
+
+        Lanza Person.DoesNotExist si no existe.
+        """
+        try:
+            person = self.persons[slug]
+        except KeyError:
+            raise Person.DoesNotExist(slug)
+        self._touch(person)
+        return person
+
+    def load_cargos(self, company_slugs):
+        """Todos los cargos vigentes están ya en memoria, también los que
+        ocupan las sociedades que se extinguen, así que flush() no tiene que
+        cerrar ninguno en la BD.
+        """
+        for slug in company_slugs:
+            self.cargos.setdefault(slug, OrderedDict())
+
+    def flush(self):
+        """Da por guardadas las entidades modificadas en el BORME.
+
+        Las entidades nuevas que la BD rechazaría se descartan y cuentan como
+        errores, igual que en UnitOfWork.flush().
+
+        :rtype: int errors
+        """
+        errors = 0
+        dropped = set()
+        for model in (Company, Person, Anuncio, Cargo):
+            for obj in self.dirty[model].values():
+                if not obj._state.adding:
+                    continue
+                if model is Anuncio and id(obj.company) in dropped:
+                    valid = False
+                elif model is Cargo and dropped & {id(obj.company),
+                                                   id(obj.holder),
+                                                   id(obj.anuncio)}:
+                    valid = False
+                else:
+                    valid = _is_valid(obj)
+                if not valid:
+                    logger.error("[X] ERROR saving {} {}".format(
+                                 model.__name__, obj.pk))
+                    dropped.add(id(obj))
+                    errors += 1
+                    if model is Cargo and obj.date_to is None:
+                        self.remove_cargo(obj)
+                    continue
+
+                if model is Anuncio:
+                    obj.id = self.next_anuncio_id
+                    self.next_anuncio_id += 1
+                elif model is Cargo:
+                    obj.id = self.next_cargo_id
+                    self.next_cargo_id += 1
+                    self.cargo_rows.append(obj)
+                else:
+                    # Se guarda con la entidad en write()
+                    obj._history()._state.adding = False
+                obj._state.adding = False
+
+        for model in (Company, Person, Anuncio, Cargo):
+            for obj in self.dirty[model].values():
+                if id(obj) not in dropped:
+                    if model in (Company, Person):
+                        obj.prepare_save()
+                        _reload_json(obj._history())
+                    elif model is Anuncio:
+                        obj.company_id = obj.company.pk
+                    elif model is Cargo and obj.anuncio is not None:
+                        obj.anuncio_id = obj.anuncio.pk
+                    _reload_json(obj)
+
+        # Las entidades nuevas que no se han llegado a guardar no existen
+        for entities in (self.companies, self.persons, self.anuncios):
+            for key, obj in list(entities.items()):
+                if obj._state.adding:
+                    del entities[key]
+
+        for dirty in self.dirty.values():
+            dirty.clear()
+        self.extinguidas.clear()
+        return errors
+
+    def add_borme(self, nuevo_borme, filename, errors):
+        """Añade un BORME importado y su BormeLog."""
+        now = timezone.now()
+        _reload_json(nuevo_borme)
+        self.bormes.append(nuevo_borme)
+        self.cves.add(nuevo_borme.cve)
+        self.borme_logs.append(BormeLog(borme=nuevo_borme, path=filename,
+                                        parsed=True, errors=errors,
+                                        date_created=now, date_updated=now,
+                                        date_parsed=now))
+
+    def write(self):
+        """Guarda todas las entidades en la BD con COPY.
+
+        Los índices que no respaldan una restricción se borran antes de la
+        carga y se crean de nuevo al final, y después se regeneran las tablas
+        de estadísticas. Todo se hace en una única transacción.
+
+        :rtype: dict {model: número de filas}
+        """
+        objects = {
+            Borme: self.bormes,
+            Company: self.companies.values(),
+            CompanyHistory: [c._history() for c in self.companies.values()],
+            Person: self.persons.values(),
+            PersonHistory: [p._history() for p in self.persons.values()],
+            Anuncio: sorted(self.anuncios.values(), key=lambda a: a.id),
+            Cargo: self.cargo_rows,
+            BormeLog: self.borme_logs,
+        }
+
+        counts = {}
+        with transaction.atomic():
+            indexes = []
+            for model in MODELS:
+                indexes.extend(drop_indexes(model._meta.db_table))
+
+            for model in MODELS:
+                start_time = time.time()
+                counts[model] = copy_objects(model, objects[model])
+                logger.info("{}: {} rows in {:.2f} seconds".format(
+                            model.__name__, counts[model],
+                            time.time() - start_time))
+
+            # Comprueba ya las claves ajenas: no se pueden crear índices en
+            # tablas con comprobaciones pendientes
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+            start_time = time.time()
+            create_indexes(indexes)
+            logger.info("Indexes: {} created in {:.2f} seconds".format(
+                        len(indexes), time.time() - start_time))
+            reset_sequence(Anuncio)
+            reset_sequence(Cargo)
+
+            start_time = time.time()
+            rebuild_stats()
+            logger.info("Stats: rebuilt in {:.2f} seconds".format(
+                        time.time() - start_time))
+        return counts
+
+
+def check_empty_database():
+    """Lanza ValueError si alguna de las tablas de la carga tiene datos."""
+    for model in MODELS:
+        if model.objects.exists():
+            raise ValueError('Table {} is not empty. Bulk import is only '
+                             'allowed on an empty database'
+                             .format(model._meta.db_table))
+
+
+def _get_files_list(date, index):
+    """Obtiene los BORME-JSON de un día.
+
+    Si el índice de sumarios tiene la fecha se usa el orden del sumario, que
+    es el de la importación incremental. Si no, el del nombre de archivo.
+
+    :rtype: list [filepath]
+    """
+    json_path = get_borme_json_path(date)
+    try:
+        filenames = [filename for filename in os.listdir(json_path)
+                     if filename.endswith('.json')]
+    except FileNotFoundError:
+        return []
+
+    entry = index.get(date)
+    if entry is not None:
+        order = {cve: n for n, cve in enumerate(entry.get_cves())}
+        filenames.sort(key=lambda f: (order.get(f[:-5], len(order)), f))
+    else:
+        filenames.sort()
+    return [os.path.join(json_path, filename) for filename in filenames]
+
+
+def _from_instance(borme, session):
+    """Importa una instancia bormeparser.Borme en la sesión.
+
+    Es el equivalente en memoria de borme.parser.importer._from_instance().
+
+    :type borme: bormeparser.Borme
+    :type session: borme.parser.bulk.BulkSession
+    :rtype: dict
+    """
+    results = {
+        'created_anuncios': 0,
+        'created_bormes': 0,
+        'created_companies': 0,
+        'created_persons': 0,
+        'total_anuncios': 0,
+        'total_bormes': 0,
+        'total_companies': 0,
+        'total_persons': 0,
+        'errors': 0
+    }
+
+    if borme.cve in session.cves:
+        logger.warn('%s ya ha sido analizado.' % borme.cve)
+        return results
+
+    nuevo_borme = build_borme(borme)
+    results['created_bormes'] += 1
+
+    _from_anuncios(borme, nuevo_borme, session, results)
+    results['errors'] += session.flush()
+    session.add_borme(nuevo_borme, borme.filename, results['errors'])
+    return results
+
+
+def import_borme_bulk(date_from, date_to, seccion=bormeparser.SECCION.A,
+                      parse_executor=None):
+    """Carga en una BD vacía los BORME-JSON de un rango de fechas.
+
+    Recorre los BORME-JSON en orden de fecha, acumula en memoria el
+    historial de cargos de todas las sociedades y personas, y escribe cada
+    tabla una sola vez con COPY. El resultado es el mismo que el de la
+    importación incremental de los mismos archivos, pero sin índice de
+    ElasticSearch, que hay que regenerar después.
+
+    :param date_from: Fecha desde la que importar
+    :param date_to: Fecha hasta la que importar
+    :param seccion: Seccion del BORME
+    :param parse_executor: Pool de procesos para analizar los archivos
+    :type date_from: datetime.date
+    :type date_to: datetime.date
+    :type seccion: bormeparser.SECCION
+    :type parse_executor: concurrent.futures.Executor
+    :rtype: dict
+    """
+    check_empty_database()
+
+    total_results = {
+        'created_anuncios': 0,
+        'created_bormes': 0,
+        'created_companies': 0,
+        'created_persons': 0,
+        'total_anuncios': 0,
+        'total_bormes': 0,
+        'total_companies': 0,
+        'total_persons': 0,
+        'errors': 0
+    }
+    start_time = time.time()
+
+    index = SumarioIndex()
+    session = BulkSession()
+    date = date_from
+    while date <= date_to:
+        files_list = _get_files_list(date, index)
+        date += datetime.timedelta(days=1)
+        if not files_list:
+            continue
+
+        bormes = []
+        for filepath, borme, e in _parse_files(files_list, seccion,
+                                               parse_executor):
+            if e is not None:
+                logger.error("[X] Error grave (I) en {func}(): {path}"
+                             .format(func=_parse_func_name(filepath),
+                                     path=filepath))
+                logger.error("[X] {}: {}".format(e.__class__.__name__, e))
+                continue
+            bormes.append(borme)
+
+        for borme in bormes:
+            logger.info("{} ({} anuncios)".format(
+                        borme.cve, len(borme.get_anuncios())))
+            total_results['total_bormes'] += 1
+            total_results['total_anuncios'] += len(borme.get_anuncios())
+            results = _from_instance(borme, session)
+            for key in total_results.keys():
+                total_results[key] += results[key]
+
+    logger.info("Parsed in %.2f seconds" % (time.time() - start_time))
+    session.write()
+    invalidate_calendar_index()
+
+    logger.info("\nBORMEs creados: {created_bormes}/{total_bormes}\n"
+                "Anuncios creados: {created_anuncios}/{total_anuncios}\n"
+                "Empresas creadas: {created_companies}/{total_companies}\n"
+                "Personas creadas: {created_persons}/{total_persons}"
+                .format(**total_results))
+    logger.info("Total elapsed time: %.2f seconds" % (time.time() - start_time))
+    return total_results
@@ -0,0 +1,82 @@
+from django.conf import settings
+
+import logging
+import os
+import pkg_resources
+
+import bormeparser
+
+from .downloader import sha256sum
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ch = logging.StreamHandler()
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+PARSER_VERSION = pkg_resources.get_distribution('bormeparser').version
+
+
+def get_cache_filepath(checksum, version=PARSER_VERSION):
+    """Ruta del BORME-JSON en caché de un BORME-PDF.
+
+    Las entradas se agrupan por versión de bormeparser, de forma que al
+    actualizarlo se ignoran las generadas por versiones anteriores.
+
+    :param checksum: Suma SHA-256 del BORME-PDF
+    :param version: Versión de bormeparser
+    :type checksum: str
+    :type version: str
+    :rtype: str
+    """
+    return os.path.join(settings.BORME_CACHE_ROOT, version, checksum[:2],
+                        '%s.json' % checksum)
+
+
+def parse_pdf(filepath, seccion=bormeparser.SECCION.A, url=None):
+    """Convierte un archivo BORME-PDF en una instancia Borme usando la caché.
+
+    Si el mismo PDF ya se analizó con la misma versión de bormeparser se
+    carga su BORME-JSON de la caché. Si no, se analiza y se guarda en ella.
+
+    La URL del BORME se guarda en la entrada si se conoce, para no tener que
+    buscarla en el BOE al importar. La que se indica (la del sumario cuando
+    se descarga el PDF) tiene preferencia sobre la de la entrada.
+
+    :param filepath: Archivo BORME-PDF
+    :param seccion: Sección del BORME
+    :param url: URL del BORME-PDF
+    :type filepath: str
+    :type seccion: bormeparser.SECCION
+    :type url: str
+    :rtype: bormeparser.Borme
+    """
+    cache_filepath = get_cache_filepath(sha256sum(filepath))
+
+    if os.path.exists(cache_filepath):
+        logger.debug('Cache hit: %s' % filepath)
+        borme = bormeparser.Borme.from_json(cache_filepath)
+        borme.filename = filepath
+        if url:
+            borme._url = url
+        return borme
+
+    logger.debug('Cache miss: %s' % filepath)
+    borme = bormeparser.parse(filepath, seccion)
+    if url:
+        borme._url = url
+
+    try:
+        os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+        # Se escribe en un archivo temporal para que otro proceso no pueda
+        # leer una entrada a medias. La URL solo si ya se conoce: buscarla
+        # requiere conexión.
+        partial_filepath = '%s.%d.part' % (cache_filepath, os.getpid())
+        borme.to_json(partial_filepath, include_url=bool(borme._url))
+        os.replace(partial_filepath, cache_filepath)
+    except Exception as e:
+        logger.warning('[X] Could not cache %s' % filepath)
+        logger.warning('[X] %s: %s' % (e.__class__.__name__, e))
+
+    return borme
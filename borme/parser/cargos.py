@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.utils.text import slugify
+
+from bormeparser.regex import is_acto_cargo_entrante
+
+from borme.models import Anuncio, Cargo, Company, Person
+from borme.utils.strings import slug2
+
+from .unitofwork import UnitOfWork
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ch = logging.StreamHandler()
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+BATCH_SIZE = 5000
+
+
+def _sorted_actos(actos):
+    """Ordena los actos de un anuncio para aplicarlos.
+
+    Anuncio.actos es JSONB y no conserva el orden del BORME: se aplican
+    primero los ceses, después los nombramientos y por último la extinción,
+    que es el orden en que aparecen en los anuncios.
+
+    :rtype: list [(str acto, value)]
+    """
+    def key(item):
+        name, value = item
+        if not isinstance(value, list):
+            return 2
+        return 1 if is_acto_cargo_entrante(name) else 0
+    return sorted(actos.items(), key=key)
+
+
+def _import_batch(rows):
+    """Aplica los actos de un lote de anuncios a la tabla Cargo.
+
+    :param rows: [(anuncio id, company slug, fecha del BORME, actos)]
+    :rtype: int errors
+    """
+    company_slugs = set()
+    person_slugs = set()
+    for _, slug_c, _, actos in rows:
+        company_slugs.add(slug_c)
+        for value in actos.values():
+            if not isinstance(value, list):
+                continue
+            for cargo in value:
+                if cargo['type'] == 'company':
+                    company_slugs.add(slug2(cargo['name']))
+                else:
+                    person_slugs.add(slugify(cargo['name']))
+
+    # Solo se necesitan las claves: basta con instancias sin cargar
+    companies = {slug: Company(slug=slug) for slug in Company.objects
+                 .filter(slug__in=company_slugs)
+                 .values_list('slug', flat=True)}
+    persons = {slug: Person(slug=slug) for slug in Person.objects
+               .filter(slug__in=person_slugs)
+               .values_list('slug', flat=True)}
+
+    uow = UnitOfWork(None)
+    uow.load_cargos(set(slug_c for _, slug_c, _, _ in rows))
+    for anuncio_id, slug_c, date, actos in rows:
+        company = companies[slug_c]
+        anuncio = Anuncio(id=anuncio_id)
+        for name, value in _sorted_actos(actos):
+            if not isinstance(value, list):
+                if name == 'Extinción':
+                    uow.extinguir_cargos(company, date)
+                continue
+
+            for cargo in value:
+                if cargo['type'] == 'company':
+                    holder = companies.get(slug2(cargo['name']))
+                else:
+                    holder = persons.get(slugify(cargo['name']))
+                if holder is None:
+                    logger.warn('[{}] {} no existe'.format(anuncio_id,
+                                                           cargo['name']))
+                    continue
+
+                if is_acto_cargo_entrante(name):
+                    uow.cargo_entrante(company, holder, cargo['title'], date,
+                                       anuncio)
+                else:
+                    uow.cargo_saliente(company, holder, cargo['title'], date,
+                                       anuncio)
+
+    errors = uow.flush()
+    if errors:
+        logger.error('[X] {} errores al guardar el lote'.format(errors))
+    return errors
+
+
+def rebuild_cargos(batch_size=BATCH_SIZE):
+    """Regenera la tabla Cargo a partir de los actos de los anuncios.
+
+    Sirve para rellenar la tabla en una BD importada antes de que existiera.
+    Los anuncios se recorren en orden de fecha del BORME y de importación y
+    se aplican por lotes, con una consulta por tabla en cada lote. Todo se
+    hace en una única transacción.
+
+    :rtype: (int número de cargos, int errors)
+    """
+    with transaction.atomic():
+        Cargo.objects.all().delete()
+
+        anuncios = Anuncio.objects.order_by('borme__date', 'id') \
+                                  .values_list('id', 'company_id',
+                                               'borme__date', 'actos')
+        rows = []
+        total = 0
+        errors = 0
+        for row in anuncios.iterator():
+            rows.append(row)
+            if len(rows) == batch_size:
+                errors += _import_batch(rows)
+                total += len(rows)
+                logger.info('{} anuncios ({})'.format(total, row[2]))
+                rows = []
+        if rows:
+            errors += _import_batch(rows)
+
+    return Cargo.objects.count(), errors
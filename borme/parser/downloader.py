@@ -0,0 +1,243 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ch = logging.StreamHandler()
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+# Descargas simultáneas (y conexiones abiertas con el servidor)
+DOWNLOAD_WORKERS = 4
+
+# Reintentos por archivo y espera antes del primero, que se duplica en cada
+# reintento
+RETRIES = 3
+BACKOFF = 1.0
+
+TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+
+# Sumas SHA-256 de los archivos descargados en cada directorio, en el formato
+# de sha256sum
+CHECKSUMS_FILENAME = 'SHA256SUMS'
+
+
+class DownloadError(Exception):
+    pass
+
+
+def sha256sum(filepath):
+    """Calcula la suma SHA-256 de un archivo.
+
+    :rtype: str
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def read_checksums(path):
+    """Lee el archivo de sumas SHA-256 de un directorio.
+
+    :rtype: dict {filename: checksum}
+    """
+    checksums = {}
+    try:
+        with open(os.path.join(path, CHECKSUMS_FILENAME)) as fp:
+            for line in fp:
+                checksum, filename = line.rstrip('\n').split('  ', 1)
+                checksums[filename] = checksum
+    except FileNotFoundError:
+        pass
+    return checksums
+
+
+def write_checksums(path, checksums):
+    """Escribe el archivo de sumas SHA-256 de un directorio"""
+    filepath = os.path.join(path, CHECKSUMS_FILENAME)
+    with open(filepath + '.part', 'w') as fp:
+        for filename in sorted(checksums):
+            fp.write('{}  {}\n'.format(checksums[filename], filename))
+    os.replace(filepath + '.part', filepath)
+
+
+class BormeDownloader(object):
+    """Descarga concurrente de archivos BORME-PDF.
+
+    Las descargas se reparten entre workers hilos que comparten una sesión
+    HTTP, de forma que se reutilizan hasta workers conexiones keep-alive.
+
+    Cada archivo se descarga primero a un archivo .part y solo se mueve a su
+    ruta definitiva si su tamaño coincide con el del sumario. Su suma SHA-256
+    se anota en el archivo SHA256SUMS del directorio. Un archivo que ya está
+    en disco con el tamaño y la suma anotada correctos no se vuelve a
+    descargar. Los descargados antes de que existiera SHA256SUMS no tienen
+    suma anotada: si su tamaño coincide con el del sumario se dan por buenos
+    y se anota su suma.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, retries=RETRIES,
+                 backoff=BACKOFF, timeout=TIMEOUT, stats=None):
+        """
+        :param workers: Número de descargas simultáneas
+        :param retries: Reintentos por archivo antes de fallar
+        :param backoff: Segundos de espera antes del primer reintento
+        :param timeout: Timeout de las peticiones HTTP
+        :param stats: Si se indica, se registra en él cada descarga
+        :type workers: int
+        :type retries: int
+        :type backoff: float
+        :type timeout: float
+        :type stats: borme.parser.pipeline.StageStats
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stats = stats
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        self._checksums = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+    def get_files(self, bxml, path, seccion):
+        """Obtiene los archivos BORME-PDF de un sumario.
+
+        :param bxml: Sumario BORME-XML
+        :param path: Directorio donde guardar los archivos
+        :param seccion: Sección del BORME
+        :type bxml: bormeparser.BormeXML
+        :type path: str
+        :type seccion: bormeparser.SECCION
+        :rtype: list [(filepath, url, size)] en el orden del sumario
+        """
+        cves = bxml.get_cves(seccion)
+        if isinstance(cves, str):
+            # get_cves() devuelve una cadena si solo hay un CVE
+            cves = [cves]
+        urls = bxml.get_urls_cve(seccion)
+        sizes = bxml.get_sizes(seccion)
+
+        return [(os.path.join(path, '%s.pdf' % cve), urls[cve],
+                 sizes.get(cve))
+                for cve in cves]
+
+    def download_borme(self, bxml, path, seccion):
+        """Descarga los archivos BORME-PDF de un sumario.
+
+        :rtype: list [filepath] en el orden del sumario
+        """
+        futures = [self.submit(url, filepath, size)
+                   for filepath, url, size in self.get_files(bxml, path,
+                                                             seccion)]
+        return [future.result() for future in futures]
+
+    def submit(self, url, filepath, size=None):
+        """Programa la descarga de un archivo.
+
+        :param size: Tamaño esperado en bytes, si se conoce
+        :rtype: concurrent.futures.Future que devuelve filepath
+        """
+        return self.executor.submit(self._fetch, url, filepath, size)
+
+    def is_downloaded(self, filepath, size=None):
+        """Comprueba si el archivo ya está descargado y es correcto"""
+        if not os.path.exists(filepath):
+            return False
+        if size is not None and os.path.getsize(filepath) != size:
+            return False
+
+        path, filename = os.path.split(filepath)
+        checksum = self._get_checksums(path).get(filename)
+        if checksum is None:
+            if size is None:
+                return False
+            self._set_checksum(filepath, sha256sum(filepath))
+            return True
+        return checksum == sha256sum(filepath)
+
+    def _fetch(self, url, filepath, size):
+        if self.is_downloaded(filepath, size):
+            logger.debug('%s already downloaded' % os.path.basename(filepath))
+            return filepath
+
+        for attempt in range(self.retries + 1):
+            try:
+                self._download(url, filepath, size)
+                return filepath
+            except (requests.RequestException, DownloadError) as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * 2 ** attempt
+                logger.warning('[X] Error downloading %s (%s: %s). '
+                               'Retrying in %.1f seconds'
+                               % (url, e.__class__.__name__, e, wait))
+                time.sleep(wait)
+
+    def _download(self, url, filepath, size):
+        start_time = time.time()
+        partial_filepath = filepath + '.part'
+        sha256 = hashlib.sha256()
+        nbytes = 0
+
+        req = self.session.get(url, stream=True, timeout=self.timeout)
+        try:
+            req.raise_for_status()
+            with open(partial_filepath, 'wb') as fp:
+                for chunk in req.iter_content(chunk_size=CHUNK_SIZE):
+                    fp.write(chunk)
+                    sha256.update(chunk)
+                    nbytes += len(chunk)
+        finally:
+            req.close()
+
+        if size is not None and nbytes != size:
+            os.unlink(partial_filepath)
+            raise DownloadError('Expected {} bytes, got {}'
+                                .format(size, nbytes))
+
+        os.replace(partial_filepath, filepath)
+        self._set_checksum(filepath, sha256.hexdigest())
+
+        if self.stats:
+            self.stats.add(time.time() - start_time, nbytes=nbytes)
+        logger.info('Downloaded %s' % os.path.basename(filepath))
+
+    def _get_checksums(self, path):
+        with self._lock:
+            if path not in self._checksums:
+                self._checksums[path] = read_checksums(path)
+            return self._checksums[path]
+
+    def _set_checksum(self, filepath, checksum):
+        path, filename = os.path.split(filepath)
+        checksums = self._get_checksums(path)
+        with self._lock:
+            checksums[filename] = checksum
+            write_checksums(path, checksums)
@@ -0,0 +1,385 @@
+from django.utils.text import slugify
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import partial
+
+import copy
+
+from bormeparser.borme import BormeActoCargo
+from bormeparser.regex import is_company, regex_empresa_tipo
+
+from borme.models import Anuncio, Cargo, Company, HistoryMixin, Person
+from borme.utils.strings import slug2
+
+
+def collect_borme_keys(borme):
+    """Recorre una instancia BORME y obtiene las claves de sus entidades.
+
+    Devuelve los slugs de todas las sociedades y personas que aparecen en el
+    BORME (como sociedad del anuncio o como cargo), los ids de sus anuncios y
+    los slugs de las sociedades que se extinguen.
+
+    :param borme: Instancia BORME
+    :type borme: bormeparser.Borme
+    :rtype: (set company slugs, set person slugs, set anuncio ids,
+             set extinguished company slugs)
+    """
+    company_slugs = set()
+    person_slugs = set()
+    anuncio_ids = set()
+    extinguished = set()
+
+    for anuncio in borme.get_anuncios():
+        anuncio_ids.add(anuncio.id)
+        empresa, _ = regex_empresa_tipo(anuncio.empresa)
+        slug_c = slugify(empresa)
+        company_slugs.add(slug_c)
+
+        for acto in anuncio.get_borme_actos():
+            if not isinstance(acto, BormeActoCargo):
+                if acto.name == 'Extinción':
+                    extinguished.add(slug_c)
+                continue
+            for nombres in acto.cargos.values():
+                for nombre in nombres:
+                    if is_company(nombre):
+                        empresa, _ = regex_empresa_tipo(nombre)
+                        company_slugs.add(slugify(empresa))
+                    else:
+                        person_slugs.add(slugify(nombre))
+
+    return company_slugs, person_slugs, anuncio_ids, extinguished
+
+
+def _snapshot(obj):
+    """Guarda el estado en memoria de una entidad.
+
+    Las listas del historial solo crecen, así que de ellas basta con su
+    longitud; el resto de atributos se copia.
+
+    :rtype: function que deja la entidad como estaba
+    """
+    state = copy.deepcopy({key: value for key, value in obj.__dict__.items()
+                           if key != '_state'})
+    fields_cache = dict(obj._state.fields_cache)
+    history = None
+    if isinstance(obj, HistoryMixin):
+        history = obj._cached_history()
+    if history is not None:
+        deferred = history.get_deferred_fields()
+        lengths = {field: len(getattr(history, field))
+                   for field in obj.HISTORY_FIELDS if field not in deferred}
+        appends = {field: list(items)
+                   for field, items in history.json_appends.items()}
+
+    def restore():
+        obj.__dict__ = dict(state, _state=obj._state)
+        obj._state.fields_cache = fields_cache
+        if history is None:
+            return
+        for field in obj.HISTORY_FIELDS:
+            if field in lengths:
+                del getattr(history, field)[lengths[field]:]
+            else:
+                history.__dict__.pop(field, None)
+        history.__dict__['_json_appends'] = appends
+        # Se vuelven a construir cuando hagan falta
+        history.__dict__.pop('_json_sets', None)
+
+    return restore
+
+
+class IdentityMap(object):
+    """Mapa de identidad de las entidades de un BORME.
+
+    Carga de una vez todas las sociedades, personas y anuncios que aparecen en
+    un BORME, de forma que el número de consultas de la importación depende
+    del número de tablas y no del número de nombres. Cada entidad tiene una
+    única instancia en memoria durante toda la importación del BORME.
+
+    El historial de las sociedades y personas (listas que solo crecen:
+    cargos pasados, BORMEs, anuncios) no se lee: lo que se le añade se
+    concatena en la BD (ver borme.models.HistoryMixin). Los cargos vigentes
+    sí se leen porque hay que buscar en ellos al cesar un cargo.
+
+    También guarda los cargos vigentes (borme.models.Cargo) de las
+    sociedades del BORME, por sociedad y por sociedad que ocupa el cargo, y
+    un índice (sociedad, titular, cargo) para encontrar en tiempo constante
+    el cargo que cierra un cese.
+
+    Los cambios que se hacen en memoria dentro de atomic() se deshacen si
+    el bloque lanza una excepción.
+    """
+
+    def __init__(self, year):
+        self.year = year
+        self.companies = {}
+        self.persons = {}
+        self.anuncios = {}
+        self.cargos = {}
+        self.cargos_holder = {}
+        self.cargos_index = {}
+        self._undo = None
+        self._touched = None
+
+    @classmethod
+    def from_borme(cls, borme):
+        """Crea el mapa de identidad y carga las entidades del BORME.
+
+        :param borme: Instancia BORME
+        :type borme: bormeparser.Borme
+        :rtype: borme.parser.identity.IdentityMap
+        """
+        identity = cls(borme.date.year)
+        company_slugs, person_slugs, anuncio_ids, extinguished = \
+            collect_borme_keys(borme)
+        identity.load(company_slugs, person_slugs, anuncio_ids)
+        identity.load_officers(extinguished)
+        return identity
+
+    @contextmanager
+    def atomic(self):
+        """Deshace en memoria los cambios del bloque si lanza una excepción.
+
+        Es el equivalente de transaction.atomic() para las entidades del
+        mapa, que no se escriben en la BD hasta el final: se anotan las
+        entradas añadidas al mapa y los cargos que cambian de estado, y se
+        guarda una copia de cada entidad la primera vez que se entrega. Lo
+        leído de la BD se queda en el mapa.
+        """
+        self._undo = []
+        self._touched = set()
+        try:
+            yield
+        except Exception:
+            for undo in reversed(self._undo):
+                undo()
+            raise
+        finally:
+            self._undo = self._touched = None
+
+    def _journal(self, undo, *args):
+        """Anota cómo deshacer un cambio si se está dentro de atomic()"""
+        if self._undo is not None:
+            self._undo.append(partial(undo, *args))
+
+    def _touch(self, obj):
+        """Guarda el estado de una entidad antes de que se modifique"""
+        if self._undo is not None and id(obj) not in self._touched:
+            self._touched.add(id(obj))
+            self._undo.append(_snapshot(obj))
+
+    def _added(self, entities, key):
+        """Anota una entidad nueva del mapa, que desaparece al deshacer"""
+        if self._undo is not None:
+            self._touched.add(id(entities[key]))
+            self._undo.append(partial(entities.pop, key, None))
+
+    def load(self, company_slugs, person_slugs, anuncio_ids):
+        """Carga en el mapa las entidades existentes en la BD."""
+        company_slugs = set(company_slugs) - set(self.companies)
+        if company_slugs:
+            companies = Company.objects.in_bulk(company_slugs)
+            for company in companies.values():
+                company.defer_history()
+                company.index_cargos()
+            self.companies.update(companies)
+            self.load_cargos(company_slugs)
+
+        person_slugs = set(person_slugs) - set(self.persons)
+        if person_slugs:
+            persons = Person.objects.in_bulk(person_slugs)
+            for person in persons.values():
+                person.defer_history()
+                person.index_cargos()
+            self.persons.update(persons)
+
+        anuncio_ids = set(anuncio_ids) - set(self.anuncios)
+        if anuncio_ids:
+            anuncios = Anuncio.objects.filter(year=self.year,
+                                              id_anuncio__in=anuncio_ids)
+            for anuncio in anuncios:
+                self.anuncios[anuncio.id_anuncio] = anuncio
+
+    def load_officers(self, company_slugs):
+        """Carga en el mapa las sociedades y personas con cargos vigentes en
+        las sociedades indicadas, que ya tienen que estar en el mapa.
+
+        Son las que modifica la extinción de esas sociedades
+        (borme.parser.actos.extinguir_sociedad()). Las que faltan se leen
+        con una consulta por tabla.
+        """
+        officer_companies = set()
+        officer_persons = set()
+        for slug in company_slugs:
+            company = self.companies.get(slug)
+            if company is None:
+                continue
+            officer_companies.update(slug2(cargo['name'])
+                                     for cargo in company.cargos_actuales_c
+                                     if cargo is not None)
+            officer_persons.update(slug2(cargo['name'])
+                                   for cargo in company.cargos_actuales_p
+                                   if cargo is not None)
+        self.load(officer_companies, officer_persons, ())
+
+    def load_cargos(self, company_slugs):
+        """Carga en el mapa los cargos vigentes de las sociedades."""
+        for slug in company_slugs:
+            self.cargos.setdefault(slug, OrderedDict())
+        cargos = Cargo.objects.filter(company_id__in=company_slugs,
+                                      date_to__isnull=True).order_by('id')
+        for cargo in cargos:
+            self._insert_cargo(cargo)
+
+    def add_cargo(self, cargo):
+        """Añade al mapa un cargo vigente."""
+        self._insert_cargo(cargo)
+        self._journal(self._discard_cargo, cargo)
+
+    def _insert_cargo(self, cargo):
+        self.cargos.setdefault(cargo.company_id,
+                               OrderedDict())[id(cargo)] = cargo
+        if cargo.holder_company_id:
+            self.cargos_holder.setdefault(cargo.holder_company_id,
+                                          OrderedDict())[id(cargo)] = cargo
+        self.cargos_index.setdefault(_cargo_key(cargo), deque()).append(cargo)
+
+    def _discard_cargo(self, cargo):
+        del self.cargos[cargo.company_id][id(cargo)]
+        if cargo.holder_company_id:
+            del self.cargos_holder[cargo.holder_company_id][id(cargo)]
+        self.cargos_index[_cargo_key(cargo)].remove(cargo)
+
+    def remove_cargo(self, cargo):
+        """Quita del mapa un cargo que ha dejado de estar vigente.
+
+        El índice se limpia al consultarlo (ver pop_cargo()).
+        """
+        del self.cargos[cargo.company_id][id(cargo)]
+        if cargo.holder_company_id:
+            del self.cargos_holder[cargo.holder_company_id][id(cargo)]
+        self._journal(self._restore_cargo, cargo)
+
+    def _restore_cargo(self, cargo):
+        self.cargos[cargo.company_id][id(cargo)] = cargo
+        if cargo.holder_company_id:
+            self.cargos_holder[cargo.holder_company_id][id(cargo)] = cargo
+
+    def pop_cargo(self, company, holder, title):
+        """Quita del mapa el primer cargo vigente de holder en company con
+        ese título.
+
+        :type company: borme.models.Company
+        :type holder: borme.models.Person o borme.models.Company
+        :rtype: borme.models.Cargo o None si no hay ninguno
+        """
+        cargos = self.get_cargos(company.slug)
+        if isinstance(holder, Person):
+            key = (company.slug, holder.pk, None, title)
+        else:
+            key = (company.slug, None, holder.pk, title)
+        candidates = self.cargos_index.get(key, ())
+        while candidates:
+            cargo = candidates.popleft()
+            self._journal(candidates.appendleft, cargo)
+            if id(cargo) in cargos:
+                self.remove_cargo(cargo)
+                return cargo
+        return None
+
+    def get_cargos(self, slug):
+        """Devuelve los cargos vigentes en la sociedad con el slug indicado,
+        en el orden en que se crearon.
+
+        Si no estaban en el mapa se consultan en la BD.
+
+        :rtype: OrderedDict {id(cargo): borme.models.Cargo}
+        """
+        if slug not in self.cargos:
+            self.load_cargos([slug])
+        return self.cargos[slug]
+
+    def company_get_or_create(self, empresa, tipo, slug_c):
+        """Devuelve una instancia de Company.
+
+        :rtype: (borme.models.Company, bool company created)
+        """
+        try:
+            company = self.companies[slug_c]
+        except KeyError:
+            company = Company(name=empresa, type=tipo, slug=slug_c)
+            company.index_cargos()
+            self.companies[slug_c] = company
+            self._added(self.companies, slug_c)
+            return company, True
+        self._touch(company)
+        return company, False
+
+    def person_get_or_create(self, nombre):
+        """Devuelve una instancia de Person.
+
+        :rtype: (borme.models.Person, bool person created)
+        """
+        slug_p = slugify(nombre)
+        try:
+            person = self.persons[slug_p]
+        except KeyError:
+            person = Person(name=nombre, slug=slug_p)
+            person.index_cargos()
+            self.persons[slug_p] = person
+            self._added(self.persons, slug_p)
+            return person, True
+        self._touch(person)
+        return person, False
+
+    def anuncio_get_or_create(self, anuncio, year, borme):
+        """Devuelve una instancia de Anuncio.
+
+        :rtype: (borme.models.Anuncio, bool anuncio created)
+        """
+        try:
+            nuevo_anuncio = self.anuncios[anuncio.id]
+        except KeyError:
+            nuevo_anuncio = Anuncio(
+                            id_anuncio=anuncio.id,
+                            year=year,
+                            borme=borme,
+                            datos_registrales=anuncio.datos_registrales)
+            self.anuncios[anuncio.id] = nuevo_anuncio
+            self._added(self.anuncios, anuncio.id)
+            return nuevo_anuncio, True
+        self._touch(nuevo_anuncio)
+        return nuevo_anuncio, False
+
+    def get_company(self, slug):
+        """Devuelve la sociedad con el slug indicado.
+
+        Si no estaba en el mapa se consulta en la BD.
+        Lanza Company.DoesNotExist si no existe.
+        """
+        if slug not in self.companies:
+            self.companies[slug] = Company.objects.get(slug=slug)
+            self.companies[slug].defer_history()
+            self.companies[slug].index_cargos()
+        self._touch(self.companies[slug])
+        return self.companies[slug]
+
+    def get_person(self, slug):
+        """Devuelve la persona con el slug indicado.
+
+        Si no estaba en el mapa se consulta en la BD.
+        Lanza Person.DoesNotExist si no existe.
+        """
+        if slug not in self.persons:
+            self.persons[slug] = Person.objects.get(slug=slug)
+            self.persons[slug].defer_history()
+            self.persons[slug].index_cargos()
+        self._touch(self.persons[slug])
+        return self.persons[slug]
+
+
+def _cargo_key(cargo):
+    return (cargo.company_id, cargo.holder_person_id, cargo.holder_company_id,
+            cargo.title)
@@ -1,6 +1,10 @@
 from django.conf import settings
+from django.db import connections, transaction
 from django.utils import timezone
 
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+
 import datetime
 import logging
 import time
@@ -12,16 +16,18 @@ from bormeparser.exceptions import BormeDoesntExistException
 from bormeparser.regex import is_company, is_acto_cargo_entrante
 from bormeparser.utils import FIRST_BORME
 
+from borme.calendar import invalidate_calendar_index
 from borme.models import (
-        anuncio_get_or_create,
+        Company,
         borme_get_or_create,
         bormelog_get_or_create,
-        company_get_or_create,
-        person_get_or_create,
+        get_imported_cves,
 )
 from borme.utils.strings import parse_empresa
 
 from . import actos
+from .cache import parse_pdf
+from .downloader import DOWNLOAD_WORKERS, BormeDownloader
 from .logger import (
         logger_acto,
         logger_anuncio_create,
@@ -39,6 +45,11 @@ from .path import (
         get_borme_pdf_path,
         get_borme_xml_filepath
 )
+from .pipeline import DONE, QUEUE_SIZE, Pipeline
+from .shard import create_import_executor, import_day
+from .stats import update_stats
+from .sumario import SumarioIndex
+from .unitofwork import UnitOfWork
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -47,7 +58,11 @@ ch = logging.StreamHandler()
 logger.addHandler(ch)
 logger.setLevel(logging.INFO)
 
+# Tipos de elemento en las colas del pipeline de importación
+DAY, FILE, ERROR, ABORT = range(4)
+
 
+@transaction.atomic
 def _from_instance(borme):
     """Importa en la BD una instancia bormeparser.Borme
 
@@ -55,6 +70,13 @@ def _from_instance(borme):
     anuncios, bormes) y por último crea una entrada BormeLog para marcarlo
     como parseado.
 
+    Todo el BORME se importa en una única transacción. Las entidades
+    modificadas se guardan al final con una escritura en bloque; si un
+    anuncio falla, sus cambios se deshacen en la unidad de trabajo.
+    Las sociedades y personas modificadas se indexan en Elasticsearch con
+    peticiones _bulk cuando se confirma la transacción (ver
+    UnitOfWork.flush()).
+
     :param borme: Instancia BORME que se va a importar en la BD
     :type borme: bormeparser.Borme
     """
@@ -80,6 +102,9 @@ def _from_instance(borme):
     if created:
         logger_borme_create(borme.cve)
         results['created_bormes'] += 1
+        # Después de confirmar la transacción: la fila de Config no queda
+        # bloqueada durante la importación de todo el BORME
+        transaction.on_commit(invalidate_calendar_index)
 
     # Create bormelog
 
@@ -90,95 +115,53 @@ def _from_instance(borme):
 
     borme_log.save()  # date_updated
 
-    borme_embed = {'cve': nuevo_borme.cve, 'url': nuevo_borme.url}
-    for n, anuncio in enumerate(borme.get_anuncios(), 1):
-        try:
-            logger.debug('%d: Importando anuncio: %s' % (n, anuncio))
-            results['total_companies'] += 1
+    # Carga de una vez las sociedades, personas y anuncios del BORME
+    uow = UnitOfWork.from_borme(borme)
+    _from_anuncios(borme, nuevo_borme, uow, results)
+    new_companies = [company for company in uow.dirty[Company].values()
+                     if company._state.adding]
+    results['errors'] += uow.flush()
+    nuevo_borme.save()
+    update_stats(nuevo_borme, results['created_anuncios'],
+                 sum(1 for company in new_companies
+                     if not company._state.adding))
 
-            # Create empresa
+    borme_log.errors = results['errors']
+    borme_log.parsed = True  # FIXME: Si hay ValidationError, parsed = False
+    borme_log.date_parsed = timezone.now()
+    borme_log.save()
+    return results
 
-            empresa, tipo, slug_c = parse_empresa(borme.cve, anuncio.empresa)
-            company, created = company_get_or_create(empresa, tipo, slug_c)
 
-            if created:
-                logger_empresa_create(empresa, tipo)
-                results["created_companies"] += 1
-            else:
-                if company.name != empresa:
-                    logger_empresa_similar(slug_c, company, empresa, borme.cve)
-                results["errors"] += 1
-
-            company.add_in_bormes(borme_embed)
-            company.anuncios.append({"year": borme.date.year,
-                                     "id": anuncio.id})
-            company.date_updated = borme.date
-
-            # Create anuncio
-
-            nuevo_anuncio, created = anuncio_get_or_create(anuncio,
-                                                           borme.date.year,
-                                                           nuevo_borme)
-
-            if created:
-                logger_anuncio_create(anuncio.id, empresa, tipo)
-                results['created_anuncios'] += 1
-
-            for acto in anuncio.get_borme_actos():
-                logger_acto(acto)
-
-                # Entran los siguientes actos (borme.regex.is_acto_cargo()):
-                #
-                # Revocaciones, Reelecciones, Nombramientos, Ceses/Dimisiones,
-                # Emisión de obligaciones, Modificación de poderes,
-                # Cancelaciones de oficio de nombramientos,
-                #
-                if isinstance(acto, bormeparser.borme.BormeActoCargo):
-                    lista_cargos = []
-                    for nombre_cargo, nombres in acto.cargos.items():
-                        logger_cargo(nombre_cargo, nombres)
-                        for nombre in nombres:
-                            logger.debug('  %s' % nombre)
-                            if is_company(nombre):
-                                results['total_companies'] += 1
-                                cargo, created = _load_cargo_empresa(
-                                                    nombre, borme, anuncio,
-                                                    borme_embed, nombre_cargo,
-                                                    acto, company)
-                                if created:
-                                    results["created_companies"] += 1
-                                else:
-                                    results["errors"] += 1
-                            else:
-                                results['total_persons'] += 1
-                                cargo, created = _load_cargo_person(
-                                                    nombre, borme, company,
-                                                    borme_embed, nombre_cargo,
-                                                    acto)
-                                if created:
-                                    results["created_persons"] += 1
-                                else:
-                                    results["errors"] += 1
-                            lista_cargos.append(cargo)
-
-                    nuevo_anuncio.actos[acto.name] = lista_cargos
-
-                    if is_acto_cargo_entrante(acto.name):
-                        company.update_cargos_entrantes(lista_cargos)
-                    else:
-                        company.update_cargos_salientes(lista_cargos)
-                else:
-                    # not bormeparser.borme.BormeActoCargo
-                    nuevo_anuncio.actos[acto.name] = acto.value
+def _from_anuncios(borme, nuevo_borme, uow, results):
+    """Importa los anuncios de un BORME en la unidad de trabajo.
 
-                    if acto.name == 'Extinción':
-                        actos.extinguir_sociedad(company, borme.date)
+    Un anuncio que provoca un error se cuenta en results y no se añade a
+    nuevo_borme: los cambios que había hecho en las entidades y en los
+    contadores se deshacen (UnitOfWork.atomic()). En nuevo_borme.actos se
+    guarda cuántos anuncios incluyen cada acto.
 
-            company.save()
-            nuevo_anuncio.company = company
-            nuevo_anuncio.save()
+    :param borme: Instancia BORME
+    :param nuevo_borme: Borme de la BD
+    :param uow: Unidad de trabajo del BORME
+    :param results: Contadores de la importación
+    :type borme: bormeparser.Borme
+    :type nuevo_borme: borme.models.Borme
+    :type uow: borme.parser.unitofwork.UnitOfWork
+    :type results: dict
+    """
+    borme_embed = {'cve': nuevo_borme.cve, 'url': nuevo_borme.url}
+    resumen = Counter()
+    for n, anuncio in enumerate(borme.get_anuncios(), 1):
+        counters = dict(results)
+        try:
+            logger.debug('%d: Importando anuncio: %s' % (n, anuncio))
+            with uow.atomic():
+                nuevo_anuncio = _from_anuncio(anuncio, borme, nuevo_borme,
+                                              borme_embed, uow, results)
             nuevo_borme.anuncios.append({"year": borme.date.year,
                                          "id": anuncio.id})
+            resumen.update(nuevo_anuncio.actos.keys())
 
         except Exception as e:
             logger.error("[{}] ERROR importing anuncio {}"
@@ -186,35 +169,128 @@ def _from_instance(borme):
             logger.error("[X] {classname}: {exception}"
                          .format(classname=e.__class__.__name__,
                                  exception=e))
+            results.update(counters)
             results['errors'] += 1
 
-    nuevo_borme.save()
+    nuevo_borme.actos = dict(resumen)
 
-    borme_log.errors = results['errors']
-    borme_log.parsed = True  # FIXME: Si hay ValidationError, parsed = False
-    borme_log.date_parsed = timezone.now()
-    borme_log.save()
-    return results
 
+def _from_anuncio(anuncio, borme, nuevo_borme, borme_embed, uow, results):
+    """Importa un anuncio del BORME.
 
-def import_borme_download(date_from, date_to, seccion=bormeparser.SECCION.A,
-                          local_only=False, no_missing=False):
-    """Descarga e importa BORMEs desde la web del Registro Mercantil.
+    Las entidades modificadas no se guardan aquí sino que se registran en la
+    unidad de trabajo del BORME.
 
-    Descarga BORMEs en formato PDF de la web del Registro Mercantil para
-    un rango de fechas, los convierte a formato BORME-JSON e importa los
-    datos en la BD.
+    :param anuncio: Anuncio que se va a importar
+    :param borme: Instancia BORME a la que pertenece el anuncio
+    :param nuevo_borme: Borme de la BD
+    :param borme_embed: Referencia al BORME que se guarda en las entidades
+    :param uow: Unidad de trabajo del BORME
+    :param results: Contadores de la importación
+    :type anuncio: bormeparser.borme.BormeAnuncio
+    :type borme: bormeparser.Borme
+    :type nuevo_borme: borme.models.Borme
+    :type borme_embed: dict
+    :type uow: borme.parser.unitofwork.UnitOfWork
+    :type results: dict
+    :rtype: borme.models.Anuncio
+    """
+    results['total_companies'] += 1
+
+    # Create empresa
+
+    empresa, tipo, slug_c = parse_empresa(borme.cve, anuncio.empresa)
+    company, created = uow.company_get_or_create(empresa, tipo, slug_c)
+
+    if created:
+        logger_empresa_create(empresa, tipo)
+        results["created_companies"] += 1
+    else:
+        if company.name != empresa:
+            logger_empresa_similar(slug_c, company, empresa, borme.cve)
+        results["errors"] += 1
+
+    company.add_in_bormes(borme_embed)
+    company.add_anuncio({"year": borme.date.year, "id": anuncio.id})
+    company.date_updated = borme.date
+
+    # Create anuncio
+
+    nuevo_anuncio, created = uow.anuncio_get_or_create(anuncio,
+                                                       borme.date.year,
+                                                       nuevo_borme)
+
+    if created:
+        logger_anuncio_create(anuncio.id, empresa, tipo)
+        results['created_anuncios'] += 1
+
+    for acto in anuncio.get_borme_actos():
+        logger_acto(acto)
+
+        # Entran los siguientes actos (borme.regex.is_acto_cargo()):
+        #
+        # Revocaciones, Reelecciones, Nombramientos, Ceses/Dimisiones,
+        # Emisión de obligaciones, Modificación de poderes,
+        # Cancelaciones de oficio de nombramientos,
+        #
+        if isinstance(acto, bormeparser.borme.BormeActoCargo):
+            lista_cargos = []
+            for nombre_cargo, nombres in acto.cargos.items():
+                logger_cargo(nombre_cargo, nombres)
+                # nombres es un set: se ordena para que el orden de los
+                # cargos no dependa del proceso que importa el anuncio
+                for nombre in sorted(nombres):
+                    logger.debug('  %s' % nombre)
+                    if is_company(nombre):
+                        results['total_companies'] += 1
+                        cargo, created = _load_cargo_empresa(
+                                            nombre, borme, anuncio,
+                                            borme_embed, nombre_cargo,
+                                            acto, company, nuevo_anuncio,
+                                            uow)
+                        if created:
+                            results["created_companies"] += 1
+                        else:
+                            results["errors"] += 1
+                    else:
+                        results['total_persons'] += 1
+                        cargo, created = _load_cargo_person(
+                                            nombre, borme, company,
+                                            borme_embed, nombre_cargo,
+                                            acto, nuevo_anuncio, uow)
+                        if created:
+                            results["created_persons"] += 1
+                        else:
+                            results["errors"] += 1
+                    lista_cargos.append(cargo)
+
+            nuevo_anuncio.actos[acto.name] = lista_cargos
+
+            if is_acto_cargo_entrante(acto.name):
+                company.update_cargos_entrantes(lista_cargos)
+            else:
+                company.update_cargos_salientes(lista_cargos)
+        else:
+            # not bormeparser.borme.BormeActoCargo
+            nuevo_anuncio.actos[acto.name] = acto.value
+
+            if acto.name == 'Extinción':
+                actos.extinguir_sociedad(company, borme.date, uow)
+
+    uow.register_dirty(company)
+    nuevo_anuncio.company = company
+    uow.register_dirty(nuevo_anuncio)
+    return nuevo_anuncio
+
+
+def parse_date_range(date_from, date_to):
+    """Convierte las fechas de un rango de importación.
 
     :param date_from: Fecha desde la que importar ("2015-01-30", "init")
     :param date_to: Fecha hasta la que importar ("2015-01-30", "today")
-    :param seccion: Seccion del BORME
-    :param local_only: No descarga archivos, solo procesa archivos ya presentes
-    :param no_missing: Aborta el proceso tan pronto como se encuentre un error
     :type date_from: str
     :type date_to: str
-    :type seccion: bormeparser.SECCION
-    :type local_only: bool
-    :type no_missing: bool
+    :rtype: (datetime.date, datetime.date)
     """
     if date_from == 'init':
         date_from = FIRST_BORME[2009]
@@ -231,17 +307,126 @@ def import_borme_download(date_from, date_to, seccion=bormeparser.SECCION.A,
     if date_from > date_to:
         raise ValueError('date_from > date_to')
 
+    return date_from, date_to
+
+
+def import_borme_download(date_from, date_to, seccion=bormeparser.SECCION.A,
+                          local_only=False, no_missing=False, parse_workers=1,
+                          download_workers=DOWNLOAD_WORKERS, force=False,
+                          import_workers=1):
+    """Descarga e importa BORMEs desde la web del Registro Mercantil.
+
+    Descarga BORMEs en formato PDF de la web del Registro Mercantil para
+    un rango de fechas, los convierte a formato BORME-JSON e importa los
+    datos en la BD.
+
+    :param date_from: Fecha desde la que importar ("2015-01-30", "init")
+    :param date_to: Fecha hasta la que importar ("2015-01-30", "today")
+    :param seccion: Seccion del BORME
+    :param local_only: No descarga archivos, solo procesa archivos ya presentes
+    :param no_missing: Aborta el proceso tan pronto como se encuentre un error
+    :param parse_workers: Número de procesos que analizan los archivos BORME
+    :param download_workers: Número de descargas simultáneas
+    :param force: Procesa también los BORMEs que ya se han importado
+    :param import_workers: Número de procesos que importan en la BD los
+                           BORMEs de un mismo día
+    :type date_from: str
+    :type date_to: str
+    :type seccion: bormeparser.SECCION
+    :type local_only: bool
+    :type no_missing: bool
+    :type parse_workers: int
+    :type download_workers: int
+    :type force: bool
+    :type import_workers: int
+    """
+    date_from, date_to = parse_date_range(date_from, date_to)
+
+    parse_executor = None
+    if parse_workers > 1:
+        # Los procesos hijos no deben heredar la conexión a la BD
+        connections.close_all()
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers)
+
+    import_executor = None
+    if import_workers > 1:
+        import_executor = create_import_executor(import_workers)
+
     try:
         ret, _ = _import_borme_download_range(date_from, date_to, seccion,
-                                              local_only, strict=no_missing)
+                                              local_only, strict=no_missing,
+                                              parse_executor=parse_executor,
+                                              download_workers=download_workers,
+                                              force=force,
+                                              import_executor=import_executor)
         return ret
     except BormeDoesntExistException:
         logger.info("It looks like there is no BORME for this date ({}). "
                     "Nothing was downloaded".format(date_from))
         return False
+    finally:
+        if parse_executor:
+            parse_executor.shutdown()
+        if import_executor:
+            import_executor.shutdown()
+
 
+def _parse_file(filepath, seccion=bormeparser.SECCION.A, url=None):
+    """Convierte un archivo BORME-JSON o BORME-PDF en una instancia Borme.
 
-def _load_and_append(files_list, strict, seccion=bormeparser.SECCION.A):
+    Los BORME-PDF se analizan a través de la caché de BORME-JSON. Se ejecuta
+    en los procesos del pool de análisis, así que no debe acceder a la BD.
+
+    :param url: URL del BORME-PDF según el sumario, si se conoce
+    :rtype: bormeparser.Borme
+    """
+    if filepath.endswith("json"):
+        borme = bormeparser.Borme.from_json(filepath)
+        if url:
+            borme._url = url
+        return borme
+    return parse_pdf(filepath, seccion, url)
+
+
+def _parse_func_name(filepath):
+    if filepath.endswith("json"):
+        return "bormeparser.Borme.from_json"
+    return "bormeparser.parse"
+
+
+def _parse_files(files_list, seccion=bormeparser.SECCION.A,
+                 parse_executor=None):
+    """Analiza una lista de archivos BORME.
+
+    Si se indica parse_executor, los archivos se analizan en paralelo en sus
+    procesos. En cualquier caso los resultados se devuelven en el mismo orden
+    que files_list.
+
+    :rtype: iterator (filepath, borme or None, exception or None)
+    """
+    if parse_executor is None:
+        for filepath in files_list:
+            try:
+                yield filepath, _parse_file(filepath, seccion), None
+            except Exception as e:
+                yield filepath, None, e
+        return
+
+    futures = [parse_executor.submit(_parse_file, filepath, seccion)
+               for filepath in files_list]
+    try:
+        for filepath, future in zip(files_list, futures):
+            try:
+                yield filepath, future.result(), None
+            except Exception as e:
+                yield filepath, None, e
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _load_and_append(files_list, strict, seccion=bormeparser.SECCION.A,
+                     parse_executor=None):
     """Procesa una lista de archivos BORME.
 
     Procesa una lista de archivos BORME (JSON o PDF) y devuelve una lista
@@ -251,73 +436,326 @@ def _load_and_append(files_list, strict, seccion=bormeparser.SECCION.A):
     """
     bormes = []
 
-    if files_list[0].endswith("json"):
-        file_format = "json"
-        parse_func = bormeparser.Borme.from_json
-    else:
-        file_format = "pdf"
-        parse_func = bormeparser.parse
-
+    existing_files = []
     for filepath in files_list:
-
         if not os.path.exists(filepath):
             logger.warn('[X] Missing JSON: %s' % filepath)
             continue
+        existing_files.append(filepath)
+
+    for filepath, borme, e in _parse_files(existing_files, seccion,
+                                           parse_executor):
         logger.info(filepath)
 
-        try:
-            if file_format == "json":
-                borme = parse_func(filepath)
-            else:
-                borme = parse_func(filepath, seccion)
+        if e is None:
             bormes.append(borme)
+            continue
 
-        except Exception as e:
-            logger.error("[X] Error grave (I) en {obj}.{method}: {path}"
-                         .format(obj=parse_func.__objclass__,
-                                 method=parse_func.__name__,
-                                 path=filepath))
-            logger.error("[X] {}: {}"
-                         .format(e.__class__.__name__, e))
-            if strict:
-                logger_resume_import()
-                return bormes, True
+        logger.error("[X] Error grave (I) en {func}(): {path}"
+                     .format(func=_parse_func_name(filepath), path=filepath))
+        logger.error("[X] {}: {}"
+                     .format(e.__class__.__name__, e))
+        if strict:
+            logger_resume_import()
+            return bormes, True
 
     return bormes, False
 
 
 def _generate_borme_files_list(bxml, json_path, pdf_path):
     cves = bxml.get_cves(bormeparser.SECCION.A)
+    if isinstance(cves, str):
+        # get_cves() devuelve una cadena si solo hay un CVE
+        cves = [cves]
     files_json = map(lambda x: os.path.join(json_path, '%s.json' % x), cves)
     files_pdf = map(lambda x: os.path.join(pdf_path, '%s.pdf' % x), cves)
     return list(files_json), list(files_pdf)
 
 
+def _get_borme_xml(date, index=None):
+    """Carga el sumario BORME-XML de una fecha.
+
+    Si se indica el índice de sumarios y el sumario de la fecha es
+    definitivo, se devuelve su entrada del índice sin leer el XML. Si no, usa
+    el archivo en disco si existe y es definitivo, o lo descarga y lo guarda,
+    y actualiza el índice.
+
+    :rtype: bormeparser.BormeXML or borme.parser.sumario.SumarioEntry
+    """
+    if index is not None:
+        entry = index.get(date)
+        if entry is not None and entry.is_final:
+            return entry
+
+    xml_path = get_borme_xml_filepath(date)
+    try:
+        bxml = BormeXML.from_file(xml_path)
+        if bxml.next_borme is None:
+            bxml = BormeXML.from_date(date)
+            os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+            bxml.save_to_file(xml_path)
+
+    except OSError:
+        bxml = BormeXML.from_date(date)
+        os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+        bxml.save_to_file(xml_path)
+
+    if index is not None:
+        index.add(bxml)
+    return bxml
+
+
+def _get_cve(filepath):
+    """Obtiene el CVE a partir del nombre de un archivo BORME-PDF o BORME-JSON
+    """
+    return os.path.splitext(os.path.basename(filepath))[0]
+
+
+def _timed_parse_file(filepath, seccion=bormeparser.SECCION.A, url=None):
+    """Como _parse_file() pero devuelve también los segundos empleados.
+
+    :rtype: (bormeparser.Borme, float)
+    """
+    start_time = time.time()
+    borme = _parse_file(filepath, seccion, url)
+    return borme, time.time() - start_time
+
+
+def _download_stage(pipeline, output, begin, end, seccion, local_only, strict,
+                    download_workers, imported_cves, stats):
+    """Etapa de descarga del pipeline de importación.
+
+    Por cada día del rango obtiene el sumario del índice o del BORME-XML y
+    envía a la etapa de análisis un elemento DAY seguido de un elemento FILE
+    por cada archivo BORME. Las descargas las hace BormeDownloader y la etapa de análisis
+    recibe la URL del sumario y el Future de cada una, en el orden del sumario.
+
+    Los archivos de los CVEs de imported_cves se descartan.
+
+    Si se produce una excepción se envía como elemento ERROR. Si falta algún
+    archivo y strict es True se envía un elemento ABORT.
+    """
+    downloader = None
+    try:
+        if not local_only:
+            downloader = BormeDownloader(download_workers, stats=stats)
+        index = SumarioIndex()
+
+        next_date = begin
+        while next_date and next_date <= end:
+            bxml = _get_borme_xml(next_date, index)
+            json_path = get_borme_json_path(bxml.date)
+            pdf_path = get_borme_pdf_path(bxml.date)
+            os.makedirs(pdf_path, exist_ok=True)
+
+            if not local_only:
+                files = downloader.get_files(bxml, pdf_path, seccion)
+            else:
+                files_json, files_pdf = _generate_borme_files_list(bxml,
+                                                                   json_path,
+                                                                   pdf_path)
+                if files_exist(files_json):
+                    local_files = files_json
+                elif files_exist(files_pdf):
+                    local_files = files_pdf
+                else:
+                    logger.error('[X] Faltan archivos PDF y JSON que no se desea descargar.')
+                    logger.error('[X] JSON: %s' % ' '.join(files_json))
+                    logger.error('[X] PDF: %s' % ' '.join(files_pdf))
+
+                    if strict:
+                        pipeline.put(output, (ABORT, None))
+                        return
+                    local_files = files_pdf
+
+                files = [(filepath, None, None) for filepath in local_files]
+
+            if imported_cves:
+                total = len(files)
+                files = [(filepath, url, size)
+                         for filepath, url, size in files
+                         if _get_cve(filepath) not in imported_cves]
+                if len(files) < total:
+                    logger.info('Skipping {} BORMEs already imported on {}'
+                                .format(total - len(files), bxml.date))
+
+            if not pipeline.put(output, (DAY, bxml, len(files))):
+                return
+
+            for filepath, url, size in files:
+                if url is None:
+                    if not os.path.exists(filepath):
+                        logger.warn('[X] Missing JSON: %s' % filepath)
+                        continue
+                    download = None
+                else:
+                    download = downloader.submit(url, filepath, size)
+                if not pipeline.put(output, (FILE, filepath, url, download)):
+                    return
+
+            next_date = bxml.next_borme
+    except Exception as e:
+        pipeline.put(output, (ERROR, e))
+    finally:
+        pipeline.put(output, DONE)
+        if downloader:
+            downloader.close()
+
+
+def _parse_stage(pipeline, input, output, seccion, parse_executor, stats):
+    """Etapa de análisis del pipeline de importación.
+
+    Espera a que se descargue cada archivo y lo analiza, en parse_executor si
+    se indica o en el propio hilo si no. A la etapa de importación le envía el
+    Future del análisis, que devuelve (borme, segundos).
+    """
+    def add_stats(future):
+        if not future.cancelled() and future.exception() is None:
+            stats.add(future.result()[1])
+
+    while True:
+        item = pipeline.get(input)
+        if item is DONE or item[0] != FILE:
+            pipeline.put(output, item)
+            if item is DONE:
+                return
+            continue
+
+        _, filepath, url, download = item
+        try:
+            if download:
+                download.result()
+            if parse_executor:
+                future = parse_executor.submit(_timed_parse_file, filepath,
+                                               seccion, url)
+            else:
+                future = Future()
+                future.set_result(_timed_parse_file(filepath, seccion, url))
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(add_stats)
+
+        if not pipeline.put(output, (FILE, filepath, future)):
+            future.cancel()
+            return
+
+
+def _add_day_handlers(date):
+    """Añade los FileHandlers del log de importación de un día"""
+    directory = '%02d-%02d' % (date.year, date.month)
+    logpath = os.path.join(settings.BORME_LOG_ROOT, 'imports', directory)
+    os.makedirs(logpath, exist_ok=True)
+
+    fh1_path = os.path.join(logpath, '%02d_info.txt' % date.day)
+    fh1 = logging.FileHandler(fh1_path)
+    fh1.setLevel(logging.INFO)
+    logger.addHandler(fh1)
+
+    fh2_path = os.path.join(logpath, '%02d_error.txt' % date.day)
+    fh2 = logging.FileHandler(fh2_path)
+    fh2.setLevel(logging.WARNING)
+    logger.addHandler(fh2)
+
+    return fh1, fh2
+
+
+def _log_import_error(borme, e):
+    logger.error('[%s] Error grave en _from_instance:' % borme.cve)
+    logger.error('[%s] %s' % (borme.cve, e))
+    logger.error('[%s] Prueba importar manualmente en modo detallado para ver el error:' % borme.cve)
+    logger.error('[%s]   python manage.py importbormepdf %s -v 3' % (borme.cve, borme.filename))
+
+
+def _save_results(borme, results, json_path, create_json, total_results,
+                  elapsed_time, stats):
+    """Guarda el BORME-JSON de un BORME importado y suma sus resultados"""
+    if create_json:
+        os.makedirs(json_path, exist_ok=True)
+        json_filepath = os.path.join(json_path, '%s.json' % borme.cve)
+        borme.to_json(json_filepath)
+
+    for key in total_results.keys():
+        total_results[key] += results[key]
+
+    stats.add(elapsed_time)
+    if not all(map(lambda x: x == 0, total_results.values())):
+        _print_results(results, borme)
+        logger.info('[%s] Elapsed time: %.2f seconds' % (borme.cve, elapsed_time))
+
+
+def _import_day(bormes, json_path, import_executor, strict, create_json,
+                total_results, stats):
+    """Importa en paralelo los BORMEs de un día.
+
+    Si strict es True y falla algún BORME se devuelve False, aunque los
+    BORMEs del día que no dependían de él ya estarán importados.
+
+    :rtype: bool
+    """
+    ok = True
+    for borme, results, e, elapsed_time in import_day(bormes,
+                                                      import_executor):
+        if e is not None:
+            _log_import_error(borme, e)
+            if strict and ok:
+                logger_resume_import(cve=borme.cve)
+                ok = False
+            continue
+
+        _save_results(borme, results, json_path, create_json, total_results,
+                      elapsed_time, stats)
+    return ok
+
+
 def _import_borme_download_range(begin, end, seccion, local_only,
-                                 strict=False, create_json=True):
+                                 strict=False, create_json=True,
+                                 parse_executor=None, queue_size=QUEUE_SIZE,
+                                 download_workers=DOWNLOAD_WORKERS,
+                                 force=False, import_executor=None):
     """Importa los BORMEs data un rango de fechas.
 
     Itera en el rango de fechas. Por cada día:
     * Genera los nombres de los archivos BORMEs a partir del archivo BORME-XML
-    * Carga los archivos BORME-JSON, o los BORME-PDF si no existieran los JSON
+    * Descarga los archivos BORME-PDF, o carga los BORME-JSON o BORME-PDF
+      locales si local_only es True
     * Importa en la BD los datos de los BORME
 
+    Los tres pasos se ejecutan a la vez como etapas de un pipeline unidas por
+    colas acotadas: cada archivo pasa a la siguiente etapa en cuanto está
+    listo. La importación en la BD se hace en este hilo y en el orden del
+    sumario. Al terminar se muestra el rendimiento de cada etapa.
+
+    Si se indica import_executor, los BORMEs de cada día se importan en
+    paralelo en sus procesos (ver borme.parser.shard.import_day()).
+
+    Los BORMEs que ya constan como importados en BormeLog no se descargan ni
+    se analizan, salvo que force sea True.
+
     :param begin: Fecha desde la que importar
     :param end: Fecha hasta la que importar
     :param seccion: Seccion del BORME
     :param local_only: No descarga archivos, solo procesa archivos ya presentes
     :param strict: Aborta el proceso tan pronto como se encuentre un error
     :param create_json: Crear archivo BORME-JSON
+    :param parse_executor: Pool de procesos para analizar los archivos
+    :param queue_size: Número máximo de archivos en espera entre etapas
+    :param download_workers: Número de descargas simultáneas
+    :param force: Procesa también los BORMEs que ya se han importado
+    :param import_executor: Pool de procesos para importar en la BD
     :type date_from: datetime.date
     :type date_to: datetime.date
     :type seccion: bormeparser.SECCION
     :type local_only: bool
     :type strict: bool
     :type create_json: bool
-
+    :type parse_executor: concurrent.futures.Executor
+    :type queue_size: int
+    :type download_workers: int
+    :type force: bool
+    :type import_executor: concurrent.futures.ProcessPoolExecutor
     :rtype: (bool, dict)
     """
-    next_date = begin
     total_results = {
         'created_anuncios': 0,
         'created_bormes': 0,
@@ -331,132 +769,113 @@ def _import_borme_download_range(begin, end, seccion, local_only,
     }
     total_start_time = time.time()
 
+    imported_cves = set()
+    if not force:
+        imported_cves = get_imported_cves(begin, end)
+
+    pipeline = Pipeline(queue_size)
+    downloaded = pipeline.queue()
+    parsed = pipeline.queue()
+    download_stats = pipeline.add_stats('Download', 'files')
+    parse_stats = pipeline.add_stats('Parse', 'files')
+    import_stats = pipeline.add_stats('Import', 'BORMEs')
+    pipeline.start(_download_stage, downloaded, begin, end, seccion,
+                   local_only, strict, download_workers, imported_cves,
+                   download_stats)
+    pipeline.start(_parse_stage, downloaded, parsed, seccion, parse_executor,
+                   parse_stats)
+
+    handlers = ()
+    json_path = None
+    day_bormes = []
     try:
-        while next_date and next_date <= end:
-            xml_path = get_borme_xml_filepath(next_date)
+        while True:
+            item = pipeline.get(parsed)
+            if item is DONE:
+                break
+
+            if item[0] == ERROR:
+                raise item[1]
+
+            if item[0] == ABORT:
+                return False, total_results
+
+            if item[0] == DAY:
+                if day_bormes and not _import_day(day_bormes, json_path,
+                                                  import_executor, strict,
+                                                  create_json, total_results,
+                                                  import_stats):
+                    return False, total_results
+                day_bormes = []
+
+                _, bxml, nfiles = item
+                for handler in handlers:
+                    logger.removeHandler(handler)
+                handlers = _add_day_handlers(bxml.date)
+
+                json_path = get_borme_json_path(bxml.date)
+                pdf_path = get_borme_pdf_path(bxml.date)
+                total_results['total_bormes'] += nfiles
+                logger.info(
+                        "===================================================\n"
+                        "Ran import_borme_download at {now}\n"
+                        "  Import date: {borme_date}. Section: {section}\n"
+                        "==================================================="
+                        .format(now=timezone.now(), section=seccion,
+                                borme_date=bxml.date.isoformat()))
+                print("\nPATH: {}"
+                      "\nDATE: {}"
+                      "\nSECCION: {}\n"
+                      .format(pdf_path, bxml.date, seccion))
+                continue
+
+            _, filepath, future = item
+            logger.info(filepath)
             try:
-                bxml = BormeXML.from_file(xml_path)
-                if bxml.next_borme is None:
-                    bxml = BormeXML.from_date(next_date)
-                    os.makedirs(os.path.dirname(xml_path), exist_ok=True)
-                    bxml.save_to_file(xml_path)
-
-            except OSError:
-                bxml = BormeXML.from_date(next_date)
-                os.makedirs(os.path.dirname(xml_path), exist_ok=True)
-                bxml.save_to_file(xml_path)
-
-            # Add FileHandlers
-            directory = '%02d-%02d' % (bxml.date.year, bxml.date.month)
-            logpath = os.path.join(settings.BORME_LOG_ROOT,
-                                   'imports', directory)
-            os.makedirs(logpath, exist_ok=True)
-
-            fh1_path = os.path.join(logpath, '%02d_info.txt' % bxml.date.day)
-            fh1 = logging.FileHandler(fh1_path)
-            fh1.setLevel(logging.INFO)
-            logger.addHandler(fh1)
-
-            fh2_path = os.path.join(logpath, '%02d_error.txt' % bxml.date.day)
-            fh2 = logging.FileHandler(fh2_path)
-            fh2.setLevel(logging.WARNING)
-            logger.addHandler(fh2)
-
-            json_path = get_borme_json_path(bxml.date)
-            pdf_path = get_borme_pdf_path(bxml.date)
-            os.makedirs(pdf_path, exist_ok=True)
-            logger.info(
-                    "===================================================\n"
-                    "Ran import_borme_download at {now}\n"
-                    "  Import date: {borme_date}. Section: {section}\n"
-                    "==================================================="
-                    .format(now=timezone.now(), section=seccion,
-                            borme_date=bxml.date.isoformat()))
-            print("\nPATH: {}"
-                  "\nDATE: {}"
-                  "\nSECCION: {}\n"
-                  .format(pdf_path, bxml.date, seccion))
-
-            bormes = []
-            if not local_only:
-                _, files = bxml.download_borme(pdf_path, seccion=seccion)
-
-                for filepath in files:
-                    if filepath.endswith('-99.pdf'):
-                        continue
-                    logger.info('%s' % filepath)
-                    total_results['total_bormes'] += 1
-                    try:
-                        bormes.append(bormeparser.parse(filepath, seccion))
-                    except Exception as e:
-                        logger.error('[X] Error grave (I) en bormeparser.parse(): %s' % filepath)
-                        logger.error('[X] %s: %s' % (e.__class__.__name__, e))
-                        if strict:
-                            logger_resume_import()
-                            return False, total_results
-
-            else:
-                files_json, files_pdf = _generate_borme_files_list(bxml,
-                                                                   json_path,
-                                                                   pdf_path)
-
-                if files_exist(files_json):
-                    bormes, err = _load_and_append(files_json, strict)
-                    total_results["total_bormes"] += len(files_json)
-
-                    if err:
-                        return False, total_results
-
-                elif files_exist(files_pdf):
-                    bormes, err = _load_and_append(files_pdf, strict, seccion)
-                    total_results["total_bormes"] += len(files_pdf)
-
-                    if err:
-                        return False, total_results
-                else:
-                    logger.error('[X] Faltan archivos PDF y JSON que no se desea descargar.')
-                    logger.error('[X] JSON: %s' % ' '.join(files_json))
-                    logger.error('[X] PDF: %s' % ' '.join(files_pdf))
-
-                    if strict:
-                        return False, total_results
-
-                    bormes, err = _load_and_append(files_pdf, strict, seccion)
-                    total_results["total_bormes"] += len(files_pdf)
-
-            for borme in sorted(bormes):
-                total_results['total_anuncios'] += len(borme.get_anuncios())
-                start_time = time.time()
-                try:
-                    results = _from_instance(borme)
-                except Exception as e:
-                    logger.error('[%s] Error grave en _from_instance:' % borme.cve)
-                    logger.error('[%s] %s' % (borme.cve, e))
-                    logger.error('[%s] Prueba importar manualmente en modo detallado para ver el error:' % borme.cve)
-                    logger.error('[%s]   python manage.py importbormepdf %s -v 3' % (borme.cve, borme.filename))
-                    if strict:
-                        logger_resume_import(cve=borme.cve)
-                        return False, total_results
-
-                if create_json:
-                    os.makedirs(json_path, exist_ok=True)
-                    json_filepath = os.path.join(json_path, '%s.json' % borme.cve)
-                    borme.to_json(json_filepath)
-
-                for key in total_results.keys():
-                    total_results[key] += results[key]
-
-                if not all(map(lambda x: x == 0, total_results.values())):
-                    _print_results(results, borme)
-                    elapsed_time = time.time() - start_time
-                    logger.info('[%s] Elapsed time: %.2f seconds' % (borme.cve, elapsed_time))
+                borme, _ = future.result()
+            except Exception as e:
+                logger.error("[X] Error grave (I) en {func}(): {path}"
+                             .format(func=_parse_func_name(filepath),
+                                     path=filepath))
+                logger.error("[X] {}: {}"
+                             .format(e.__class__.__name__, e))
+                if strict:
+                    logger_resume_import()
+                    return False, total_results
+                continue
+
+            total_results['total_anuncios'] += len(borme.get_anuncios())
+
+            if import_executor:
+                day_bormes.append(borme)
+                continue
+
+            start_time = time.time()
+            try:
+                results = _from_instance(borme)
+            except Exception as e:
+                _log_import_error(borme, e)
+                if strict:
+                    logger_resume_import(cve=borme.cve)
+                    return False, total_results
+                continue
+
+            _save_results(borme, results, json_path, create_json,
+                          total_results, time.time() - start_time,
+                          import_stats)
+
+        if day_bormes and not _import_day(day_bormes, json_path,
+                                          import_executor, strict,
+                                          create_json, total_results,
+                                          import_stats):
+            return False, total_results
 
-            # Remove handlers
-            logger.removeHandler(fh1)
-            logger.removeHandler(fh2)
-            next_date = bxml.next_borme
     except KeyboardInterrupt:
         logger.info('\nImport aborted.')
+    finally:
+        pipeline.stop()
+        for handler in handlers:
+            logger.removeHandler(handler)
 
     elapsed_time = time.time() - total_start_time
     logger.info("\nBORMEs creados: {created_bormes}/{total_bormes}\n"
@@ -464,6 +883,8 @@ def _import_borme_download_range(begin, end, seccion, local_only,
                 "Empresas creadas: {created_companies}/{total_companies}\n"
                 "Personas creadas: {created_persons}/{total_persons}"
                 .format(**total_results))
+    for line in pipeline.report():
+        logger.info(line)
     logger.info("Total elapsed time: %.2f seconds" % elapsed_time)
 
     return True, total_results
@@ -472,6 +893,8 @@ def _import_borme_download_range(begin, end, seccion, local_only,
 def from_pdf_file(filename, create_json=True):
     """Importa un archivo BORME-PDF en la BD.
 
+    Devuelve False si no se ha podido analizar o importar el archivo.
+
     :param filename: Archivo a importar
     :param create_json: Crear BORME-JSON como paso intermedio
     :type filename: str
@@ -487,7 +910,7 @@ def from_pdf_file(filename, create_json=True):
     }
 
     try:
-        borme = bormeparser.parse(filename, bormeparser.SECCION.A)
+        borme = parse_pdf(filename, bormeparser.SECCION.A)
         results = _from_instance(borme)
         if create_json:
             json_path = get_borme_json_path(borme.date)
@@ -497,6 +920,7 @@ def from_pdf_file(filename, create_json=True):
     except Exception as e:
         logger.error('[X] Error grave (III) en bormeparser.parse(): %s' % filename)
         logger.error('[X] %s: %s' % (e.__class__.__name__, e))
+        return False, results
 
     if not all(map(lambda x: x == 0, results.values())):
         _print_results(results, borme)
@@ -506,6 +930,8 @@ def from_pdf_file(filename, create_json=True):
 def from_json_file(filename):
     """Importa un archivo BORME-JSON en la BD.
 
+    Devuelve False si no se ha podido analizar o importar el archivo.
+
     :param filename: Archivo a importar
     :type filename: str or file
     :rtype: (bool, dict)
@@ -524,6 +950,7 @@ def from_json_file(filename):
     except Exception as e:
         logger.error('[X] Error grave (III) en bormeparser.Borme.from_json(): %s' % filename)
         logger.error('[X] %s: %s' % (e.__class__.__name__, e))
+        return False, results
 
     if not all(map(lambda x: x == 0, results.values())):
         _print_results(results, borme)
@@ -556,7 +983,7 @@ def _print_results(results, borme):
 
 
 def _load_cargo_empresa(nombre, borme, anuncio, borme_embed,
-                        nombre_cargo, acto, company):
+                        nombre_cargo, acto, company, nuevo_anuncio, uow):
     """Importa en la BD la empresa que aparece en un cargo.
 
     Inserta la empresa si no existe e inserta los cargos.
@@ -566,7 +993,7 @@ def _load_cargo_empresa(nombre, borme, anuncio, borme_embed,
     """
 
     empresa, tipo, slug_c = parse_empresa(borme.cve, nombre)
-    c, created = company_get_or_create(empresa, tipo, slug_c)
+    c, created = uow.company_get_or_create(empresa, tipo, slug_c)
 
     if created:
         logger_empresa_create(empresa, tipo)
@@ -574,7 +1001,7 @@ def _load_cargo_empresa(nombre, borme, anuncio, borme_embed,
         if c.name != empresa:
             logger_empresa_similar(slug_c, c, empresa, borme.cve)
 
-    c.anuncios.append({"year": borme.date.year, "id": anuncio.id})
+    c.add_anuncio({"year": borme.date.year, "id": anuncio.id})
     c.add_in_bormes(borme_embed)
     c.date_updated = borme.date
 
@@ -594,18 +1021,22 @@ def _load_cargo_empresa(nombre, borme, anuncio, borme_embed,
         cargo['date_from'] = borme.date.isoformat()
         cargo_embed["date_from"] = borme.date.isoformat()
         c.update_cargos_entrantes([cargo_embed])
+        uow.cargo_entrante(company, c, nombre_cargo, borme.date,
+                           nuevo_anuncio)
     else:
         cargo['date_to'] = borme.date.isoformat()
         cargo_embed["date_to"] = borme.date.isoformat()
         c.update_cargos_salientes([cargo_embed])
+        uow.cargo_saliente(company, c, nombre_cargo, borme.date,
+                           nuevo_anuncio)
 
-    c.save()
+    uow.register_dirty(c)
 
     return cargo, created
 
 
 def _load_cargo_person(nombre, borme, company, borme_embed,
-                       nombre_cargo, acto):
+                       nombre_cargo, acto, nuevo_anuncio, uow):
     """Importa en la BD la persona que aparece en un cargo.
 
     Inserta la persona si no existe e inserta los cargos.
@@ -613,7 +1044,7 @@ def _load_cargo_person(nombre, borme, company, borme_embed,
 
     :rtype: (dict, bool cargo created)
     """
-    p, created = person_get_or_create(nombre)
+    p, created = uow.person_get_or_create(nombre)
 
     if created:
         logger_persona_create(nombre)
@@ -640,11 +1071,15 @@ def _load_cargo_person(nombre, borme, company, borme_embed,
         cargo['date_from'] = borme.date.isoformat()
         cargo_embed["date_from"] = borme.date.isoformat()
         p.update_cargos_entrantes([cargo_embed])
+        uow.cargo_entrante(company, p, nombre_cargo, borme.date,
+                           nuevo_anuncio)
     else:
         cargo['date_to'] = borme.date.isoformat()
         cargo_embed["date_to"] = borme.date.isoformat()
         p.update_cargos_salientes([cargo_embed])
+        uow.cargo_saliente(company, p, nombre_cargo, borme.date,
+                           nuevo_anuncio)
 
-    p.save()
+    uow.register_dirty(p)
 
     return cargo, created
@@ -4,6 +4,8 @@ from django.conf import settings
 
 from bormeparser.borme import BormeXML
 
+from .sumario import SumarioIndex
+
 
 def get_borme_xml_filepath(date):
     year = str(date.year)
@@ -30,23 +32,28 @@ def get_borme_json_path(date):
 def update_previous_xml(date):
     """
     Dada una fecha, comprueba si el XML anterior es definitivo y si no lo es
-    lo descarga de nuevo
+    lo descarga de nuevo. Actualiza el índice de sumarios con ambos XML.
     """
+    index = SumarioIndex()
     xml_path = get_borme_xml_filepath(date)
     bxml = BormeXML.from_file(xml_path)
+    index.add(bxml)
 
+    prev_xml_path = get_borme_xml_filepath(bxml.prev_borme)
     try:
-        prev_xml_path = get_borme_xml_filepath(bxml.prev_borme)
         prev_bxml = BormeXML.from_file(prev_xml_path)
         if prev_bxml.is_final:
+            index.add(prev_bxml)
             return False
 
         os.unlink(prev_xml_path)
     except OSError:
         pass
-    finally:
-        prev_bxml = BormeXML.from_date(bxml.prev_borme)
-        prev_bxml.save_to_file(prev_xml_path)
+
+    prev_bxml = BormeXML.from_date(bxml.prev_borme)
+    os.makedirs(os.path.dirname(prev_xml_path), exist_ok=True)
+    prev_bxml.save_to_file(prev_xml_path)
+    index.add(prev_bxml)
 
     return True
 
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+
+# Número máximo de elementos en espera entre dos etapas
+QUEUE_SIZE = 8
+
+# Intervalo con el que las etapas bloqueadas comprueban si deben parar
+POLL_INTERVAL = 0.5
+
+# Marca el final de los datos de una etapa
+DONE = object()
+
+
+class StageStats(object):
+    """Estadísticas de una etapa del pipeline.
+
+    Acumula el número de elementos procesados, los bytes y el tiempo que la
+    etapa ha estado ocupada. Puede actualizarse desde varios hilos.
+    """
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.nbytes = 0
+        self.busy = 0.0
+        self.first = None
+        self.last = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds, items=1, nbytes=0):
+        """Registra los elementos procesados en los últimos seconds segundos"""
+        now = time.time()
+        with self._lock:
+            self.items += items
+            self.nbytes += nbytes
+            self.busy += seconds
+            if self.first is None:
+                self.first = now - seconds
+            self.last = now
+
+    @property
+    def active(self):
+        """Segundos entre el primer y el último elemento procesado"""
+        if self.first is None:
+            return 0.0
+        return self.last - self.first
+
+    def report(self):
+        active = self.active
+        rate = self.items / active if active else 0.0
+        message = "{name}: {items} {unit} in {active:.2f} seconds " \
+                  "({rate:.2f} {unit}/s, busy {busy:.2f} seconds)" \
+                  .format(name=self.name, items=self.items, unit=self.unit,
+                          active=active, rate=rate, busy=self.busy)
+        if self.nbytes:
+            message += ", {:.2f} MB".format(self.nbytes / (1024.0 * 1024.0))
+        return message
+
+
+class Pipeline(object):
+    """Etapas que se ejecutan en hilos unidos por colas acotadas.
+
+    Cada etapa lee de su cola de entrada y escribe en la de salida. Como las
+    colas tienen un tamaño máximo, una etapa rápida se bloquea hasta que la
+    siguiente consume sus datos (backpressure). Al llamar a stop() todas las
+    etapas bloqueadas en put() o get() terminan.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stats = []
+        self._threads = []
+        self._stop = threading.Event()
+
+    def queue(self):
+        """Crea una cola acotada para unir dos etapas"""
+        return queue.Queue(maxsize=self.queue_size)
+
+    def add_stats(self, name, unit):
+        stats = StageStats(name, unit)
+        self.stats.append(stats)
+        return stats
+
+    def start(self, target, *args):
+        """Ejecuta una etapa en un hilo nuevo"""
+        thread = threading.Thread(target=target, args=(self,) + args)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def put(self, q, item):
+        """Añade un elemento a la cola esperando a que haya hueco.
+
+        :rtype: bool False si el pipeline se ha parado
+        """
+        while not self.stopped:
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        """Obtiene un elemento de la cola esperando a que haya alguno.
+
+        Si el pipeline se ha parado devuelve DONE.
+        """
+        while not self.stopped:
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return DONE
+
+    def stop(self):
+        """Para todas las etapas y espera a que terminen"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def report(self):
+        """Devuelve una línea con el rendimiento de cada etapa"""
+        return [stats.report() for stats in self.stats if stats.items]
@@ -1,9 +1,11 @@
-from django.contrib.postgres.search import SearchVector
-from django.db import connection, transaction
+from django.db import connection
 
 from borme.models import Company, Person
+from borme.utils.postgres import FTS_CONFIG
 
+import datetime
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -12,57 +14,71 @@ ch = logging.StreamHandler()
 logger.addHandler(ch)
 logger.setLevel(logging.INFO)
 
+BATCH_SIZE = 5000
 
-def psql_update_documents():
-    """
-    Update postgresql full text search attributes.
-    This function must be run everytime new records are added to the database
-    """
-    affected_rows = 0
+# Calcula document en el siguiente lote de filas sin él, en orden de clave
+# primaria. Devuelve el último slug del lote y las filas actualizadas
+UPDATE_DOCUMENTS_SQL = """
+    WITH batch AS (
+        SELECT slug FROM {table}
+        WHERE slug > %s AND document IS NULL
+        ORDER BY slug LIMIT %s),
+    updated AS (
+        UPDATE {table} AS t SET document = to_tsvector(%s, t.name)
+        FROM batch WHERE t.slug = batch.slug
+        RETURNING t.slug)
+    SELECT max(slug), count(*) FROM updated"""
 
-    with connection.cursor() as cursor:
-        cursor.execute("UPDATE borme_company "
-                       "SET document = to_tsvector(name) "
-                       "WHERE document IS NULL")
-        affected_rows += cursor.rowcount
-        logger.info("Updated {} borme_company records".format(cursor.rowcount))
 
+def _update_table_documents(table, batch_size, sleep):
+    """Actualiza document en las filas de una tabla que no lo tienen.
+
+    :rtype: int filas actualizadas
+    """
     with connection.cursor() as cursor:
-        cursor.execute("UPDATE borme_person "
-                       "SET document = to_tsvector(name) "
-                       "WHERE document IS NULL")
-        affected_rows += cursor.rowcount
-        logger.info("Updated {} borme_company records".format(cursor.rowcount))
+        cursor.execute("SELECT count(*) FROM {} WHERE document IS NULL"
+                       .format(table))
+        pending = cursor.fetchone()[0]
+        sql = UPDATE_DOCUMENTS_SQL.format(table=table)
 
+        affected_rows = 0
+        last = ''
+        start = time.time()
+        while True:
+            cursor.execute(sql, [last, batch_size, FTS_CONFIG])
+            last, count = cursor.fetchone()
+            if last is None:
+                break
+            affected_rows += count
+
+            elapsed = time.time() - start
+            remaining = max(pending - affected_rows, 0)
+            eta = datetime.timedelta(
+                    seconds=int(elapsed * remaining / affected_rows))
+            logger.info("{}: {}/{} records ({:.1%}), ETA {}, last slug {}"
+                        .format(table, affected_rows, pending,
+                                affected_rows / max(pending, 1), eta, last))
+            if sleep:
+                time.sleep(sleep)
+
+    logger.info("Updated {} {} records".format(affected_rows, table))
     return affected_rows
 
 
-def psql_update_documents_batch():
+def psql_update_documents(batch_size=BATCH_SIZE, sleep=0):
     """
-    Same as psql_update_documents() but using atomic batches.
-    This way, the table is not locked for a long time when the update is big
+    Update postgresql full text search attributes.
+    This function must be run everytime new records are added to the database
+
+    Rows are updated in primary key order, in batches of batch_size rows.
+    Each batch is a single statement committed on its own, so the table is
+    not locked for a long time and an interrupted run can be restarted: it
+    goes on with the rows still missing their document.
+
+    :param sleep: seconds to wait between batches
     """
     affected_rows = 0
-    while Company.objects.filter(document__isnull=True).exists():
-        with connection.cursor() as cursor:
-            with transaction.atomic():
-                for row in Company.objects.filter(document__isnull=True)[:1000]:
-                    row.document = SearchVector("name")
-                    row.save()
-                    affected_rows += cursor.rowcount
-
-            logger.info("Updated {} borme_company records"
-                        .format(cursor.rowcount))
-
-    while Person.objects.filter(document__isnull=True).exists():
-        with connection.cursor() as cursor:
-            with transaction.atomic():
-                for row in Person.objects.filter(document__isnull=True)[:1000]:
-                    row.document = SearchVector("name")
-                    row.save()
-                    affected_rows += cursor.rowcount
-
-            logger.info("Updated {} borme_company records"
-                        .format(cursor.rowcount))
-
+    for model in (Company, Person):
+        affected_rows += _update_table_documents(model._meta.db_table,
+                                                 batch_size, sleep)
     return affected_rows
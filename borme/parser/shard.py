@@ -0,0 +1,196 @@
+from django.db import connections, transaction
+from django.utils.text import slugify
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import hashlib
+import os
+import time
+
+from bormeparser.borme import BormeActoCargo
+from bormeparser.regex import is_company, regex_empresa_tipo
+
+from borme.models import Company
+from borme.utils.postgres import advisory_xact_lock
+from borme.utils.strings import slug2
+
+# Primera clave de los locks consultivos de PostgreSQL: el tipo de entidad
+LOCK_COMPANY = 0x4c420001
+LOCK_PERSON = 0x4c420002
+
+
+def lock_key(kind, slug):
+    """Clave del lock consultivo de una sociedad o persona.
+
+    :param kind: LOCK_COMPANY o LOCK_PERSON
+    :type slug: str
+    :rtype: (int, int)
+    """
+    digest = hashlib.md5(slug.encode('utf-8')).digest()
+    return kind, int.from_bytes(digest[:4], 'big', signed=True)
+
+
+def _company_slug(nombre):
+    empresa, _ = regex_empresa_tipo(nombre)
+    return slugify(empresa)
+
+
+def collect_borme_relations(borme):
+    """Recorre una instancia BORME y obtiene qué entidades se relacionan.
+
+    :param borme: Instancia BORME
+    :type borme: bormeparser.Borme
+    :rtype: (set keys, dict {company slug: set keys}, set company slugs)
+            claves de todas las sociedades y personas del BORME, claves de
+            los cargos que el BORME añade o quita a cada sociedad y slugs de
+            las sociedades que se extinguen
+    """
+    keys = set()
+    related = {}
+    extinguished = set()
+
+    for anuncio in borme.get_anuncios():
+        slug_c = _company_slug(anuncio.empresa)
+        keys.add(lock_key(LOCK_COMPANY, slug_c))
+
+        for acto in anuncio.get_borme_actos():
+            if not isinstance(acto, BormeActoCargo):
+                if acto.name == 'Extinción':
+                    extinguished.add(slug_c)
+                continue
+            for nombres in acto.cargos.values():
+                for nombre in nombres:
+                    if is_company(nombre):
+                        slug = _company_slug(nombre)
+                        key = lock_key(LOCK_COMPANY, slug)
+                        related.setdefault(slug, set()).add(
+                                lock_key(LOCK_COMPANY, slug_c))
+                    else:
+                        key = lock_key(LOCK_PERSON, slugify(nombre))
+                    keys.add(key)
+                    related.setdefault(slug_c, set()).add(key)
+
+    return keys, related, extinguished
+
+
+def _get_cargo_keys(slugs):
+    """Claves de los cargos vigentes en la BD de las sociedades indicadas.
+
+    Son las entidades que modificará extinguir_sociedad().
+
+    :rtype: dict {company slug: set keys}
+    """
+    cargo_keys = {}
+    companies = Company.objects.filter(slug__in=slugs) \
+                               .values_list('slug', 'cargos_actuales_c',
+                                            'cargos_actuales_p')
+    for slug, cargos_c, cargos_p in companies:
+        keys = cargo_keys.setdefault(slug, set())
+        keys.update(lock_key(LOCK_COMPANY, slug2(cargo['name']))
+                    for cargo in cargos_c)
+        keys.update(lock_key(LOCK_PERSON, slug2(cargo['name']))
+                    for cargo in cargos_p)
+    return cargo_keys
+
+
+def get_lock_keys(bormes):
+    """Obtiene las claves de las entidades que modifica cada BORME de un día.
+
+    Además de las sociedades y personas que aparecen en el BORME, si una
+    sociedad se extingue se incluyen todos sus cargos vigentes: los que
+    constan en la BD y los que le añaden los BORMEs anteriores del día.
+
+    :type bormes: list [bormeparser.Borme] en el orden del sumario
+    :rtype: list [set keys]
+    """
+    relations = [collect_borme_relations(borme) for borme in bormes]
+    extinguished = set()
+    for _, _, slugs in relations:
+        extinguished.update(slugs)
+    cargo_keys = _get_cargo_keys(extinguished) if extinguished else {}
+
+    borme_keys = []
+    for n, (keys, _, slugs) in enumerate(relations):
+        keys = set(keys)
+        for slug in slugs:
+            keys.update(cargo_keys.get(slug, ()))
+            for _, related, _ in relations[:n + 1]:
+                keys.update(related.get(slug, ()))
+        borme_keys.append(keys)
+    return borme_keys
+
+
+def create_import_executor(workers):
+    """Crea el pool de procesos de importación.
+
+    Los procesos se arrancan en este momento, con las conexiones a la BD
+    cerradas, para que no hereden la conexión del proceso principal.
+
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    connections.close_all()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    futures = [executor.submit(os.getpid) for _ in range(workers)]
+    for future in futures:
+        future.result()
+    return executor
+
+
+def _import_borme(borme, keys):
+    """Importa un BORME en un proceso del pool de importación.
+
+    Toma los locks de las entidades del BORME en orden antes de leerlas y
+    los mantiene hasta el final de la transacción.
+
+    :rtype: (dict results, float seconds)
+    """
+    from .importer import _from_instance
+
+    start_time = time.time()
+    with transaction.atomic():
+        advisory_xact_lock(sorted(keys))
+        results = _from_instance(borme)
+    return results, time.time() - start_time
+
+
+def import_day(bormes, executor):
+    """Importa en paralelo los BORMEs de un día.
+
+    Un BORME que comparte alguna sociedad o persona con otro anterior del
+    mismo día no empieza hasta que este termina, así que los cargos quedan
+    en el mismo orden que en la importación en serie. Los BORMEs que no
+    comparten nada (normalmente los de provincias distintas) se importan a
+    la vez en los procesos de executor.
+
+    :type bormes: list [bormeparser.Borme] en el orden del sumario
+    :type executor: concurrent.futures.ProcessPoolExecutor
+    :rtype: list [(borme, results or None, exception or None, seconds)]
+            en el orden de bormes
+    """
+    borme_keys = get_lock_keys(bormes)
+    depends = [set(i for i in range(n) if borme_keys[i] & keys)
+               for n, keys in enumerate(borme_keys)]
+
+    pending = set(range(len(bormes)))
+    running = {}
+    finished = {}
+    while pending or running:
+        for n in sorted(pending):
+            if depends[n] <= set(finished):
+                pending.remove(n)
+                future = executor.submit(_import_borme, bormes[n],
+                                         borme_keys[n])
+                running[future] = n
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            finished[running.pop(future)] = future
+
+    results = []
+    for n, borme in enumerate(bormes):
+        try:
+            borme_results, seconds = finished[n].result()
+            results.append((borme, borme_results, None, seconds))
+        except Exception as e:
+            results.append((borme, None, e, 0.0))
+    return results
@@ -0,0 +1,130 @@
+from django.db import connection, transaction
+
+from borme.models import BormeStatsDay, BormeStatsProvinceYear
+
+# Contadores de borme.models.BormeStats, además de actos
+STATS_FIELDS = ['bormes', 'anuncios', 'new_companies', 'extinctions']
+
+# Claves de cada tabla de estadísticas
+STATS_TABLES = [
+    (BormeStatsDay._meta.db_table, ['date']),
+    (BormeStatsProvinceYear._meta.db_table, ['province', 'year']),
+]
+
+# Suma de los actos guardados en la fila y los del BORME importado
+MERGE_ACTOS_SQL = """(
+    SELECT COALESCE(jsonb_object_agg(key, total), '{}'::jsonb)
+    FROM (SELECT key, sum(value::int) AS total
+          FROM (SELECT * FROM jsonb_each_text(t.actos)
+                UNION ALL
+                SELECT * FROM jsonb_each_text(EXCLUDED.actos)) AS e
+          GROUP BY key) AS s)"""
+
+# Resumen de cada BORME. Una sociedad es nueva en el primer BORME en el que
+# aparece (CompanyHistory.in_bormes)
+BORMES_SQL = """
+    SELECT b.date, b.province, date_part('year', b.date)::int AS year,
+           b.actos, COALESCE(a.total, 0) AS anuncios,
+           COALESCE(c.total, 0) AS new_companies,
+           COALESCE((b.actos->>'Extinción')::int, 0) AS extinctions
+    FROM borme_borme AS b
+    LEFT JOIN (SELECT borme_id, count(*) AS total
+               FROM borme_anuncio GROUP BY borme_id) AS a
+           ON a.borme_id = b.cve
+    LEFT JOIN (SELECT in_bormes->0->>'cve' AS cve, count(*) AS total
+               FROM borme_company_history GROUP BY 1) AS c
+           ON c.cve = b.cve"""
+
+REBUILD_SQL = """
+    WITH bormes AS ({bormes}),
+    actos AS (
+        SELECT {keys}, jsonb_object_agg(acto, total) AS actos
+        FROM (SELECT {keys}, e.key AS acto, sum(e.value::int) AS total
+              FROM bormes, jsonb_each_text(bormes.actos) AS e
+              GROUP BY {keys}, e.key) AS s
+        GROUP BY {keys})
+    INSERT INTO {table} ({keys}, bormes, anuncios, new_companies,
+                         extinctions, actos)
+    SELECT {keys}, count(*), sum(anuncios), sum(new_companies),
+           sum(extinctions), COALESCE(actos.actos, '{{}}'::jsonb)
+    FROM bormes LEFT JOIN actos USING ({keys})
+    GROUP BY {keys}, actos.actos"""
+
+
+def update_stats(borme, anuncios, new_companies):
+    """Suma un BORME importado a las tablas de estadísticas.
+
+    Se llama dentro de la transacción del BORME. Cada fila se actualiza con
+    un upsert que suma los contadores a los guardados, así que los BORMEs
+    de un mismo día se pueden importar a la vez en varios procesos.
+
+    :param borme: Borme de la BD, con sus actos (Borme.actos)
+    :param anuncios: Número de anuncios creados
+    :param new_companies: Número de sociedades creadas
+    :type borme: borme.models.Borme
+    :type anuncios: int
+    :type new_companies: int
+    """
+    actos = borme.actos
+    values = [1, anuncios, new_companies, actos.get('Extinción', 0),
+              BormeStatsDay._meta.get_field('actos')
+                                 .get_db_prep_save(actos, connection)]
+    keys = {'date': borme.date, 'province': borme.province,
+            'year': borme.date.year}
+
+    with connection.cursor() as cursor:
+        for table, key_columns in STATS_TABLES:
+            columns = key_columns + STATS_FIELDS + ['actos']
+            assignments = ['{col} = t.{col} + EXCLUDED.{col}'.format(col=col)
+                           for col in STATS_FIELDS]
+            assignments.append('actos = ' + MERGE_ACTOS_SQL)
+            cursor.execute(
+                'INSERT INTO {table} AS t ({columns}) VALUES ({values}) '
+                'ON CONFLICT ({keys}) DO UPDATE SET {assignments}'.format(
+                    table=table, columns=', '.join(columns),
+                    values=', '.join(['%s'] * len(columns)),
+                    keys=', '.join(key_columns),
+                    assignments=', '.join(assignments)),
+                [keys[col] for col in key_columns] + values)
+
+
+def rebuild_stats():
+    """Regenera las tablas de estadísticas a partir de los BORMEs de la BD.
+
+    Los anuncios se cuentan en la tabla Anuncio y los actos se suman a
+    partir de Borme.actos (ver updatebormeactos).
+
+    :rtype: dict {tabla: número de filas}
+    """
+    counts = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table, key_columns in STATS_TABLES:
+            cursor.execute('DELETE FROM {}'.format(table))
+            cursor.execute(REBUILD_SQL.format(bormes=BORMES_SQL, table=table,
+                                              keys=', '.join(key_columns)))
+            counts[table] = cursor.rowcount
+    return counts
+
+
+def rebuild_borme_actos():
+    """Calcula Borme.actos a partir de los anuncios guardados en la BD.
+
+    Sirve para rellenar el campo en una BD importada antes de que existiera.
+    Se hace con una única consulta que cuenta las claves de Anuncio.actos de
+    cada BORME.
+
+    :rtype: int número de BORMEs actualizados
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE borme_borme AS b
+            SET actos = COALESCE(r.actos, '{}'::jsonb)
+            FROM borme_borme AS b2
+            LEFT JOIN (
+                SELECT borme_id, jsonb_object_agg(acto, total) AS actos
+                FROM (SELECT borme_id, acto, count(*) AS total
+                      FROM borme_anuncio, jsonb_object_keys(actos) AS acto
+                      GROUP BY borme_id, acto) AS t
+                GROUP BY borme_id) AS r ON r.borme_id = b2.cve
+            WHERE b.cve = b2.cve""")
+        return cursor.rowcount
@@ -0,0 +1,182 @@
+from django.conf import settings
+
+import datetime
+import json
+import logging
+import os
+
+from bormeparser.borme import BormeXML
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ch = logging.StreamHandler()
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+INDEX_FILENAME = 'index.json'
+
+# Secciones de las que se guardan los CVEs
+SECCIONES = ('A', 'B')
+
+
+def _parse_date(date):
+    if date is None:
+        return None
+    return datetime.datetime.strptime(date, '%Y-%m-%d').date()
+
+
+def _format_date(date):
+    if date is None:
+        return None
+    return date.isoformat()
+
+
+class SumarioEntry(object):
+    """Datos de un sumario BORME-XML guardados en el índice.
+
+    Ofrece los mismos atributos y métodos de BormeXML que usa la importación
+    (date, prev_borme, next_borme, is_final, get_cves, get_urls_cve y
+    get_sizes) sin tener que analizar el XML.
+    """
+
+    def __init__(self, date, prev_borme, next_borme, is_final, cves):
+        """
+        :param cves: {seccion: [(cve, url, size)]} en el orden del sumario
+        """
+        self.date = date
+        self.prev_borme = prev_borme
+        self.next_borme = next_borme
+        self.is_final = is_final
+        self.cves = cves
+
+    @classmethod
+    def from_bormexml(cls, bxml):
+        cves = {}
+        for seccion in SECCIONES:
+            urls = bxml.get_urls_cve(seccion)
+            sizes = bxml.get_sizes(seccion)
+            cves[seccion] = [(cve, url, sizes[cve])
+                             for cve, url in urls.items()
+                             if not cve.endswith('-99')]
+        return cls(bxml.date, bxml.prev_borme, bxml.next_borme,
+                   bxml.is_final, cves)
+
+    @classmethod
+    def from_dict(cls, date, d):
+        cves = {seccion: [tuple(item) for item in items]
+                for seccion, items in d['cves'].items()}
+        return cls(_parse_date(date), _parse_date(d['prev']),
+                   _parse_date(d['next']), d['is_final'], cves)
+
+    def to_dict(self):
+        return {
+            'prev': _format_date(self.prev_borme),
+            'next': _format_date(self.next_borme),
+            'is_final': self.is_final,
+            'cves': self.cves,
+        }
+
+    def _items(self, seccion=None):
+        if seccion:
+            return self.cves.get(seccion, [])
+        return [item for seccion in SECCIONES
+                for item in self.cves.get(seccion, [])]
+
+    def get_cves(self, seccion=None):
+        """Obtiene los CVEs.
+
+        A diferencia de BormeXML.get_cves() siempre devuelve una lista.
+        """
+        return [cve for cve, _, _ in self._items(seccion)]
+
+    def get_urls_cve(self, seccion=None):
+        return {cve: url for cve, url, _ in self._items(seccion)}
+
+    def get_sizes(self, seccion=None):
+        return {cve: size for cve, _, size in self._items(seccion)}
+
+
+class SumarioIndex(object):
+    """Índice de los sumarios BORME-XML descargados.
+
+    Guarda por cada fecha sus CVEs, la fecha anterior y siguiente y si el
+    sumario es definitivo, en un archivo JSON por año dentro de
+    BORME_XML_ROOT. Así se puede recorrer un rango de fechas sin analizar
+    cada sumario XML.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.BORME_XML_ROOT
+        self._years = {}
+
+    def _get_filepath(self, year):
+        return os.path.join(self.root, str(year), INDEX_FILENAME)
+
+    def _load_year(self, year):
+        if year not in self._years:
+            try:
+                with open(self._get_filepath(year)) as fp:
+                    self._years[year] = json.load(fp)
+            except FileNotFoundError:
+                self._years[year] = {}
+        return self._years[year]
+
+    def _save_year(self, year):
+        filepath = self._get_filepath(year)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath + '.part', 'w') as fp:
+            json.dump(self._years[year], fp, sort_keys=True,
+                      separators=(',', ':'))
+        os.replace(filepath + '.part', filepath)
+
+    def get(self, date):
+        """Devuelve la entrada del índice de una fecha.
+
+        :rtype: borme.parser.sumario.SumarioEntry or None
+        """
+        d = self._load_year(date.year).get(date.isoformat())
+        if d is None:
+            return None
+        return SumarioEntry.from_dict(date.isoformat(), d)
+
+    def add(self, bxml, save=True):
+        """Añade o actualiza en el índice la entrada de un sumario.
+
+        :type bxml: bormeparser.BormeXML
+        :rtype: borme.parser.sumario.SumarioEntry
+        """
+        entry = SumarioEntry.from_bormexml(bxml)
+        self._load_year(entry.date.year)[entry.date.isoformat()] = \
+            entry.to_dict()
+        if save:
+            self._save_year(entry.date.year)
+        return entry
+
+    def build(self):
+        """Genera el índice a partir de los archivos en BORME_XML_ROOT.
+
+        :rtype: int número de sumarios indexados
+        """
+        self._years = {}
+        years = set()
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not (filename.startswith('BORME-S-') and
+                        filename.endswith('.xml')):
+                    continue
+                try:
+                    bxml = BormeXML.from_file(os.path.join(dirpath,
+                                                           filename))
+                except Exception as e:
+                    logger.error('[X] Error reading %s' % filename)
+                    logger.error('[X] %s: %s' % (e.__class__.__name__, e))
+                    continue
+                self.add(bxml, save=False)
+                years.add(bxml.date.year)
+                total += 1
+
+        for year in years:
+            self._save_year(year)
+        return total
@@ -0,0 +1,225 @@
+from django.db import DatabaseError, transaction
+
+from borme.documents import IndexBuffer
+from borme.models import Anuncio, Cargo, Company, Person, save_history
+from borme.utils.postgres import bulk_update, bulk_upsert
+
+from .identity import IdentityMap
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+ch = logging.StreamHandler()
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+BATCH_SIZE = 500
+
+# El campo document lo calcula un trigger de la BD, no la importación
+UPDATE_FIELDS = {
+    Company: [f.name for f in Company._meta.concrete_fields
+              if not f.primary_key and f.name != 'document'],
+    Person: [f.name for f in Person._meta.concrete_fields
+             if not f.primary_key and f.name != 'document'],
+    Anuncio: ['borme', 'company', 'datos_registrales', 'actos'],
+    Cargo: ['date_to'],
+}
+
+
+class UnitOfWork(IdentityMap):
+    """Escritura diferida de las entidades de un BORME.
+
+    Además de servir de mapa de identidad, registra las sociedades, personas y
+    anuncios modificados durante la importación. Nada se escribe en la BD
+    hasta que se llama a flush(), que guarda cada entidad una sola vez con
+    bulk_create (nuevas) o bulk_update (existentes), aunque se haya
+    modificado en varios anuncios.
+
+    El historial de las sociedades y personas se guarda con bulk_upsert: los
+    elementos añadidos a sus listas JSON sin leerlas se concatenan en la BD
+    (ver borme.models.save_history()).
+
+    Los cargos (borme.models.Cargo) se crean y se cierran con los métodos
+    cargo_entrante(), cargo_saliente() y extinguir_cargos().
+
+    Las sociedades y personas guardadas se indexan en Elasticsearch con
+    peticiones _bulk cuando se confirma la transacción (ver
+    borme.documents.IndexBuffer).
+
+    Como nada se escribe antes de flush(), los errores de un anuncio no se
+    aíslan con un savepoint sino con atomic(), que también deshace las
+    entidades marcadas para guardar.
+    """
+
+    def __init__(self, year):
+        super(UnitOfWork, self).__init__(year)
+        self.dirty = {Company: {}, Person: {}, Anuncio: {}, Cargo: {}}
+        self.extinguidas = {}
+        self.index = IndexBuffer()
+
+    def register_dirty(self, obj):
+        """Marca una entidad para que se guarde en el próximo flush()."""
+        dirty = self.dirty[obj.__class__]
+        if id(obj) not in dirty:
+            dirty[id(obj)] = obj
+            self._journal(dirty.pop, id(obj))
+
+    def cargo_entrante(self, company, holder, title, date, anuncio):
+        """Nombramiento de una persona o sociedad en un cargo de company.
+
+        :type company: borme.models.Company
+        :type holder: borme.models.Person o borme.models.Company
+        :type title: str
+        :type date: datetime.date
+        :type anuncio: borme.models.Anuncio
+        """
+        self.get_cargos(company.slug)
+        cargo = _new_cargo(company, holder, title, anuncio, date_from=date)
+        self.add_cargo(cargo)
+        self.register_dirty(cargo)
+
+    def cargo_saliente(self, company, holder, title, date, anuncio):
+        """Cese de una persona o sociedad en un cargo de company.
+
+        Cierra el primer cargo vigente con el mismo título. Si no hay
+        ninguno, crea el cargo sin fecha de nombramiento.
+        """
+        cargo = self.pop_cargo(company, holder, title)
+        if cargo is not None:
+            self._touch(cargo)
+            cargo.date_to = date
+        else:
+            cargo = _new_cargo(company, holder, title, anuncio, date_to=date)
+        self.register_dirty(cargo)
+
+    def extinguir_cargos(self, company, date):
+        """Cierra todos los cargos vigentes en los que participa una sociedad
+        que se extingue: los que hay en ella y los que ella ocupa en otras.
+
+        Los que ocupa en sociedades que no están en el mapa se cierran en
+        la BD en el próximo flush().
+        """
+        cargos = list(self.get_cargos(company.slug).values())
+        cargos.extend(cargo for cargo in self.cargos_holder.get(company.slug,
+                                                                {}).values()
+                      if cargo.company_id != company.slug)
+        for cargo in cargos:
+            self._touch(cargo)
+            cargo.date_to = date
+            self.remove_cargo(cargo)
+            self.register_dirty(cargo)
+        if company.slug not in self.extinguidas:
+            self.extinguidas[company.slug] = date
+            self._journal(self.extinguidas.pop, company.slug)
+
+    def flush(self):
+        """Guarda en la BD todas las entidades modificadas.
+
+        Si la escritura en bloque falla, se guarda cada entidad por separado
+        en su propio savepoint para que el error quede aislado.
+
+        :rtype: int errors
+        """
+        for model in (Company, Person):
+            self.index.add(model, (obj.slug
+                                   for obj in self.dirty[model].values()))
+        with self.index:
+            try:
+                with transaction.atomic():
+                    self._flush_extinguidas()
+                    for model in (Company, Person, Anuncio, Cargo):
+                        self._flush_bulk(model,
+                                         list(self.dirty[model].values()))
+                errors = 0
+            except DatabaseError as e:
+                logger.error("[X] Bulk flush failed, saving one by one")
+                logger.error("[X] {}: {}".format(e.__class__.__name__, e))
+                errors = self._flush_one_by_one()
+        transaction.on_commit(self.index.flush)
+
+        for dirty in self.dirty.values():
+            dirty.clear()
+        self.extinguidas.clear()
+        return errors
+
+    def _flush_extinguidas(self):
+        # Antes de escribir los cargos del BORME, para no cerrar los que se
+        # crean después de la extinción. Una consulta por fecha
+        slugs = {}
+        for slug, date in self.extinguidas.items():
+            slugs.setdefault(date, []).append(slug)
+        for date, date_slugs in slugs.items():
+            Cargo.objects.filter(holder_company_id__in=date_slugs,
+                                 date_to__isnull=True).update(date_to=date)
+
+    def _flush_bulk(self, model, objs):
+        if model is Anuncio:
+            for obj in objs:
+                # La sociedad puede ser nueva en este mismo BORME
+                obj.company_id = obj.company.pk
+        elif model is Cargo:
+            for obj in objs:
+                # El anuncio puede ser nuevo en este mismo BORME
+                if obj._state.adding and obj.anuncio is not None:
+                    obj.anuncio_id = obj.anuncio.pk
+        else:
+            for obj in objs:
+                obj.prepare_save()
+            # Antes que la entidad, que guarda los contadores del historial
+            save_history(objs, batch_size=BATCH_SIZE)
+
+        new_objs = [obj for obj in objs if obj._state.adding]
+        old_objs = [obj for obj in objs if not obj._state.adding]
+
+        model.objects.bulk_create(new_objs, batch_size=BATCH_SIZE)
+        for obj in new_objs:
+            obj._state.adding = False
+
+        if model in (Company, Person):
+            # El INSERT de bulk_upsert dispara el trigger de document en cada
+            # fila aunque acabe en UPDATE: solo se usa si hay campos diferidos
+            upsert_objs = [obj for obj in old_objs
+                           if obj.get_deferred_fields() or obj.json_appends]
+            old_objs = [obj for obj in old_objs
+                        if not obj.get_deferred_fields()
+                        and not obj.json_appends]
+            bulk_upsert(upsert_objs, UPDATE_FIELDS[model],
+                        batch_size=BATCH_SIZE)
+        bulk_update(old_objs, UPDATE_FIELDS[model], batch_size=BATCH_SIZE)
+
+    def _flush_one_by_one(self):
+        errors = 0
+        self._flush_extinguidas()
+        for model in (Company, Person, Anuncio, Cargo):
+            for obj in self.dirty[model].values():
+                try:
+                    with transaction.atomic():
+                        if model is Anuncio:
+                            obj.company = obj.company
+                            obj.save()
+                        elif model is Cargo:
+                            if obj._state.adding and obj.anuncio is not None:
+                                obj.anuncio_id = obj.anuncio.pk
+                            obj.save()
+                        elif obj._state.adding:
+                            obj.save()
+                        else:
+                            # save() no guardaría los elementos añadidos a
+                            # las listas diferidas
+                            self._flush_bulk(model, [obj])
+                except DatabaseError as e:
+                    logger.error("[X] ERROR saving {} {}".format(
+                                 model.__name__, obj.pk))
+                    logger.error("[X] {}: {}".format(e.__class__.__name__, e))
+                    errors += 1
+        return errors
+
+
+def _new_cargo(company, holder, title, anuncio, **dates):
+    if isinstance(holder, Person):
+        return Cargo(company=company, holder_person=holder, title=title,
+                     anuncio=anuncio, **dates)
+    return Cargo(company=company, holder_company=holder, title=title,
+                 anuncio=anuncio, **dates)
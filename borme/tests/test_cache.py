@@ -0,0 +1,65 @@
+from borme.parser.cache import PARSER_VERSION, get_cache_filepath, parse_pdf
+from borme.parser.downloader import sha256sum
+
+from unittest import mock
+
+import os
+import shutil
+import tempfile
+
+import bormeparser
+
+from django.test import SimpleTestCase, override_settings
+
+THIS_PATH = os.path.dirname(os.path.abspath(__file__))
+FILES_PATH = os.path.join(THIS_PATH, 'files')
+
+
+class TestParseCache(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(BORME_CACHE_ROOT=self.tmpdir)
+        self.settings.enable()
+        self.filepath = os.path.join(FILES_PATH, 'BORME-A-2015-27-10.pdf')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_once(self):
+        """Un BORME-PDF sin cambios solo se analiza una vez"""
+        borme1 = parse_pdf(self.filepath)
+        checksum = sha256sum(self.filepath)
+        self.assertTrue(os.path.exists(get_cache_filepath(checksum)))
+
+        with mock.patch('bormeparser.parse') as parse:
+            borme2 = parse_pdf(self.filepath)
+        self.assertFalse(parse.called)
+
+        self.assertEqual(borme2.cve, borme1.cve)
+        self.assertEqual(borme2.filename, self.filepath)
+        self.assertEqual(borme2.anuncios_rango, borme1.anuncios_rango)
+        self.assertEqual(len(borme2.get_anuncios()), 30)
+
+    def test_parser_version(self):
+        """Las entradas de otra versión de bormeparser se ignoran"""
+        parse_pdf(self.filepath)
+        os.rename(os.path.join(self.tmpdir, PARSER_VERSION),
+                  os.path.join(self.tmpdir, '0.0.1'))
+
+        with mock.patch('bormeparser.parse',
+                        wraps=bormeparser.parse) as parse:
+            parse_pdf(self.filepath)
+        self.assertTrue(parse.called)
+
+    def test_url(self):
+        """La URL conocida se guarda en la entrada y se usa al cargarla"""
+        url = 'https://www.boe.es/borme/dias/2015/02/10/pdfs/' \
+              'BORME-A-2015-27-10.pdf'
+        with mock.patch('bormeparser.borme.get_url_pdf',
+                        side_effect=AssertionError):
+            borme1 = parse_pdf(self.filepath, url=url)
+            borme2 = parse_pdf(self.filepath)
+        self.assertEqual(borme1.url, url)
+        self.assertEqual(borme2.url, url)
@@ -0,0 +1,80 @@
+from borme.calendar import (
+        BormeCalendarIndex,
+        LibreBormeAvailableCalendar,
+        LibreBormeCalendar,
+        get_calendar_index,
+        invalidate_calendar_index,
+)
+from borme.models import Borme, Config
+import borme.calendar
+
+import datetime
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+ROWS = [
+    ('BORME-A-2015-1-04', datetime.date(2015, 1, 2), 'Almería'),
+    ('BORME-A-2015-1-10', datetime.date(2015, 1, 2), 'Cáceres'),
+    ('BORME-A-2015-2-04', datetime.date(2015, 1, 5), 'Almería'),
+    ('BORME-A-2015-2-10-1', datetime.date(2015, 1, 5), 'Cáceres'),
+    ('BORME-A-2016-250-04', datetime.date(2016, 12, 30), 'Almería'),
+]
+
+
+class TestCalendarIndex(SimpleTestCase):
+
+    def test_days(self):
+        index = BormeCalendarIndex(1, ROWS)
+        self.assertTrue(index.has_borme(datetime.date(2015, 1, 2)))
+        self.assertTrue(index.has_borme(datetime.date(2016, 12, 30)))
+        self.assertFalse(index.has_borme(datetime.date(2015, 1, 3)))
+        self.assertFalse(index.has_borme(datetime.date(2014, 1, 2)))
+
+    def test_cves(self):
+        index = BormeCalendarIndex(1, ROWS)
+        for cve, date, province in ROWS:
+            self.assertEqual(index.get_cve(province, date), cve)
+        self.assertIsNone(index.get_cve('Cáceres',
+                                        datetime.date(2016, 12, 30)))
+        self.assertIsNone(index.get_cve('Madrid', datetime.date(2015, 1, 2)))
+        # Solo se guarda aparte el cve que no sigue el formato
+        self.assertEqual(list(index.cves), [('Cáceres',
+                                             datetime.date(2015, 1, 5))])
+
+
+class TestCalendarRender(TestCase):
+
+    def setUp(self):
+        # El índice del proceso puede venir de otro test con la misma versión
+        borme.calendar._index = None
+        Config.objects.create(version='test', last_modified=timezone.now())
+        for cve, date, province in ROWS:
+            Borme.objects.create(cve=cve, date=date, province=province,
+                                 url='', from_reg=1, until_reg=1,
+                                 section='A')
+        invalidate_calendar_index()
+
+    def test_render(self):
+        get_calendar_index()
+        with self.settings(CALENDAR_CHECK_INTERVAL=60), \
+                self.assertNumQueries(0):
+            month = LibreBormeCalendar().formatmonth(
+                                                datetime.date(2015, 1, 1))
+            year = LibreBormeAvailableCalendar().formatyear(2015, 'Cáceres')
+        self.assertIn('/borme/fecha/2015-1-2', month)
+        self.assertNotIn('/borme/fecha/2015-1-3', month)
+        self.assertIn('BORME-A-2015-1-10', year)
+        self.assertIn('BORME-A-2015-2-10-1', year)
+        self.assertNotIn('BORME-A-2015-1-04', year)
+
+    def test_refresh(self):
+        """La importación de un BORME nuevo recarga el índice"""
+        date = datetime.date(2015, 1, 7)
+        self.assertFalse(get_calendar_index().has_borme(date))
+        Borme.objects.create(cve='BORME-A-2015-3-04', date=date,
+                             province='Almería', url='', from_reg=1,
+                             until_reg=1, section='A')
+        self.assertFalse(get_calendar_index().has_borme(date))
+        invalidate_calendar_index()
+        self.assertTrue(get_calendar_index().has_borme(date))
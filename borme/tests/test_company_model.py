@@ -23,6 +23,24 @@ class TestCompanyModel(TestCase):
         self.assertEqual(find[0].slug, 'patatas-juan-sl')
         self.assertEqual(find[0].date_updated, today)
 
+    def test_summary(self):
+        with self.assertNumQueries(1):
+            c = Company.objects.summary().get(name='PATATAS JUAN SL')
+            self.assertEqual(c.slug, 'patatas-juan-sl')
+            self.assertTrue(c.is_active)
+            self.assertEqual(c.total_bormes, 0)
+        self.assertEqual(c.get_deferred_fields(),
+                         {'nif', 'date_creation', 'date_extinction',
+                          'cargos_actuales_p', 'cargos_actuales_c',
+                          'document'})
+
+        # Las listas del historial se leen en la misma consulta
+        with self.assertNumQueries(1):
+            c = Company.objects.summary('history__in_bormes') \
+                               .get(name='PATATAS JUAN SL')
+            self.assertEqual(c.in_bormes, [])
+        self.assertIn('cargos_historial_p', c.history.get_deferred_fields())
+
     def test_update_cargos(self):
         c = Company.objects.get(name='PATATAS JUAN SL')
         self.assertEqual(c.get_cargos_actuales()[0], [])
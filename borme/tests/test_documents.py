@@ -0,0 +1,116 @@
+from borme.documents import CompanyDocument, PersonDocument
+from borme.models import Company, Person
+from borme.parser.actos import extinguir_sociedad
+from borme.tests.test_import import load_borme_from_gzipped_json
+from borme.utils.strings import slug2
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from unittest import mock
+
+import datetime
+import json
+
+from django.test import TransactionTestCase, override_settings
+from elasticsearch_dsl.connections import connections
+
+
+class FakeElasticsearch(BaseHTTPRequestHandler):
+    """Servidor ES que acepta todas las peticiones _bulk"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        lines = [json.loads(line) for line in body.decode().splitlines()
+                 if line]
+        actions = [line for line in lines if 'index' in line]
+        self.server.requests.append((self.path, actions))
+        response = {
+            'took': 1,
+            'errors': False,
+            'items': [{'index': {'_id': action['index']['_id'],
+                                 'status': 201}}
+                      for action in actions],
+        }
+        self._reply(response)
+
+    def do_GET(self):
+        self.server.requests.append((self.path, []))
+        self._reply({})
+
+    do_PUT = do_HEAD = do_GET
+
+    def _reply(self, response):
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(ELASTICSEARCH_BULK_CHUNK_SIZE=100)
+class TestIndexBuffer(TransactionTestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('localhost', 0), FakeElasticsearch)
+        self.server.requests = []
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        connections.create_connection(
+                hosts=['localhost:{}'.format(self.server.server_port)])
+        patcher = mock.patch('borme.documents.autosync_enabled',
+                             return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        connections.remove_connection('default')
+
+    def test_import_bulk(self):
+        """Las sociedades y personas de un BORME se indexan al confirmar la
+           transacción, una vez cada una y con peticiones _bulk
+        """
+        load_borme_from_gzipped_json("BORME-A-2009-197-28.json.gz")
+
+        ids = {}
+        for path, actions in self.server.requests:
+            self.assertTrue(path.startswith('/_bulk'), path)
+            self.assertLessEqual(len(actions), 100)
+            for action in actions:
+                doc_type = action['index']['_type']
+                ids.setdefault(doc_type, []).append(action['index']['_id'])
+
+        companies = ids[CompanyDocument._doc_type.mapping.doc_type]
+        persons = ids[PersonDocument._doc_type.mapping.doc_type]
+        self.assertCountEqual(companies,
+                              Company.objects.values_list('slug', flat=True))
+        self.assertCountEqual(persons,
+                              Person.objects.values_list('slug', flat=True))
+        self.assertGreater(len(self.server.requests), 2)
+        self.assertFalse(CompanyDocument._doc_type.ignore_signals)
+
+    def test_extinguir_sociedad(self):
+        """La extinción fuera de una importación también indexa la sociedad
+           y sus consejeros con peticiones _bulk
+        """
+        load_borme_from_gzipped_json("BORME-A-2009-197-28.json.gz")
+        company = Company.objects.exclude(cargos_actuales_p=[]).first()
+        expected = {company.slug}
+        expected.update(slug2(cargo['name'])
+                        for cargo in (company.cargos_actuales_p +
+                                      company.cargos_actuales_c))
+        self.server.requests = []
+
+        extinguir_sociedad(company, datetime.date(2015, 1, 1))
+
+        # Una petición para las sociedades y otra para las personas
+        self.assertEqual(len(self.server.requests), 2)
+        ids = []
+        for path, actions in self.server.requests:
+            self.assertTrue(path.startswith('/_bulk'), path)
+            ids.extend(action['index']['_id'] for action in actions)
+        self.assertCountEqual(ids, expected)
@@ -0,0 +1,155 @@
+from borme.parser.downloader import (CHECKSUMS_FILENAME, BormeDownloader,
+                                     read_checksums)
+import borme.parser.downloader
+
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+THIS_PATH = os.path.dirname(os.path.abspath(__file__))
+FILES_PATH = os.path.join(THIS_PATH, 'files')
+
+CVES = ('BORME-A-2015-27-10', 'BORME-A-2012-246-28')
+FILENAMES = {
+    'BORME-A-2015-27-10': 'BORME-A-2015-27-10.pdf',
+    'BORME-A-2012-246-28': 'BORME-A-2012-246-28.json.gz',
+}
+
+# Disable loggers
+borme.parser.downloader.logger.setLevel(logging.ERROR)
+
+
+class FixturesHandler(SimpleHTTPRequestHandler):
+    """Sirve los archivos de borme/tests/files como si fuera el BOE"""
+
+    def translate_path(self, path):
+        self.server.requests.append(path)
+        if self.server.failures:
+            self.server.failures -= 1
+            return os.path.join(FILES_PATH, 'missing')
+        return os.path.join(FILES_PATH, os.path.basename(path))
+
+    def log_message(self, *args):
+        pass
+
+
+class FixturesServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super(FixturesServer, self).__init__(('127.0.0.1', 0),
+                                             FixturesHandler)
+        self.requests = []
+        self.failures = 0
+
+
+class FakeBormeXML(object):
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def get_cves(self, seccion=None):
+        return list(CVES)
+
+    def get_urls_cve(self, seccion=None):
+        return {cve: self.base_url + FILENAMES[cve] for cve in CVES}
+
+    def get_sizes(self, seccion=None):
+        return {cve: os.path.getsize(os.path.join(FILES_PATH, FILENAMES[cve]))
+                for cve in CVES}
+
+
+class TestBormeDownloader(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestBormeDownloader, cls).setUpClass()
+        cls.server = FixturesServer()
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.bxml = FakeBormeXML('http://127.0.0.1:{}/'
+                                .format(cls.server.server_port))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(TestBormeDownloader, cls).tearDownClass()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server.requests = []
+        self.server.failures = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def download(self):
+        with BormeDownloader(workers=2, backoff=0) as downloader:
+            return downloader.download_borme(self.bxml, self.tmpdir, 'A')
+
+    def assertDownloaded(self, files):
+        self.assertEqual(files, [os.path.join(self.tmpdir, '%s.pdf' % cve)
+                                 for cve in CVES])
+        for cve, filepath in zip(CVES, files):
+            with open(os.path.join(FILES_PATH, FILENAMES[cve]), 'rb') as fp:
+                expected = fp.read()
+            with open(filepath, 'rb') as fp:
+                self.assertEqual(fp.read(), expected)
+
+    def test_download(self):
+        """Descarga los archivos del sumario y anota sus sumas"""
+        files = self.download()
+        self.assertDownloaded(files)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir,
+                                                    CHECKSUMS_FILENAME)))
+
+    def test_skip_downloaded(self):
+        """No descarga de nuevo los archivos que ya están en disco"""
+        self.download()
+        self.server.requests = []
+
+        files = self.download()
+        self.assertDownloaded(files)
+        self.assertEqual(self.server.requests, [])
+
+    def test_corrupt_file(self):
+        """Descarga de nuevo un archivo del mismo tamaño pero otra suma"""
+        files = self.download()
+        with open(files[0], 'r+b') as fp:
+            fp.write(b'XXXX')
+        self.server.requests = []
+
+        files = self.download()
+        self.assertDownloaded(files)
+        self.assertEqual(self.server.requests, ['/BORME-A-2015-27-10.pdf'])
+
+    def test_without_checksum(self):
+        """Da por descargados los archivos del tamaño correcto que no tienen
+           suma anotada y la anota
+        """
+        files = self.download()
+        checksums = read_checksums(self.tmpdir)
+        os.unlink(os.path.join(self.tmpdir, CHECKSUMS_FILENAME))
+        self.server.requests = []
+
+        files = self.download()
+        self.assertDownloaded(files)
+        self.assertEqual(self.server.requests, [])
+        self.assertEqual(read_checksums(self.tmpdir), checksums)
+
+    def test_retry(self):
+        """Reintenta las descargas que fallan"""
+        self.server.failures = 2
+        files = self.download()
+        self.assertDownloaded(files)
+        self.assertEqual(len(self.server.requests), 4)
@@ -0,0 +1,90 @@
+from borme.hide import hide_persons, new_slug
+from borme.models import Anuncio, Cargo, Company, Config, Person
+from borme.tests.test_import import load_borme_from_gzipped_json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from unittest import mock
+
+
+def _anuncios_with(name):
+    return [anuncio for anuncio in Anuncio.objects.all()
+            if any(name in [cargo['name'] for cargo in value]
+                   for value in anuncio.actos.values()
+                   if isinstance(value, list))]
+
+
+class TestHidePersons(TestCase):
+
+    def setUp(self):
+        Config.objects.create(version='test', last_modified=timezone.now())
+        load_borme_from_gzipped_json("BORME-A-2009-197-28.json.gz")
+        cargo = Cargo.objects.filter(holder_person__isnull=False) \
+                             .order_by('holder_person_id').first()
+        self.person = Person.objects.get(slug=cargo.holder_person_id)
+        cache.clear()
+
+    def test_hide(self):
+        slug, name = self.person.slug, self.person.name
+        in_companies = self.person.in_companies
+        total_cargos = Cargo.objects.filter(holder_person_id=slug).count()
+        anuncios = _anuncios_with(name)
+        self.assertTrue(anuncios)
+        url = reverse('borme-persona', args=[slug])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        hidden = hide_persons([slug, 'no-existe'], batch_size=1,
+                              hosts=['testserver'])
+
+        self.assertEqual(list(hidden), [slug])
+        self.assertFalse(Person.objects.filter(slug=slug).exists())
+        person = Person.objects.get(slug=hidden[slug])
+        self.assertNotEqual(person.name, name)
+        self.assertEqual(person.in_companies, in_companies)
+        self.assertEqual(Cargo.objects.filter(holder_person=person).count(),
+                         total_cargos)
+
+        match = [{'name': name}]
+        self.assertFalse(Company.objects.filter(
+            cargos_actuales_p__contains=match).exists())
+        self.assertFalse(Company.objects.filter(
+            history__cargos_historial_p__contains=match).exists())
+        self.assertEqual(_anuncios_with(name), [])
+        self.assertEqual(len(_anuncios_with(person.name)), len(anuncios))
+
+        # La página cacheada se ha borrado
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_resume(self):
+        """Si se interrumpe antes de mover la persona, una segunda ejecución
+           asigna el mismo slug que los lotes ya reescritos
+        """
+        slug, name = self.person.slug, self.person.name
+        with mock.patch('borme.hide._person_sql', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                hide_persons([slug], batch_size=1, hosts=['testserver'])
+        self.assertTrue(Person.objects.filter(slug=slug).exists())
+
+        hidden = hide_persons([slug], batch_size=1, hosts=['testserver'])
+
+        person = Person.objects.get(slug=hidden[slug])
+        self.assertFalse(Company.objects.filter(
+            cargos_actuales_p__contains=[{'name': name}]).exists())
+        cargos = [cargo for company in Company.objects.all()
+                  for cargo in company.cargos_actuales_p
+                  if cargo['name'] == person.name]
+        self.assertTrue(cargos)
+        self.assertEqual({cargo['slug'] for cargo in cargos}, {person.slug})
+
+    def test_new_slug(self):
+        """El slug no se puede calcular solo a partir del nombre"""
+        with override_settings(SECRET_KEY='uno'):
+            slug = new_slug('J. G. P.', 'juan-garcia-perez')
+            self.assertEqual(new_slug('J. G. P.', 'juan-garcia-perez'), slug)
+        self.assertTrue(slug.startswith('J-G-P-'))
+        with override_settings(SECRET_KEY='dos'):
+            self.assertNotEqual(new_slug('J. G. P.', 'juan-garcia-perez'),
+                                slug)
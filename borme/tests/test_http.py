@@ -1,10 +1,13 @@
 from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.test.client import Client
 from django.utils.six import StringIO
 from django.conf import settings
 
-from borme.models import Anuncio, Borme, Config, Company, Person
+from borme.dashboard import get_dashboard, refresh_dashboard
+from borme.models import Anuncio, Borme, Cargo, Config, Company, Person
 from django.test import TestCase
 
 #from django.contrib.auth.models import User
@@ -29,8 +32,12 @@ class TestBasicHttp(TestCase):
         b = Borme.objects.create(cve='BORME-Z-1111', date=today, url='http://localhost', from_reg=1, until_reg=10, province='Nowhere', section='A')
         c = Company(name='EMPRESA RANDOM', type='SL', date_updated=today)
         c.save()
-        Person.objects.create(name='PERSONA RANDOM', date_updated=today)
+        p = Person.objects.create(name='PERSONA RANDOM', date_updated=today)
         a = Anuncio.objects.create(id_anuncio=1, year=1800, borme=b, company=c)
+        Cargo.objects.create(company=c, holder_person=p, title='Adm. Unico',
+                             date_from=today, anuncio=a)
+        Cargo.objects.create(company=c, holder_person=p, title='Apoderado',
+                             date_to=today, anuncio=a)
         c.anuncios = [{"year": 1800, "id": a.id}]
         c.save()
         Config.objects.create(version='test', last_modified=timezone.now())
@@ -57,6 +64,37 @@ class TestBasicHttp(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 404)
 
+    def test_cargos(self):
+        company = Company.objects.get(name='EMPRESA RANDOM')
+        response = self.client.get(reverse('borme-empresa',
+                                           args=[company.slug]))
+        self.assertContains(response, 'Adm. Unico')
+        self.assertContains(response, 'Apoderado')
+        self.assertEqual(response.context['persons'], ['PERSONA RANDOM'])
+
+        url = reverse('borme-empresa-csv-historial', args=[company.slug])
+        response = self.client.get(url)
+        self.assertEqual(response.content.decode().splitlines()[1],
+                         'Apoderado,Persona Random,,{},person'.format(today))
+
+        person = Person.objects.get(name='PERSONA RANDOM')
+        response = self.client.get(reverse('borme-persona',
+                                           args=[person.slug]))
+        self.assertContains(response, 'Adm. Unico')
+
+        url = reverse('api_dispatch_detail',
+                      kwargs={'api_name': 'v1', 'resource_name': 'empresa',
+                              'pk': company.slug})
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url).json()
+        # Una consulta para los cargos actuales y otra para los pasados
+        self.assertEqual(len([query for query in queries
+                              if '"borme_cargo"' in query['sql']]), 2)
+        self.assertEqual(data['cargos_actuales_p'],
+                         [{'title': 'Adm. Unico', 'name': 'PERSONA RANDOM',
+                           'date_from': today.isoformat()}])
+        self.assertEqual(data['cargos_historial_c'], [])
+
     def test_anuncio(self):
         anuncio = Anuncio.objects.get(id_anuncio=1, year=1800)
         url = reverse('borme-anuncio', args=[anuncio.year, anuncio.id_anuncio])
@@ -92,12 +130,36 @@ class TestBasicHttp(TestCase):
         response = self.client.get('/wrongurl/')
         self.assertEqual(response.status_code, 404)
 
+    def test_dashboard(self):
+        """La página de inicio solo lee los datos calculados en la caché"""
+        refresh_dashboard()
+        with self.assertNumQueries(0):
+            dashboard = get_dashboard()
+        self.assertEqual(dashboard['random_companies'],
+                         [{'slug': 'empresa-random',
+                           'fullname': 'Empresa Random SL'}])
+        self.assertEqual(dashboard['random_persons'],
+                         [{'slug': 'persona-random', 'name': 'PERSONA RANDOM'}])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('borme-home'))
+        self.assertContains(response, 'Empresa Random SL')
+
     def test_busqueda(self):
         url = reverse('borme-search')
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         # self.client.post
 
+    def test_busqueda_postgres(self):
+        """Si Elasticsearch no responde se busca en PostgreSQL"""
+        url = reverse('borme-search')
+        with self.settings(ELASTICSEARCH_URI='http://localhost:1'):
+            response = self.client.get(url, {'q': 'random', 'page': 1,
+                                             'type': 'all'})
+        self.assertContains(response, 'Empresa Random SL')
+        self.assertContains(response, 'Persona Random')
+
     """
     TODO:
 
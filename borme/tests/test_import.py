@@ -1,14 +1,35 @@
-from borme.models import Anuncio, Borme, Company
+from borme.models import (Anuncio, Borme, BormeLog, BormeStatsDay,
+                          BormeStatsProvinceYear, Cargo, Company, Person)
+from borme.parser.actos import extinguir_sociedad
+from borme.parser.cargos import rebuild_cargos
+from borme.parser.postgres import psql_update_documents
+from borme.parser.shard import create_import_executor
+from borme.parser.stats import rebuild_borme_actos, rebuild_stats
+from borme.parser.unitofwork import UnitOfWork
+import borme.parser.bulk
+import borme.parser.cargos
 import borme.parser.importer
 import borme.parser.logger
+import borme.parser.postgres
+import borme.parser.unitofwork
 import borme.utils.strings
 
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from unittest import mock
+
 import datetime
 import gzip
 import logging
 import os
+import shutil
+import tempfile
 
-from django.test import TestCase
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 
 THIS_PATH = os.path.dirname(os.path.abspath(__file__))
 FILES_PATH = os.path.join(THIS_PATH, 'files')
@@ -16,7 +37,11 @@ FILES_PATH = os.path.join(THIS_PATH, 'files')
 # Disable loggers
 borme.utils.strings.logger.setLevel(logging.ERROR)
 borme.parser.importer.logger.setLevel(logging.ERROR)
+borme.parser.bulk.logger.setLevel(logging.ERROR)
+borme.parser.cargos.logger.setLevel(logging.ERROR)
 borme.parser.logger.logger.setLevel(logging.ERROR)
+borme.parser.postgres.logger.setLevel(logging.ERROR)
+borme.parser.unitofwork.logger.setLevel(logging.CRITICAL)
 
 
 def load_borme_from_gzipped_json(filename):
@@ -31,7 +56,9 @@ class TestImport(TestCase):
     def test_import_borme(self):
         """Importa un BORME-PDF"""
         filepath = os.path.join(FILES_PATH, 'BORME-A-2015-27-10.pdf')
-        borme.parser.importer.from_pdf_file(filepath, create_json=False)
+        ret, _ = borme.parser.importer.from_pdf_file(filepath,
+                                                     create_json=False)
+        self.assertTrue(ret)
         find = Borme.objects.filter(cve='BORME-A-2015-27-10')
         self.assertEqual(len(find), 1)
         self.assertEqual(Anuncio.objects.count(), 30)
@@ -89,3 +116,604 @@ class TestImportAnuncios(TestCase):
         company = Company.objects.get(slug='pulso-2000')
         self.assertEqual(company.is_active, False)
         self.assertEqual(company.date_extinction, datetime.date(2012, 12, 26))
+
+    def test_borme_actos(self):
+        """Borme.actos cuenta los anuncios con cada acto"""
+        borme = Borme.objects.get(cve='BORME-A-2012-246-28')
+        resumen = Counter()
+        for actos in Anuncio.objects.filter(borme=borme) \
+                                    .values_list('actos', flat=True):
+            resumen.update(actos.keys())
+        self.assertEqual(borme.actos, dict(resumen))
+        self.assertEqual(borme.actos['Extinción'], resumen['Extinción'])
+
+        # updatebormeactos obtiene lo mismo
+        Borme.objects.update(actos={})
+        self.assertEqual(rebuild_borme_actos(), 1)
+        self.assertEqual(Borme.objects.get(cve=borme.cve).actos, dict(resumen))
+
+    def test_stats(self):
+        """La importación suma el BORME a las tablas de estadísticas"""
+        borme = Borme.objects.get(cve='BORME-A-2012-246-28')
+        stats = BormeStatsDay.objects.get(date=borme.date)
+        self.assertEqual(stats.bormes, 1)
+        self.assertEqual(stats.anuncios, Anuncio.objects.count())
+        self.assertEqual(stats.new_companies, Company.objects.count())
+        self.assertEqual(stats.extinctions, borme.actos['Extinción'])
+        self.assertEqual(stats.actos, borme.actos)
+        province = BormeStatsProvinceYear.objects.get(
+                        province=borme.province, year=borme.date.year)
+        self.assertEqual(province.actos, borme.actos)
+
+        # updatestats obtiene lo mismo
+        fields = ('bormes', 'anuncios', 'new_companies', 'extinctions',
+                  'actos')
+        expected = [list(BormeStatsDay.objects.values_list(*fields)),
+                    list(BormeStatsProvinceYear.objects.values_list(*fields))]
+        BormeStatsDay.objects.all().delete()
+        rebuild_stats()
+        self.assertEqual([list(BormeStatsDay.objects.values_list(*fields)),
+                          list(BormeStatsProvinceYear.objects
+                                                     .values_list(*fields))],
+                         expected)
+
+
+def _cargos():
+    """Filas de la tabla Cargo en orden de creación, sin claves propias"""
+    return list(Cargo.objects.order_by('id').values(
+                'company_id', 'holder_person_id', 'holder_company_id', 'title',
+                'date_from', 'date_to', 'anuncio__year',
+                'anuncio__id_anuncio'))
+
+
+class TestImportCargos(TestCase):
+
+    def setUp(self):
+        load_borme_from_gzipped_json("BORME-A-2009-197-28.json.gz")
+        load_borme_from_gzipped_json("BORME-A-2012-246-28.json.gz")
+
+    def test_same_as_json(self):
+        """La tabla Cargo tiene los mismos cargos que los campos JSON"""
+        company = Company.objects.get(slug='labiernag-2000')
+        actuales = Cargo.objects.filter(company=company, date_to=None)
+        historial = Cargo.objects.filter(company=company,
+                                         date_to__isnull=False)
+        self.assertEqual(actuales.count(), 9)
+        self.assertEqual(historial.count(), 3)
+        self.assertEqual(
+                actuales.count() + Cargo.objects.filter(
+                    holder_company=company, date_to=None).count(),
+                len(company.cargos_actuales_p + company.cargos_actuales_c))
+
+        # Cese y nombramiento de la misma persona en el mismo anuncio
+        company = Company.objects.get(slug='ferreteria-viena')
+        self.assertEqual(len(company.get_cargos_actuales()[0]), 2)
+        self.assertEqual(len(company.get_cargos_historial()[0]), 2)
+        cargo = company.get_cargos_historial()[0][0]
+        self.assertEqual(cargo['type'], 'person')
+        self.assertIn(cargo, [dict(c, type='person')
+                              for c in company.cargos_historial_p])
+
+        person = Person.objects.filter(cargos__isnull=False).first()
+        self.assertEqual(len(person.get_cargos_actuales(limit=0)[0]),
+                         len(person.cargos_actuales))
+
+    def test_extincion(self):
+        company = Company.objects.get(slug='pulso-2000')
+        self.assertEqual(company.get_cargos_actuales()[0], [])
+        self.assertFalse(Cargo.objects.filter(holder_company=company,
+                                              date_to=None).exists())
+        for cargo in company.get_cargos_historial(limit=0)[0]:
+            self.assertEqual(cargo['date_to'], '2012-12-26')
+
+    def test_pagination(self):
+        company = Company.objects.get(slug='labiernag-2000')
+        cargos, show_more = company.get_cargos_actuales(limit=0)
+        self.assertFalse(show_more)
+        self.assertEqual(company.get_cargos_actuales(offset=2, limit=3),
+                         (cargos[2:5], True))
+        self.assertEqual(company.get_cargos_actuales(offset=6, limit=3),
+                         (cargos[6:], False))
+        dates = [cargo['date_from'] for cargo in cargos]
+        self.assertEqual(dates, sorted(dates))
+
+    def test_rebuild(self):
+        """updatecargos regenera la tabla a partir de los anuncios"""
+        expected = _cargos()
+        Cargo.objects.all().delete()
+        self.assertEqual(rebuild_cargos(batch_size=100), (len(expected), 0))
+        self.assertCountEqual(_cargos(), expected)
+
+        # Los errores de cada lote se suman
+        batches = -(-Anuncio.objects.count() // 100)
+        with mock.patch('borme.parser.cargos.UnitOfWork.flush',
+                        return_value=1):
+            self.assertEqual(rebuild_cargos(batch_size=100)[1], batches)
+
+
+class TestImportQueries(TestCase):
+
+    def test_batched_resolution(self):
+        """Importa un BORME-JSON y comprueba que las sociedades, personas y
+           anuncios se cargan con una sola consulta por tabla
+        """
+        load_borme_from_gzipped_json("BORME-A-2009-197-28.json.gz")
+
+        with CaptureQueriesContext(connection) as ctx:
+            load_borme_from_gzipped_json("BORME-A-2012-246-28.json.gz")
+
+        for table in ('borme_company', 'borme_person', 'borme_anuncio'):
+            selects = [q for q in ctx.captured_queries
+                       if q['sql'].startswith('SELECT')
+                       and 'FROM "{}"'.format(table) in q['sql']]
+            self.assertEqual(len(selects), 1)
+
+    def test_append_without_fetch(self):
+        """Las listas JSON que solo crecen no se leen de la BD"""
+        load_borme_from_gzipped_json("BORME-A-2009-197-28.json.gz")
+
+        with CaptureQueriesContext(connection) as ctx:
+            load_borme_from_gzipped_json("BORME-A-2012-246-28.json.gz")
+
+        for table in ('borme_company_history', 'borme_person_history'):
+            selects = [q for q in ctx.captured_queries
+                       if q['sql'].startswith('SELECT')
+                       and '"{}"'.format(table) in q['sql']]
+            self.assertEqual(selects, [])
+
+    def test_bulk_write(self):
+        """Importa un BORME-JSON y comprueba que cada sociedad, persona y
+           anuncio se escribe en bloque una sola vez al final del BORME
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            load_borme_from_gzipped_json("BORME-A-2012-246-28.json.gz")
+
+        for table in ('borme_company', 'borme_person', 'borme_anuncio'):
+            writes = [q for q in ctx.captured_queries
+                      if q['sql'].startswith(('INSERT', 'UPDATE'))
+                      and '"{}"'.format(table) in q['sql'].split('(')[0]]
+            self.assertLessEqual(len(writes), 3)
+        self.assertEqual(Company.objects.count(), 559)
+
+
+class TestUnitOfWork(TestCase):
+
+    def test_flush_isolates_errors(self):
+        """Si falla la escritura en bloque, solo se pierde la entidad que
+           provoca el error
+        """
+        uow = UnitOfWork(2015)
+        for name, slug in (('PATATAS JUAN', 'patatas-juan'),
+                           ('X' * 300, 'x' * 300)):
+            company, _ = uow.company_get_or_create(name, 'SL', slug)
+            company.date_updated = datetime.date(2015, 1, 1)
+            uow.register_dirty(company)
+
+        self.assertEqual(uow.flush(), 1)
+        self.assertEqual(Company.objects.count(), 1)
+        self.assertTrue(Company.objects.filter(slug='patatas-juan').exists())
+
+    def test_upsert_appends(self):
+        """Los elementos añadidos a listas diferidas se concatenan en la BD
+           sin repetir los que ya estaban
+        """
+        borme1 = {'cve': 'BORME-A-2015-1-28', 'url': 'http://x/1.pdf'}
+        borme2 = {'cve': 'BORME-A-2015-2-28', 'url': 'http://x/2.pdf'}
+        cargo = {'title': 'Adm. Unico', 'name': 'JUAN', 'date_to': '2015-01-02'}
+        Company.objects.create(name='PATATAS JUAN', type='SL',
+                               date_updated=datetime.date(2015, 1, 1),
+                               in_bormes=[borme1])
+
+        uow = UnitOfWork(2015)
+        uow.load(['patatas-juan'], [], [])
+        company = uow.get_company('patatas-juan')
+        self.assertIn('in_bormes', company.history.get_deferred_fields())
+        company.add_in_bormes(borme1)
+        company.add_in_bormes(borme2)
+        company.add_in_bormes(borme2)
+        company._append_json('cargos_historial_p', cargo)
+        company.date_updated = datetime.date(2015, 1, 2)
+        uow.register_dirty(company)
+        self.assertEqual(uow.flush(), 0)
+
+        company = Company.objects.get(slug='patatas-juan')
+        self.assertEqual(company.in_bormes, [borme1, borme2])
+        self.assertEqual(company.cargos_historial_p, [cargo])
+        self.assertEqual(company.date_updated, datetime.date(2015, 1, 2))
+
+    def test_extinguir_sociedad(self):
+        """La extinción cierra en memoria los cargos de los consejeros, que
+           se cargan de una vez, y se guarda en el flush()
+        """
+        date = datetime.date(2015, 1, 2)
+        cargos_p = [{'title': 'Adm. Mancom', 'name': 'JUAN',
+                     'date_from': '2014-01-01'},
+                    {'title': 'Apoderado', 'name': 'JUAN',
+                     'date_from': '2014-02-01'}]
+        cargos_c = [{'title': 'Adm. Unico', 'name': 'PATATAS SA',
+                     'date_from': '2014-01-01'}]
+        Company.objects.create(name='PATATAS JUAN', type='SL',
+                               date_updated=datetime.date(2014, 2, 1),
+                               cargos_actuales_p=cargos_p,
+                               cargos_actuales_c=cargos_c)
+        Company.objects.create(name='PATATAS', type='SA',
+                               date_updated=datetime.date(2014, 2, 1),
+                               cargos_actuales_c=[
+                                   dict(cargo, name='Patatas Juan SL')
+                                   for cargo in cargos_c])
+        Person.objects.create(name='JUAN',
+                              date_updated=datetime.date(2014, 2, 1),
+                              cargos_actuales=[
+                                  dict(cargo, name='Patatas Juan SL')
+                                  for cargo in cargos_p])
+
+        uow = UnitOfWork(2015)
+        uow.load(['patatas-juan'], [], [])
+        uow.load_officers(['patatas-juan'])
+        company = uow.get_company('patatas-juan')
+        with self.assertNumQueries(0):
+            extinguir_sociedad(company, date, uow)
+        self.assertEqual(uow.flush(), 0)
+
+        company = Company.objects.get(slug='patatas-juan')
+        self.assertFalse(company.is_active)
+        self.assertEqual(company.cargos_actuales_p, [])
+        self.assertEqual(company.cargos_actuales_c, [])
+        person = Person.objects.get(slug='juan')
+        self.assertEqual(person.cargos_actuales, [])
+        self.assertEqual([cargo['date_to'] for cargo
+                          in person.cargos_historial], ['2015-01-02'] * 2)
+        officer = Company.objects.get(slug='patatas')
+        self.assertEqual(officer.cargos_actuales_c, [])
+        self.assertEqual(len(officer.cargos_historial_c), 1)
+
+    def test_atomic(self):
+        """Los cambios de un bloque que falla se deshacen y no se guardan;
+           los de los bloques anteriores se mantienen
+        """
+        date = datetime.date(2015, 1, 2)
+        borme1 = {'cve': 'BORME-A-2015-1-28', 'url': 'http://x/1.pdf'}
+        borme2 = {'cve': 'BORME-A-2015-2-28', 'url': 'http://x/2.pdf'}
+        cargos_p = [{'title': 'Adm. Unico', 'name': 'JUAN',
+                     'date_from': '2014-01-01'}]
+        company = Company.objects.create(
+                    name='PATATAS JUAN', type='SL',
+                    date_updated=datetime.date(2014, 1, 1),
+                    cargos_actuales_p=cargos_p)
+        person = Person.objects.create(
+                    name='JUAN', date_updated=datetime.date(2014, 1, 1),
+                    cargos_actuales=[dict(cargos_p[0],
+                                          name='Patatas Juan SL')])
+        Cargo.objects.create(company=company, holder_person=person,
+                             title='Adm. Unico',
+                             date_from=datetime.date(2014, 1, 1))
+
+        uow = UnitOfWork(2015)
+        uow.load(['patatas-juan'], ['juan'], [])
+        with uow.atomic():
+            company = uow.get_company('patatas-juan')
+            company.add_in_bormes(borme1)
+            uow.register_dirty(company)
+
+        with self.assertRaises(ValueError):
+            with uow.atomic():
+                company = uow.get_company('patatas-juan')
+                company.add_in_bormes(borme2)
+                company.date_updated = date
+                company.update_cargos_salientes([dict(
+                    cargos_p[0], type='person', date_to=date.isoformat())])
+                person = uow.get_person('juan')
+                uow.cargo_saliente(company, person, 'Adm. Unico', date, None)
+                uow.register_dirty(person)
+                pedro, _ = uow.person_get_or_create('PEDRO')
+                uow.cargo_entrante(company, pedro, 'Apoderado', date, None)
+                uow.register_dirty(pedro)
+                extinguir_sociedad(company, date, uow)
+                raise ValueError
+
+        self.assertNotIn('pedro', uow.persons)
+        self.assertEqual(len(uow.get_cargos('patatas-juan')), 1)
+        self.assertEqual(uow.flush(), 0)
+
+        company = Company.objects.get(slug='patatas-juan')
+        self.assertTrue(company.is_active)
+        self.assertEqual(company.in_bormes, [borme1])
+        self.assertEqual(company.cargos_actuales_p, cargos_p)
+        self.assertEqual(company.cargos_historial_p, [])
+        self.assertEqual(company.date_updated, datetime.date(2014, 1, 1))
+        self.assertFalse(Person.objects.filter(slug='pedro').exists())
+        self.assertEqual(list(Cargo.objects.values_list('date_to',
+                                                        flat=True)), [None])
+
+
+class TestUpdateDocuments(TestCase):
+
+    def test_batches(self):
+        """updatefts rellena document por lotes y continúa con las filas que
+           faltan
+        """
+        date = datetime.date(2015, 1, 1)
+        for name in ('PATATAS JUAN', 'PATATAS PEDRO', 'PATATAS LUIS'):
+            Company.objects.create(name=name, type='SL', date_updated=date)
+        for name in ('JUAN', 'PEDRO'):
+            Person.objects.create(name=name, date_updated=date)
+        # Filas anteriores al trigger de document
+        Company.objects.exclude(slug='patatas-pedro').update(document=None)
+        Person.objects.update(document=None)
+
+        self.assertEqual(psql_update_documents(batch_size=1), 4)
+        self.assertFalse(Company.objects.filter(document=None).exists())
+        self.assertFalse(Person.objects.filter(document=None).exists())
+        self.assertEqual(psql_update_documents(), 0)
+
+    def test_trigger(self):
+        """El trigger calcula document al insertar y al cambiar el nombre,
+           pero no al guardar la fila con el mismo nombre
+        """
+        date = datetime.date(2015, 1, 1)
+        Company.objects.create(name='PATATAS JUAN', type='SL',
+                               date_updated=date)
+        self.assertIsNotNone(Company.objects.get(slug='patatas-juan').document)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE borme_company "
+                           "SET document = to_tsvector('simple', 'x')")
+
+        Company.objects.update(name='PATATAS JUAN',
+                               date_updated=datetime.date(2015, 1, 2))
+        self.assertEqual(Company.objects.filter(
+            document=SearchQuery('x', config='simple')).count(), 1)
+
+        Company.objects.update(name='PATATAS PEDRO')
+        self.assertEqual(Company.objects.filter(
+            document=SearchQuery('x', config='simple')).count(), 0)
+
+
+class TestParseWorkers(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for filename in ("BORME-A-2012-246-28.json.gz",
+                         "BORME-A-2009-197-28.json.gz"):
+            filepath = os.path.join(self.tmpdir, filename[:-3])
+            with gzip.open(os.path.join(FILES_PATH, filename)) as fp_in:
+                with open(filepath, 'wb') as fp_out:
+                    shutil.copyfileobj(fp_in, fp_out)
+            self.files.append(filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_and_append_pool(self):
+        """Analiza los archivos en un pool de procesos y conserva el orden"""
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            bormes, err = borme.parser.importer._load_and_append(
+                    self.files, True, parse_executor=executor)
+
+        self.assertFalse(err)
+        self.assertEqual([b.cve for b in bormes],
+                         ['BORME-A-2012-246-28', 'BORME-A-2009-197-28'])
+        self.assertEqual(len(bormes[0].get_anuncios()), 578)
+
+
+class FakeBormeXML(object):
+
+    def __init__(self, date, cve, next_borme=None):
+        self.date = date
+        self.cve = cve
+        self.next_borme = next_borme
+
+    def get_cves(self, seccion=None):
+        return self.cve
+
+
+class ImportRangeTestCase(TestCase):
+    """Prepara un rango de fechas con los BORME-JSON de prueba"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        date1 = datetime.date(2009, 10, 15)
+        date2 = datetime.date(2012, 12, 26)
+        self.sumarios = {
+            date1: FakeBormeXML(date1, 'BORME-A-2009-197-28', date2),
+            date2: FakeBormeXML(date2, 'BORME-A-2012-246-28'),
+        }
+        for date, bxml in self.sumarios.items():
+            path = os.path.join(self.tmpdir, 'json', date.strftime('%Y/%m/%d'))
+            os.makedirs(path)
+            filename = '{}.json.gz'.format(bxml.cve)
+            with gzip.open(os.path.join(FILES_PATH, filename)) as fp_in:
+                with open(os.path.join(path, filename[:-3]), 'wb') as fp_out:
+                    shutil.copyfileobj(fp_in, fp_out)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def import_range(self, force=False):
+        with override_settings(
+                BORME_JSON_ROOT=os.path.join(self.tmpdir, 'json'),
+                BORME_PDF_ROOT=os.path.join(self.tmpdir, 'pdf'),
+                BORME_XML_ROOT=os.path.join(self.tmpdir, 'xml'),
+                BORME_LOG_ROOT=os.path.join(self.tmpdir, 'log')), \
+                mock.patch('borme.parser.importer._get_borme_xml',
+                           lambda date, index=None: self.sumarios[date]):
+            return borme.parser.importer._import_borme_download_range(
+                    datetime.date(2009, 10, 15), datetime.date(2012, 12, 31),
+                    'A', local_only=True, strict=True, create_json=False,
+                    queue_size=1, force=force)
+
+
+class TestImportPipeline(ImportRangeTestCase):
+
+    def test_import_range_local(self):
+        """Importa un rango de fechas con archivos BORME-JSON locales"""
+        ret, results = self.import_range()
+
+        self.assertTrue(ret)
+        self.assertEqual(results['total_bormes'], 2)
+        self.assertEqual(Borme.objects.count(), 2)
+        self.assertEqual(Company.objects.count(), 842)
+
+    def test_skip_imported(self):
+        """No vuelve a analizar los BORMEs ya importados salvo con force"""
+        self.import_range()
+
+        ret, results = self.import_range()
+        self.assertTrue(ret)
+        self.assertEqual(results['total_bormes'], 0)
+
+        ret, results = self.import_range(force=True)
+        self.assertTrue(ret)
+        self.assertEqual(results['total_bormes'], 2)
+        self.assertEqual(results['created_anuncios'], 0)
+
+
+class TestImportDownload(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.date = datetime.date(2015, 2, 10)
+        self.cve = 'BORME-A-2015-27-10'
+        self.url = 'https://www.boe.es/borme/dias/2015/02/10/pdfs/{}.pdf' \
+                   .format(self.cve)
+        self.sumario = FakeBormeXML(self.date, self.cve)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_files(self, bxml, path, seccion):
+        filepath = os.path.join(path, '{}.pdf'.format(self.cve))
+        shutil.copy(os.path.join(FILES_PATH, '{}.pdf'.format(self.cve)),
+                    filepath)
+        return [(filepath, self.url, None)]
+
+    def submit(self, url, filepath, size=None):
+        future = Future()
+        future.set_result(filepath)
+        return future
+
+    def test_url_from_sumario(self):
+        """La URL del BORME es la del sumario, sin buscarla en el BOE, tanto
+           al analizar el PDF como al cargarlo de la caché
+        """
+        with override_settings(
+                BORME_CACHE_ROOT=os.path.join(self.tmpdir, 'cache'),
+                BORME_JSON_ROOT=os.path.join(self.tmpdir, 'json'),
+                BORME_PDF_ROOT=os.path.join(self.tmpdir, 'pdf'),
+                BORME_XML_ROOT=os.path.join(self.tmpdir, 'xml'),
+                BORME_LOG_ROOT=os.path.join(self.tmpdir, 'log')), \
+                mock.patch('borme.parser.importer._get_borme_xml',
+                           lambda date, index=None: self.sumario), \
+                mock.patch('borme.parser.importer.BormeDownloader.get_files',
+                           self.get_files), \
+                mock.patch('borme.parser.importer.BormeDownloader.submit',
+                           self.submit), \
+                mock.patch('bormeparser.borme.get_url_pdf',
+                           side_effect=AssertionError):
+            for force in (False, True):
+                ret, _ = borme.parser.importer._import_borme_download_range(
+                        self.date, self.date, 'A', local_only=False,
+                        strict=True, create_json=False, queue_size=1,
+                        force=force)
+                self.assertTrue(ret)
+                self.assertEqual(Borme.objects.get(cve=self.cve).url,
+                                 self.url)
+
+
+def _snapshot():
+    """Filas de las tablas de la importación sin claves ni fechas de log"""
+    return {
+        'bormes': list(Borme.objects.order_by('cve').values()),
+        'logs': list(BormeLog.objects.order_by('borme_id')
+                     .values('borme_id', 'parsed', 'errors', 'path')),
+        'companies': list(Company.objects.order_by('slug').values()),
+        'persons': list(Person.objects.order_by('slug').values()),
+        'anuncios': list(Anuncio.objects.order_by('year', 'id_anuncio')
+                         .values('id_anuncio', 'year', 'borme_id',
+                                 'company_id', 'datos_registrales', 'actos')),
+        'cargos': _cargos(),
+    }
+
+
+class TestImportBulk(ImportRangeTestCase):
+
+    def import_bulk(self):
+        with override_settings(
+                BORME_JSON_ROOT=os.path.join(self.tmpdir, 'json'),
+                BORME_XML_ROOT=os.path.join(self.tmpdir, 'xml')):
+            return borme.parser.bulk.import_borme_bulk(
+                    datetime.date(2009, 10, 15), datetime.date(2012, 12, 31))
+
+    def test_same_rows(self):
+        """La carga con COPY deja las mismas filas que la incremental"""
+        self.import_range()
+        expected = _snapshot()
+        for model in (BormeLog, Cargo, Anuncio, Borme, Company, Person):
+            model.objects.all().delete()
+
+        results = self.import_bulk()
+        self.assertEqual(results['created_bormes'], 2)
+        self.assertEqual(_snapshot(), expected)
+
+        # La secuencia de los anuncios continúa tras los cargados
+        last = Anuncio.objects.order_by('-pk').first()
+        anuncio = Anuncio.objects.create(id_anuncio=0, year=2012,
+                                         borme=last.borme,
+                                         company=last.company)
+        self.assertGreater(anuncio.pk, last.pk)
+
+    def test_not_empty(self):
+        """Solo se puede usar con la BD vacía"""
+        self.import_range()
+        with self.assertRaises(ValueError):
+            self.import_bulk()
+
+
+class TestImportWorkers(TransactionTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.date = datetime.date(2012, 12, 26)
+        cves = ['BORME-A-2009-197-28', 'BORME-A-2012-246-28']
+        self.sumario = FakeBormeXML(self.date, cves)
+        path = os.path.join(self.tmpdir, 'json',
+                            self.date.strftime('%Y/%m/%d'))
+        os.makedirs(path)
+        for cve in cves:
+            filename = '{}.json.gz'.format(cve)
+            with gzip.open(os.path.join(FILES_PATH, filename)) as fp_in:
+                with open(os.path.join(path, filename[:-3]), 'wb') as fp_out:
+                    shutil.copyfileobj(fp_in, fp_out)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def import_day(self, import_executor=None):
+        with override_settings(
+                BORME_JSON_ROOT=os.path.join(self.tmpdir, 'json'),
+                BORME_PDF_ROOT=os.path.join(self.tmpdir, 'pdf'),
+                BORME_XML_ROOT=os.path.join(self.tmpdir, 'xml'),
+                BORME_LOG_ROOT=os.path.join(self.tmpdir, 'log')), \
+                mock.patch('borme.parser.importer._get_borme_xml',
+                           lambda date, index=None: self.sumario):
+            return borme.parser.importer._import_borme_download_range(
+                    self.date, self.date, 'A', local_only=True, strict=True,
+                    create_json=False, queue_size=1,
+                    import_executor=import_executor)
+
+    def test_same_cargos(self):
+        """Importar un día en varios procesos deja los mismos cargos"""
+        self.import_day()
+        expected = _snapshot()
+        for model in (BormeLog, Cargo, Anuncio, Borme, Company, Person):
+            model.objects.all().delete()
+
+        executor = create_import_executor(2)
+        try:
+            ret, results = self.import_day(executor)
+        finally:
+            executor.shutdown()
+
+        self.assertTrue(ret)
+        self.assertEqual(results['created_bormes'], 2)
+        self.assertEqual(_snapshot(), expected)
@@ -39,3 +39,63 @@ class TestPersonModel(TestCase):
         p.update_cargos_salientes([cargo_saliente])
         self.assertEqual(p.cargos_actuales, [])
         self.assertEqual(p.cargos_historial, [{'title': 't', 'name': 'n', 'date_from': today, 'date_to': tomorrow}])
+
+    def test_index_cargos(self):
+        """Con el índice de cargos vigentes la lista guardada es la misma"""
+        entrantes = [{'title': 't', 'name': 'a', 'date_from': 1},
+                     {'title': 't', 'name': 'b', 'date_from': 2},
+                     {'title': 'u', 'name': 'a', 'date_from': 3},
+                     {'title': 't', 'name': 'a', 'date_from': 4}]
+        salientes = [{'title': 't', 'name': 'a', 'date_to': 5},
+                     {'title': 'u', 'name': 'a', 'date_to': 5},
+                     {'title': 'v', 'name': 'a', 'date_to': 5}]
+
+        expected = Person(name='SIN INDICE')
+        expected.update_cargos_entrantes([c.copy() for c in entrantes])
+        expected.update_cargos_salientes([c.copy() for c in salientes])
+
+        p = Person(name='CON INDICE', date_updated=today)
+        p.index_cargos()
+        p.update_cargos_entrantes([c.copy() for c in entrantes])
+        p.update_cargos_salientes([c.copy() for c in salientes])
+        p.update_cargos_entrantes([{'title': 't', 'name': 'c',
+                                    'date_from': 6}])
+        expected.update_cargos_entrantes([{'title': 't', 'name': 'c',
+                                           'date_from': 6}])
+        p.save()
+
+        p = Person.objects.get(slug=p.slug)
+        self.assertEqual(p.cargos_actuales, expected.cargos_actuales)
+        self.assertEqual(p.cargos_historial, expected.cargos_historial)
+        self.assertEqual([c['name'] for c in p.cargos_actuales],
+                         ['b', 'a', 'c'])
+
+    def test_in_bormes(self):
+        """Las listas sin repetidos y sus contadores"""
+        borme_a = {'cve': 'BORME-A-2018-1-29', 'url': 'a'}
+        borme_b = {'cve': 'BORME-A-2018-2-29', 'url': 'b'}
+
+        p = Person(name='PEPE', date_updated=today)
+        p.add_in_bormes(borme_a)
+        p.add_in_bormes(dict(borme_a))
+        p.add_in_companies('EMPRESA SL')
+        p.add_in_companies('EMPRESA SL')
+        p.save()
+        self.assertEqual(p.in_bormes, [borme_a])
+        self.assertEqual(p.total_bormes, 1)
+        self.assertEqual(p.total_companies, 1)
+
+        # Con el historial sin leer el contador lo calcula la BD
+        p = Person.objects.get(slug='pepe')
+        p.defer_history()
+        p.add_in_bormes(borme_a)
+        p.add_in_bormes(borme_b)
+        p.add_in_bormes(borme_b)
+        self.assertIn('in_bormes', p.history.get_deferred_fields())
+        p.save()
+        self.assertEqual(p.total_bormes, 2)
+
+        p = Person.objects.get(slug='pepe')
+        self.assertEqual(p.in_bormes, [borme_a, borme_b])
+        self.assertEqual(p.total_bormes, 2)
+        self.assertEqual(p.total_companies, 1)
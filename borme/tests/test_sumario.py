@@ -0,0 +1,113 @@
+from borme.parser.importer import _get_borme_xml
+from borme.parser.sumario import SumarioEntry, SumarioIndex
+import borme.parser.sumario
+
+from unittest import mock
+
+import datetime
+import logging
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+# Disable loggers
+borme.parser.sumario.logger.setLevel(logging.CRITICAL)
+logging.getLogger('bormeparser.borme').setLevel(logging.CRITICAL)
+
+SUMARIO = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<sumario>
+  <meta>
+    <fecha>{fecha}</fecha>
+    <fechaAnt>{fecha_ant}</fechaAnt>
+    <fechaSig>{fecha_sig}</fechaSig>
+  </meta>
+  <diario nbo="{nbo}">
+    <seccion num="A" nombre="SECCIÓN PRIMERA">
+      <emisor nombre="Empresarios">
+        <item id="BORME-A-2015-{nbo}-04">
+          <titulo>ALMERÍA</titulo>
+          <urlPdf szBytes="1000">/borme/dias/{path}/pdfs/BORME-A-2015-{nbo}-04.pdf</urlPdf>
+        </item>
+        <item id="BORME-A-2015-{nbo}-10">
+          <titulo>CÁCERES</titulo>
+          <urlPdf szBytes="2000">/borme/dias/{path}/pdfs/BORME-A-2015-{nbo}-10.pdf</urlPdf>
+        </item>
+        <item id="BORME-A-2015-{nbo}-99">
+          <titulo>ÍNDICE ALFABÉTICO DE SOCIEDADES</titulo>
+          <urlPdf szBytes="3000">/borme/dias/{path}/pdfs/BORME-A-2015-{nbo}-99.pdf</urlPdf>
+        </item>
+      </emisor>
+    </seccion>
+  </diario>
+</sumario>
+"""
+
+
+def write_sumario(root, date, prev_date, next_date, nbo):
+    path = os.path.join(root, date.strftime('%Y'), date.strftime('%m'))
+    os.makedirs(path, exist_ok=True)
+    filepath = os.path.join(path, date.strftime('BORME-S-%Y%m%d.xml'))
+    content = SUMARIO.format(
+            fecha=date.strftime('%d/%m/%Y'),
+            fecha_ant=prev_date.strftime('%d/%m/%Y'),
+            fecha_sig=next_date.strftime('%d/%m/%Y') if next_date else '',
+            path=date.strftime('%Y/%m/%d'),
+            nbo=nbo)
+    with open(filepath, 'w', encoding='iso-8859-1') as fp:
+        fp.write(content)
+
+
+class TestSumarioIndex(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(BORME_XML_ROOT=self.tmpdir)
+        self.settings.enable()
+        self.date1 = datetime.date(2015, 2, 10)
+        self.date2 = datetime.date(2015, 2, 11)
+        write_sumario(self.tmpdir, self.date1, datetime.date(2015, 2, 9),
+                      self.date2, 27)
+        write_sumario(self.tmpdir, self.date2, self.date1, None, 28)
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_build(self):
+        """Genera el índice a partir de los sumarios en disco"""
+        self.assertEqual(SumarioIndex().build(), 2)
+
+        index = SumarioIndex()
+        entry = index.get(self.date1)
+        self.assertTrue(entry.is_final)
+        self.assertEqual(entry.prev_borme, datetime.date(2015, 2, 9))
+        self.assertEqual(entry.next_borme, self.date2)
+        self.assertEqual(entry.get_cves('A'),
+                         ['BORME-A-2015-27-04', 'BORME-A-2015-27-10'])
+        self.assertEqual(entry.get_sizes('A'),
+                         {'BORME-A-2015-27-04': 1000,
+                          'BORME-A-2015-27-10': 2000})
+        self.assertTrue(entry.get_urls_cve('A')['BORME-A-2015-27-10']
+                        .endswith('/borme/dias/2015/02/10/pdfs/'
+                                  'BORME-A-2015-27-10.pdf'))
+
+        entry = index.get(self.date2)
+        self.assertFalse(entry.is_final)
+        self.assertIsNone(entry.next_borme)
+        self.assertIsNone(index.get(datetime.date(2015, 2, 12)))
+
+    def test_get_borme_xml(self):
+        """Los sumarios definitivos indexados no vuelven a leerse del XML"""
+        index = SumarioIndex()
+        bxml = _get_borme_xml(self.date1, index)
+        self.assertNotIsInstance(bxml, SumarioEntry)
+
+        index = SumarioIndex()
+        with mock.patch('borme.parser.importer.BormeXML') as BormeXML:
+            entry = _get_borme_xml(self.date1, index)
+        self.assertFalse(BormeXML.from_file.called)
+        self.assertIsInstance(entry, SumarioEntry)
+        self.assertEqual(entry.get_cves('A'), bxml.get_cves('A'))
+        self.assertEqual(entry.next_borme, bxml.next_borme)
@@ -1,5 +1,10 @@
-from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.db import connection
+from django.db.models import F
+
+from psycopg2.extras import Json
+
+import datetime
 
 # http://chase-seibert.github.io/blog/2012/06/01/djangopostgres-optimize-count-by-replacing-with-an-estimate.html
 # TODO: exception if db engine is not postgres as in https://github.com/stephenmcd/django-postgres-fuzzycount/blob/master/fuzzycount.py
@@ -12,19 +17,293 @@ def estimate_count_fast(table):
     return int(row[0])
 
 
-# q_companies = Company.objects.filter(name__icontains=self.request.GET['q'])
-# q_companies = Company.objects.annotate(rank=SearchRank(F('document'), query)).filter(rank__gt=0.01).order_by('-rank')
+# Text search configuration of the document fields, created by migration
+# 0013: Spanish without accents, or plain Spanish when unaccent is missing
+FTS_CONFIG = 'libreborme'
+
+
 def search_fts(raw_query, model):
     """Search using Postgres full text search
 
+    All the words must match. The document fields are kept up to date by a
+    trigger and have a GIN index, so this is an index scan. Results are
+    ranked, best first, and only load the summary fields.
+
     Usage:
     q_companies = search_fts('Juan', model=Person)
     q_companies = list(q_companies)  # Force
     """
+    if not raw_query.split():
+        return model.objects.none()
+
+    query = SearchQuery(raw_query, config=FTS_CONFIG)
+    return model.objects.summary() \
+                        .filter(document=query) \
+                        .annotate(rank=SearchRank(F('document'), query)) \
+                        .order_by('-rank', 'slug')
+
+
+def bulk_update(objs, fields, batch_size=500):
+    """Update several rows of the same model with one query per batch.
+
+    Django 2.0 has no QuerySet.bulk_update(), so this builds an
+    UPDATE ... FROM (VALUES ...) statement. Values are adapted by each
+    model field and cast back to the column type.
+
+    Usage:
+    bulk_update(companies, ['name', 'in_bormes', 'date_updated'])
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+
+    opts = objs[0]._meta
+    pk = opts.pk
+    fields = [pk] + [opts.get_field(name) for name in fields]
+    columns = ', '.join('"{}"'.format(f.column) for f in fields)
+    assignments = ', '.join(
+        '"{col}" = v."{col}"::{type}'.format(col=f.column,
+                                            type=f.db_type(connection))
+        for f in fields[1:])
+    sql = ('UPDATE "{table}" AS t SET {assignments} '
+           'FROM (VALUES {{values}}) AS v ({columns}) '
+           'WHERE t."{pk}" = v."{pk}"'.format(table=opts.db_table,
+                                             assignments=assignments,
+                                             columns=columns,
+                                             pk=pk.column))
+    template = '(' + ', '.join(['%s'] * len(fields)) + ')'
+
+    affected_rows = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(objs), batch_size):
+            values = []
+            for obj in objs[i:i + batch_size]:
+                row = [f.get_db_prep_save(getattr(obj, f.attname), connection)
+                       for f in fields]
+                values.append(cursor.mogrify(template, row).decode('utf-8'))
+            cursor.execute(sql.format(values=', '.join(values)))
+            affected_rows += cursor.rowcount
+    return affected_rows
+
+
+def _append_sql(column, unique):
+    current = 't."{}"'.format(column)
+    new = 'EXCLUDED."{}"'.format(column)
+    if not unique:
+        return '{} || {}'.format(current, new)
+    return ("{current} || COALESCE((SELECT jsonb_agg(e) "
+            "FROM jsonb_array_elements({new}) AS e "
+            "WHERE NOT {current} @> jsonb_build_array(e)), '[]'::jsonb)"
+            .format(current=current, new=new))
+
+
+def bulk_upsert(objs, fields, unique_fields=(), lengths=None, batch_size=500):
+    """Insert or update rows with INSERT ... ON CONFLICT (pk) DO UPDATE.
+
+    Fields loaded in the instance replace the stored value. JSON list fields
+    that were deferred (QuerySet.defer()) are not read: the items pending in
+    obj.json_appends (see borme.models.JsonAppendMixin) are appended to the
+    stored document with jsonb ||, skipping those already contained in it
+    for unique_fields. Deferred fields without pending items are not changed.
+
+    If lengths (JSON list field names) is given, returns the length of those
+    lists after the upsert as {pk: {field: length}} instead of the number of
+    affected rows.
+
+    Usage:
+    bulk_upsert(companies, ['name', 'in_bormes', 'date_updated'],
+                unique_fields=['in_bormes'])
+    bulk_upsert(histories, ['in_bormes'], unique_fields=['in_bormes'],
+                lengths=['in_bormes'])
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+
+    opts = objs[0]._meta
+    pk = opts.pk
+    fields = [pk] + [opts.get_field(name) for name in fields]
+    columns = ', '.join('"{}"'.format(f.column) for f in fields)
+    template = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    returning = ''
+    if lengths:
+        lengths = list(lengths)
+        returning = ' RETURNING t."{}", '.format(pk.column) + ', '.join(
+            'jsonb_array_length(t."{}")'.format(opts.get_field(name).column)
+            for name in lengths)
+    result = {}
+
+    # One statement per combination of deferred and appended fields
+    groups = {}
+    for obj in objs:
+        appends = getattr(obj, 'json_appends', {})
+        deferred = obj.get_deferred_fields()
+        key = (tuple(f.attname in deferred for f in fields),
+               tuple(f.attname in appends for f in fields))
+        groups.setdefault(key, []).append(obj)
+
+    affected_rows = 0
+    with connection.cursor() as cursor:
+        for (deferred, appended), group in groups.items():
+            assignments = []
+            for f, is_deferred, is_appended in zip(fields[1:], deferred[1:],
+                                                   appended[1:]):
+                if is_appended:
+                    value = _append_sql(f.column, f.name in unique_fields)
+                elif is_deferred:
+                    continue
+                else:
+                    value = 'EXCLUDED."{}"'.format(f.column)
+                assignments.append('"{}" = {}'.format(f.column, value))
+            sql = ('INSERT INTO "{table}" AS t ({columns}) '
+                   'VALUES {{values}} ON CONFLICT ("{pk}") DO UPDATE '
+                   'SET {assignments}{returning}'.format(
+                        table=opts.db_table, columns=columns, pk=pk.column,
+                        assignments=', '.join(assignments),
+                        returning=returning))
+
+            for i in range(0, len(group), batch_size):
+                values = []
+                for obj in group[i:i + batch_size]:
+                    appends = getattr(obj, 'json_appends', {})
+                    row = []
+                    for f, is_deferred in zip(fields, deferred):
+                        if is_deferred:
+                            value = appends.get(f.attname, [])
+                        else:
+                            value = getattr(obj, f.attname)
+                        row.append(f.get_db_prep_save(value, connection))
+                    values.append(cursor.mogrify(template, row)
+                                  .decode('utf-8'))
+                cursor.execute(sql.format(values=', '.join(values)))
+                affected_rows += cursor.rowcount
+                if lengths:
+                    for row in cursor.fetchall():
+                        result[row[0]] = dict(zip(lengths, row[1:]))
+    return result if lengths else affected_rows
+
+
+def _copy_text(value):
+    """Format a value adapted by a model field for COPY ... FROM STDIN"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, Json):
+        value = value.dumps(value.adapted)
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                 .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class _CopyReader(object):
+    """File-like object that reads the lines of a generator.
+
+    Lets cursor.copy_expert() stream rows without building the whole
+    COPY input in memory.
+    """
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            try:
+                line = next(self._lines)
+            except StopIteration:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_objects(model, objs):
+    """Insert model instances with COPY ... FROM STDIN.
+
+    Much faster than bulk_create() for large loads. Every concrete field is
+    written, including the primary key, and save() is not called.
+
+    Usage:
+    copy_objects(Company, companies)
+    """
+    fields = model._meta.concrete_fields
+    columns = ', '.join('"{}"'.format(f.column) for f in fields)
+    sql = 'COPY "{table}" ({columns}) FROM STDIN'.format(
+            table=model._meta.db_table, columns=columns)
 
-    words = raw_query.split()
-    query = SearchQuery(words[0])
-    for word in words[1:]:
-        # AND
-        query &= SearchQuery(word)
-    return model.objects.filter(document=query)
+    def lines():
+        for obj in objs:
+            values = [f.get_db_prep_save(getattr(obj, f.attname), connection)
+                      for f in fields]
+            yield '\t'.join(_copy_text(value) for value in values) + '\n'
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, _CopyReader(lines()))
+        return cursor.rowcount
+
+
+def drop_indexes(table):
+    """Drop the indexes of a table that do not back a constraint.
+
+    Returns their definitions so that they can be created again with
+    create_indexes(), e.g. after a bulk load.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT i.relname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            WHERE t.relname = %s
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                              WHERE c.conindid = i.oid)
+            ORDER BY i.relname""", [table])
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute('DROP INDEX "{}"'.format(name))
+    return [definition for _, definition in indexes]
+
+
+def create_indexes(definitions):
+    """Create the indexes returned by drop_indexes()"""
+    with connection.cursor() as cursor:
+        for definition in definitions:
+            cursor.execute(definition)
+
+
+def reset_sequence(model):
+    """Set the sequence of an auto primary key to the greatest value"""
+    opts = model._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT setval(pg_get_serial_sequence(%s, %s), "
+            "coalesce(max(\"{pk}\"), 0) + 1, false) FROM \"{table}\""
+            .format(pk=opts.pk.column, table=opts.db_table),
+            [opts.db_table, opts.pk.column])
+
+
+def advisory_xact_lock(keys):
+    """Take transaction-level advisory locks on (int, int) keys.
+
+    The locks are taken one by one in the given order and released at the end
+    of the transaction. Processes that lock overlapping sets of keys must pass
+    them in the same (e.g. sorted) order, or they can deadlock.
+    """
+    if not keys:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(pg_advisory_xact_lock(k1, k2)) "
+            "FROM unnest(%s::int[], %s::int[]) AS t(k1, k2)",
+            [[k1 for k1, _ in keys], [k2 for _, k2 in keys]])
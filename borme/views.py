@@ -12,11 +12,12 @@ from django.template.loader import get_template
 from django.conf import settings
 
 from .calendar import LibreBormeCalendar, LibreBormeAvailableCalendar
+from .dashboard import get_dashboard
 from .documents import es_search_paginator
 from .forms import LBSearchForm
 from .mixins import CacheMixin
-from .models import Company, Person, Anuncio, Config, Borme
-from .utils.postgres import estimate_count_fast
+from .models import (Company, Person, Anuncio, Borme, BormeStatsDay,
+                     BormeStatsProvinceYear)
 
 import csv
 import datetime
@@ -24,7 +25,7 @@ import datetime
 
 def ajax_empresa_more(request, slug):
     try:
-        company = Company.objects.get(slug=slug)
+        company = Company.objects.summary().get(slug=slug)
     except Company.DoesNotExist:
         raise Http404('Company does not exist')
 
@@ -54,7 +55,7 @@ def ajax_empresa_more(request, slug):
 
 @cache_page(3600)
 def generate_person_csv_cargos_actual(context, slug):
-    person = Person.objects.get(slug=slug)
+    person = Person.objects.summary().get(slug=slug)
     filename = 'cargos_actuales_%s_%s' % (slug, datetime.date.today().isoformat())
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="%s.csv"' % filename
@@ -69,7 +70,7 @@ def generate_person_csv_cargos_actual(context, slug):
 
 @cache_page(3600)
 def generate_person_csv_cargos_historial(context, slug):
-    person = Person.objects.get(slug=slug)
+    person = Person.objects.summary().get(slug=slug)
     filename = 'cargos_historial_%s_%s' % (slug, datetime.date.today().isoformat())
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="%s.csv"' % filename
@@ -85,7 +86,7 @@ def generate_person_csv_cargos_historial(context, slug):
 
 @cache_page(3600)
 def generate_company_csv_cargos_actual(context, slug):
-    company = Company.objects.get(slug=slug)
+    company = Company.objects.summary().get(slug=slug)
     filename = 'cargos_actuales_%s_%s' % (slug, datetime.date.today().isoformat())
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="%s.csv"' % filename
@@ -101,7 +102,7 @@ def generate_company_csv_cargos_actual(context, slug):
 
 @cache_page(3600)
 def generate_company_csv_cargos_historial(context, slug):
-    company = Company.objects.get(slug=slug)
+    company = Company.objects.summary().get(slug=slug)
     filename = "cargos_historial_{}_{}" \
                .format(slug, datetime.date.today().isoformat())
     content_disposition = 'attachment; filename="%s.csv"' % filename
@@ -126,25 +127,14 @@ class HomeView(CacheMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         """
-        Using .count() in PostgreSQL kills performance,
-        so we use a method to estimate the number of rows in the tables
+        The dashboard is computed at the end of each import and read from
+        the cache (see borme.dashboard)
         """
         context = super(HomeView, self).get_context_data(**kwargs)
 
-        random_companies = Company.objects.all().order_by('-date_updated')[:10]
-        random_persons = Person.objects.all().order_by('-date_updated')[:10]
-        last_modified = Config.objects.first().last_modified.date()
-        lb_calendar = LibreBormeCalendar().formatmonth(datetime.date.today())
-
-        context.update({
-            "total_companies": estimate_count_fast('borme_company'),
-            "total_persons": estimate_count_fast('borme_person'),
-            "total_anuncios": estimate_count_fast('borme_anuncio'),
-            "random_companies": random_companies,
-            "random_persons": random_persons,
-            "last_modified": last_modified,
-            "calendar": mark_safe(lb_calendar),
-        })
+        dashboard = get_dashboard()
+        context.update(dashboard)
+        context["calendar"] = mark_safe(dashboard["calendar"])
 
         return context
 
@@ -256,14 +246,6 @@ class BormeView(CacheMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super(BormeView, self).get_context_data(**kwargs)
 
-        anuncios = Anuncio.objects.filter(id_anuncio__gte=self.borme.from_reg,
-                                          id_anuncio__lte=self.borme.until_reg,
-                                          year=self.borme.date.year)
-        from collections import Counter
-        resumen_dia = Counter()
-        for anuncio in anuncios:
-            resumen_dia += Counter(anuncio.actos.keys())
-
         bormes_dia = Borme.objects.filter(date=self.borme.date).order_by('province')
         bormes_dia = list(bormes_dia)
         bormes_dia.remove(self.borme)
@@ -272,7 +254,7 @@ class BormeView(CacheMixin, DetailView):
         context.update({
             "bormes_dia": bormes_dia,
             "total_anuncios": self.borme.until_reg - self.borme.from_reg + 1,
-            "resumen_dia": sorted(resumen_dia.items(), key=lambda t: t[0]),
+            "resumen_dia": sorted(self.borme.actos.items()),
         })
 
         return context
@@ -304,21 +286,11 @@ class BormeDateView(CacheMixin, TemplateView):
         # TODO: LocaleHTMLCalendar(firstweekday=0, locale=None)
         lb_calendar = LibreBormeCalendar().formatmonth(self.date)
 
-        bormes = Borme.objects.filter(date=self.date).order_by('province')
-        if len(bormes) > 0:
-            from_reg = min([b.from_reg for b in bormes])
-            until_reg = max([b.until_reg for b in bormes])
-            anuncios = Anuncio.objects.filter(id_anuncio__gte=from_reg,
-                                              id_anuncio__lte=until_reg,
-                                              year=self.date.year)
-
-            # FIXME: performance-killer? Guardar resultados en el modelo Borme
-            from collections import Counter
-            resumen_dia = Counter()
-            for anuncio in anuncios:
-                resumen_dia += Counter(anuncio.actos.keys())
-
-            context['resumen_dia'] = sorted(resumen_dia.items(), key=lambda t: t[0])
+        bormes = Borme.objects.filter(date=self.date).only('cve', 'province') \
+                              .order_by('province')
+        stats = BormeStatsDay.objects.filter(date=self.date).first()
+        if stats:
+            context['resumen_dia'] = sorted(stats.actos.items())
 
         # TODO: Guardar la fecha en el anuncio?
         next_day = self.date + datetime.timedelta(days=1)
@@ -327,6 +299,7 @@ class BormeDateView(CacheMixin, TemplateView):
         context.update({
             "calendar": mark_safe(lb_calendar),
             "bormes": bormes,
+            "stats": stats,
             "date": self.date,
             "next_day": next_day.isoformat(),
             "prev_day": prev_day.isoformat(),
@@ -351,35 +324,19 @@ class BormeProvinciaView(CacheMixin, TemplateView):
         context = super(BormeProvinciaView, self).get_context_data(**kwargs)
 
         year = int(self.kwargs['year'])
-        bormes = Borme.objects.filter(date__gte=datetime.date(year, 1, 1),
-                                      date__lte=datetime.date(year, 12, 31),
-                                      province=self.kwargs['provincia'])
 
         # TODO: LocaleHTMLCalendar(firstweekday=0, locale=None)
-        lb_calendar = LibreBormeAvailableCalendar().formatyear(year, bormes)
-
-        if len(bormes) > 0:
-            # FIXME: No se puede hacer minimo y maximo. Hacer where in
-            # from_reg = min([b.from_reg for b in bormes])
-            # until_reg = max([b.until_reg for b in bormes])
-            from_reg = bormes[0].from_reg
-            until_reg = bormes[0].until_reg
-
-            anuncios = Anuncio.objects.filter(id_anuncio__gte=from_reg,
-                                              id_anuncio__lte=until_reg,
-                                              year=year)
+        lb_calendar = LibreBormeAvailableCalendar().formatyear(
+                                            year, self.kwargs['provincia'])
 
-            # FIXME: performance-killer. Guardar resultados en el modelo Borme
-            from collections import Counter
-            resumen_dia = Counter()
-            for anuncio in anuncios:
-                resumen_dia += Counter(anuncio.actos.keys())
-
-            context['resumen_dia'] = sorted(resumen_dia.items(), key=lambda t: t[0])
+        stats = BormeStatsProvinceYear.objects.filter(
+                        province=self.kwargs['provincia'], year=year).first()
+        if stats:
+            context['resumen_dia'] = sorted(stats.actos.items())
 
         context.update({
             "calendar": mark_safe(lb_calendar),
-            "bormes": bormes,
+            "stats": stats,
         })
 
         return context
@@ -391,7 +348,10 @@ class CompanyView(CacheMixin, DetailView):
 
     def get_object(self):
         try:
-            self.company = Company.objects.get(slug=self.kwargs['slug'])
+            # Los cargos se leen de la tabla Cargo
+            self.company = Company.objects \
+                .summary('nif', 'date_creation', 'history__in_bormes') \
+                .get(slug=self.kwargs['slug'])
             return self.company
         except Company.DoesNotExist:
             raise Http404('Company does not exist')
@@ -401,19 +361,19 @@ class CompanyView(CacheMixin, DetailView):
 
         context['anuncios'] = Anuncio.objects.filter(company=self.company).order_by('-year', '-id_anuncio')
 
-        context['persons'] = []
-        for cargo in self.company.todos_cargos_p:
-            if cargo['name'] not in context['persons']:
-                context['persons'].append(cargo['name'])
-
-        context['companies'] = []
-        for cargo in self.company.todos_cargos_c:
-            if cargo['name'] not in context['companies']:
-                context['companies'].append(cargo['name'])
+        cargos_actuales, cargos_actuales_more = \
+            self.company.get_cargos_actuales()
+        cargos_historial, cargos_historial_more = \
+            self.company.get_cargos_historial()
+        persons, companies = self.company.get_cargo_names()
 
         context.update({
-            "companies": sorted(list(set(context['companies']))),
-            "persons": sorted(list(set(context['persons']))),
+            "cargos_actuales": cargos_actuales,
+            "cargos_actuales_more": cargos_actuales_more,
+            "cargos_historial": cargos_historial,
+            "cargos_historial_more": cargos_historial_more,
+            "companies": companies,
+            "persons": persons,
             "activity": 'Activa' if self.company.is_active else 'Inactiva',
         })
 
@@ -426,11 +386,21 @@ class PersonView(CacheMixin, DetailView):
 
     def get_object(self):
         try:
-            self.person = Person.objects.get(slug=self.kwargs['slug'])
+            self.person = Person.objects \
+                .summary('history__in_companies', 'history__in_bormes') \
+                .get(slug=self.kwargs['slug'])
             return self.person
         except Person.DoesNotExist:
             raise Http404('Person does not exist')
 
+    def get_context_data(self, **kwargs):
+        context = super(PersonView, self).get_context_data(**kwargs)
+        context.update({
+            "cargos_actuales": self.person.get_cargos_actuales(limit=0)[0],
+            "cargos_historial": self.person.get_cargos_historial(limit=0)[0],
+        })
+        return context
+
 
 class CompanyProvinceListView(CacheMixin, ListView):
     # model = Company
@@ -136,6 +136,10 @@ ELASTICSEARCH_DSL = {
     },
 }
 
+# Documentos por petición _bulk al indexar las sociedades y personas de un
+# BORME importado
+ELASTICSEARCH_BULK_CHUNK_SIZE = 500
+
 # ELASTICSEARCH_DSL_AUTOSYNC = False
 # ELASTICSEARCH_DSL_AUTO_REFRESH = False
 
@@ -166,11 +170,15 @@ PIWIK_SITE_ID = ''
 # Número de elementos a mostrar en las tablas de cargos
 CARGOS_LIMIT = 20
 
+# Segundos entre comprobaciones de si hay BORMEs nuevos para los calendarios
+CALENDAR_CHECK_INTERVAL = 60
+
 # BORME
 BORME_ROOT = os.path.expanduser('~/.bormes')
 BORME_PDF_ROOT = os.path.join(BORME_ROOT, 'pdf')
 BORME_XML_ROOT = os.path.join(BORME_ROOT, 'xml')
 BORME_JSON_ROOT = os.path.join(BORME_ROOT, 'json')
+BORME_CACHE_ROOT = os.path.join(BORME_ROOT, 'cache')
 
 BORME_LOG_ROOT = os.path.join(BASE_DIR, '..', 'log')
 
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 import os
+import shutil
 import sys
+import tempfile
 
 import django
 
@@ -74,12 +76,16 @@ DEFAULT_SETTINGS = dict(
 
     STATIC_URL='/static/',
     CARGOS_LIMIT=20,
+    CALENDAR_CHECK_INTERVAL=0,
+    ELASTICSEARCH_BULK_CHUNK_SIZE=500,
 )
 
 
 def runtests(*test_args):
+    # Caché de BORME-JSON de los BORME-PDF analizados en los tests
+    cache_root = tempfile.mkdtemp(prefix='libreborme-cache-')
     if not settings.configured:
-        settings.configure(**DEFAULT_SETTINGS)
+        settings.configure(BORME_CACHE_ROOT=cache_root, **DEFAULT_SETTINGS)
 
     django.setup()
 
@@ -97,9 +103,12 @@ def runtests(*test_args):
         if not test_args:
             test_args = ["tests"]
 
-    failures = runner_class(verbosity=1,
-                            interactive=True,
-                            failfast=False).run_tests(test_args)
+    try:
+        failures = runner_class(verbosity=1,
+                                interactive=True,
+                                failfast=False).run_tests(test_args)
+    finally:
+        shutil.rmtree(cache_root, ignore_errors=True)
     sys.exit(failures)
 
 